@@ -13,6 +13,7 @@ let CONSTRUCTORS = [];  // Fetched from API
 let LEAGUES_DB = {};  // Fetched from API when needed
 let GRANDPRIX = [];  // Fetched from API
 let GRANDPRIXANDALL = [];
+const GENERAL_RANK_ID = 50;  // "GP" della classifica generale di stagione (GENERAL_RANK_GP_ID nel servizio)
 
 // ────────────────────────────────────────────────────────────────────────
 // STATE
@@ -26,25 +27,93 @@ let selectedGP = null;  // Currently selected Grand Prix
 let teamCanEdit = true;  // Whether team can be edited based on lock_date
 let selectedLeagueGP = null;  // Selected GP for league view
 let USER_TOKEN = null; // For authenticated requests, if needed
+let bootstrapTeam = null;  // Team for the current GP returned by /bootstrap at login
 
 const BUDGET = 100;
 let myLeagues = [];
 let activeLeague = null;
+let leagueResults = [];  // Results currently shown in the league view (pages loaded so far)
+let leagueResultsNext = null;  // Offset of the next results page, null when everything is loaded
+let leagueResultsRequest = 0;  // Incremented on every reload: late pages of a previous GP/league are dropped
+let leagueResultsLeagueId = null;
+let loadingMoreResults = false;
+
+const LB_PAGE_SIZE = 100;  // Results per page, loaded lazily while scrolling
+const LB_ROW_HEIGHT = 53;  // Estimated row height (px) until the first rendered row is measured
+const LB_OVERSCAN = 8;  // Rows rendered above and below the visible window
+const LB_RELOAD_JITTER_MS = 10000;  // Live updates that cross the loaded pages refetch within this delay
+const lbView = {rows: new Map(), rowHeight: LB_ROW_HEIGHT, measured: false, frame: 0, bound: false};
 //const API_BASE = 'http://localhost:5000/api'; // DEBUG
 const API_BASE = 'https://fantasyf1-sqrp.onrender.com/api'; // PROD
+let RESULTS_REVISION = null;  // Changes on every scoring run: cached past-GP results are valid until then
 
 
 // ────────────────────────────────────────────────────────────────────────
-// INITIALIZATION
+// CLIENT CACHE (IndexedDB, localStorage fallback)
 // ────────────────────────────────────────────────────────────────────────
 
-async function initApp() {  
-  try {
-    fetch(API_BASE + '/health')
-  } catch (e) {
-    showToast('Cannot reach the server', false);
+const CLIENT_CACHE_VERSION = 1;  // Bump when the shape of cached payloads changes: old entries are dropped
+
+const clientCache = (() => {
+  const PREFIX = 'ff1:v' + CLIENT_CACHE_VERSION + ':';
+  const dbPromise = new Promise(resolve => {
+    if (!window.indexedDB) return resolve(null);
+    try {
+      const req = indexedDB.open('fantasyf1', CLIENT_CACHE_VERSION);
+      req.onupgradeneeded = () => {
+        const db = req.result;
+        if (db.objectStoreNames.contains('cache')) db.deleteObjectStore('cache');
+        db.createObjectStore('cache');
+      };
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => resolve(null);  // e.g. private browsing: fall back to localStorage
+    } catch(e) {
+      resolve(null);
+    }
+  });
+
+  function request(db, mode, action) {
+    return new Promise(resolve => {
+      try {
+        const req = action(db.transaction('cache', mode).objectStore('cache'));
+        req.onsuccess = () => resolve(req.result === undefined ? null : req.result);
+        req.onerror = () => resolve(null);
+      } catch(e) {
+        resolve(null);
+      }
+    });
+  }
+
+  async function get(key) {
+    const db = await dbPromise;
+    if (db) return request(db, 'readonly', store => store.get(key));
+    try {
+      const raw = localStorage.getItem(PREFIX + key);
+      return raw ? JSON.parse(raw) : null;
+    } catch(e) {
+      return null;
+    }
+  }
+
+  async function set(key, value) {
+    const db = await dbPromise;
+    if (db) return request(db, 'readwrite', store => store.put(value, key));
+    try {
+      localStorage.setItem(PREFIX + key, JSON.stringify(value));
+    } catch(e) {
+      console.warn('Client cache full, skipping', key);
+    }
   }
 
+  return {get, set};
+})();
+
+
+// ────────────────────────────────────────────────────────────────────────
+// INITIALIZATION
+// ────────────────────────────────────────────────────────────────────────
+
+async function initApp() {  
   if (ongoingMaintenance) {
     console.log('App is in maintenance mode - showing banner and disabling interactions');
     $('top-banner').className = 'top-banner.visible';
@@ -54,42 +123,78 @@ async function initApp() {
     showToast('Server is not responding. It might take more time, please restart the app', true);
     }, 5000);
 
-  try {
-    const [driversResp, constrsResp, leaguesResp, gpsResp] = await Promise.all([
-      fetch(API_BASE + '/drivers', { cache: 'no-store' }),
-      fetch(API_BASE + '/constructors', { cache: 'no-store' }),
-      fetch(API_BASE + '/leagues'),
-      fetch(API_BASE + '/grandprix')
-    ]);
-
+  // Render instantly from the previous visit, then revalidate in the background
+  const cached = await clientCache.get('bootstrap');
+  if (cached) {
     clearTimeout(loadingTimer);
-    
-    DRIVERS = await driversResp.json();
-    CONSTRUCTORS = await constrsResp.json();
-    const leagues = await leaguesResp.json();
-    GRANDPRIX = await gpsResp.json();
-    GRANDPRIXANDALL =  [...GRANDPRIX]
-    const allGps = {
-      name: "General Rank",
-      id: 50,
-      };
-    GRANDPRIXANDALL.push(allGps)
+    applyBootstrap(cached);
+  }
+  const revalidation = revalidateBootstrap(cached)
+    .then(() => clearTimeout(loadingTimer))
+    .catch(e => {
+      clearTimeout(loadingTimer);
+      console.error('Failed to load reference data:', e);
+      if (!cached) showToast('Error loading data', false);
+    });
+  if (!cached) await revalidation;
+}
+
+async function revalidateBootstrap(cached) {
+  // One round trip for reference data, leagues and calendar; with a revision token
+  // the server skips the reference data when it did not change
+  const query = cached && cached.revision ? '?revision=' + encodeURIComponent(cached.revision) : '';
+  const resp = await fetch(API_BASE + '/bootstrap' + query, { cache: 'no-store' });
+  const fresh = await resp.json();
+
+  let bootstrap = fresh;
+  if (fresh.unchanged && cached) {
+    // Same reference data: keep the cached copy, take calendar and live ownership
+    const withOwnership = (entities, ownership, key) =>
+      entities.map(e => Object.assign({}, e, {ownership: ownership[e[key]] || 0}));
+    bootstrap = Object.assign({}, cached, {
+      grandprix: fresh.grandprix,
+      results_revision: fresh.results_revision,
+      drivers: withOwnership(cached.drivers, fresh.ownership.drivers, 'number'),
+      constructors: withOwnership(cached.constructors, fresh.ownership.constructors, 'id')
+    });
+  }
+  clientCache.set('bootstrap', bootstrap);
+  applyBootstrap(bootstrap);
+  if (cached) refreshVisibleScreen();
+}
+
+function applyBootstrap(bootstrap) {
+  DRIVERS = bootstrap.drivers;
+  CONSTRUCTORS = bootstrap.constructors;
+  const leagues = bootstrap.leagues;
+  GRANDPRIX = bootstrap.grandprix;
+  RESULTS_REVISION = bootstrap.results_revision;
+  GRANDPRIXANDALL =  [...GRANDPRIX]
+  const allGps = {
+    name: "General Rank",
+    id: GENERAL_RANK_ID,
+    };
+  GRANDPRIXANDALL.push(allGps)
+
   
-    
-    console.log('DRIVERS:', DRIVERS.length);
-    console.log('CONSTRUCTORS:', CONSTRUCTORS.length);
-    console.log('GRANDPRIX:', GRANDPRIX.length);
-    console.log('all:', GRANDPRIXANDALL.length);
+  console.log('DRIVERS:', DRIVERS.length);
+  console.log('CONSTRUCTORS:', CONSTRUCTORS.length);
+  console.log('GRANDPRIX:', GRANDPRIX.length);
+  console.log('all:', GRANDPRIXANDALL.length);
 
-    leagues.forEach(l => { LEAGUES_DB[l.code] = l; });
-    
-    // Set current GP (the one with status='current', or first future one)
-    selectedGP = GRANDPRIX.find(gp => gp.status === 'current') || GRANDPRIX.find(gp => gp.status === 'future');
-    console.log('Selected GP:', selectedGP, " ", selectedGP.status);
-  } catch(e) {
-    clearTimeout(loadingTimer);
-    console.error('Failed to load reference data:', e);
-    showToast('Error loading data', false);
+  LEAGUES_DB = {};
+  leagues.forEach(l => { LEAGUES_DB[l.code] = l; });
+  
+  // Keep the selected GP across revalidations, otherwise the current one (status='current', or first future one)
+  selectedGP = (selectedGP && GRANDPRIX.find(gp => gp.id === selectedGP.id))
+    || GRANDPRIX.find(gp => gp.status === 'current') || GRANDPRIX.find(gp => gp.status === 'future');
+  console.log('Selected GP:', selectedGP, " ", selectedGP && selectedGP.status);
+}
+
+function refreshVisibleScreen() {
+  if (currentUser && selectedGP && $('screen-team').classList.contains('active')) {
+    renderDriverGrid();
+    renderConstrGrid();
   }
 }
 
@@ -100,6 +205,84 @@ if (document.readyState === 'loading') {
   initApp();
 }
 
+// ────────────────────────────────────────────────────────────────────────
+// LIVE EVENTS (SSE)
+// ────────────────────────────────────────────────────────────────────────
+
+let eventSource = null;
+let lastEventId = null;  // A new EventSource does not send Last-Event-ID: passed as ?last_event_id=
+
+function connectEvents() {
+  // Only logged-in users with the tab visible: every open stream holds a server connection
+  if (!window.EventSource || eventSource || !currentUser || document.hidden) return;
+  // EventSource reconnects by itself and resumes from Last-Event-ID
+  eventSource = new EventSource(API_BASE + '/events' + (lastEventId ? '?last_event_id=' + encodeURIComponent(lastEventId) : ''));
+  const listen = (name, handler) => eventSource.addEventListener(name, e => {
+    lastEventId = e.lastEventId || lastEventId;
+    handler(JSON.parse(e.data));
+  });
+  listen('gp_scored', applyGPScored);
+  listen('prices_updated', applyPricesUpdated);
+}
+
+function disconnectEvents() {
+  if (!eventSource) return;
+  eventSource.close();
+  eventSource = null;
+}
+
+document.addEventListener('visibilitychange', () => document.hidden ? disconnectEvents() : connectEvents());
+
+function applyGPScored(event) {
+  showToast('Grand Prix of ' + event.name + ' scored!', true);
+  RESULTS_REVISION = null;  // Cached results are stale: no cache until the next revalidation
+  if (!selectedLeagueGP || !leagueResults.length) return;
+  if (selectedLeagueGP.id !== event.gp_id && selectedLeagueGP.id != GENERAL_RANK_ID) return;
+  // Too many changes for the event: refetch, spread over a few seconds
+  if (!event.leagues) return scheduleLeagueReload();
+
+  // leagues: {league_id: [[user_id, GP points, change]]}, only the members whose points changed
+  const general = selectedLeagueGP.id == GENERAL_RANK_ID;
+  const boundary = leagueResults[leagueResults.length - 1].points;
+  const loaded = {};
+  leagueResults.forEach(r => { loaded[r.user_id] = r; });
+  let crossed = false;
+  (event.leagues[leagueResultsLeagueId] || []).forEach(([userId, points, change]) => {
+    const row = loaded[userId];
+    if (row) {
+      row.points = general ? row.points + change : points;
+    } else {
+      // An unloaded member (at most `boundary` points before) may climb into the loaded pages
+      crossed = crossed || (general ? boundary + change : points) > boundary;
+    }
+  });
+  // A loaded member falling below the boundary may belong to a page not loaded yet
+  crossed = crossed || leagueResults.some(r => r.points < boundary);
+
+  leagueResults.sort((a, b) => b.points - a.points);
+  renderLeagueResults();
+  if (crossed && leagueResultsNext !== null) scheduleLeagueReload();
+}
+
+let leagueReloadTimer = null;
+function scheduleLeagueReload() {
+  // Random delay: the viewers of a scored GP do not all refetch at the same moment
+  clearTimeout(leagueReloadTimer);
+  leagueReloadTimer = setTimeout(reloadLeagueResults, Math.random() * LB_RELOAD_JITTER_MS);
+}
+
+function applyPricesUpdated(event) {
+  const addPrice = (entity, price) => {
+    if (price === undefined) return;
+    entity.price_history = (entity.price_history || []).filter(ph => ph.gp_id !== event.gp_id);
+    entity.price_history.unshift({gp_id: event.gp_id, price: price});
+  };
+  DRIVERS.forEach(d => addPrice(d, event.drivers[d.number]));
+  CONSTRUCTORS.forEach(c => addPrice(c, event.constructors[c.id]));
+
+  refreshVisibleScreen();
+}
+
 // ────────────────────────────────────────────────────────────────────────
 // UTILITY FUNCTIONS
 // ────────────────────────────────────────────────────────────────────────
@@ -232,6 +415,7 @@ function verifyOTP() {
 
 async function setUser(u) {
   currentUser = u;
+  connectEvents();
   $('nav-username').textContent = u.username;
   $('nav').style.display = 'flex';
   
@@ -243,12 +427,13 @@ async function setUser(u) {
     adminTab.style.display = 'none';
   }
   
-  // Fetch user's leagues
+  // Fetch user's leagues and current team in one request
   try {
-    const resp = await fetch(API_BASE + '/leagues/user/' + u.id);
-    myLeagues = await resp.json();
-    myLeagues = myLeagues.map(l => l.code);  // Extract codes
+    const resp = await fetch(API_BASE + '/bootstrap?reference=0&user_id=' + u.id);
+    const userData = (await resp.json()).user;
+    myLeagues = userData.leagues.map(l => l.code);  // Extract codes
     activeLeague = myLeagues[0] || null;
+    bootstrapTeam = userData.team;
   } catch(e) {
     console.error('Error fetching user leagues:', e);
     myLeagues = [];
@@ -261,6 +446,8 @@ async function setUser(u) {
 
 function logout() {
   currentUser = null;
+  disconnectEvents();
+  bootstrapTeam = null;
   selDrivers = [];
   selConstrs = [];
   myLeagues = [];
@@ -306,8 +493,15 @@ async function loadTeamForGP() {
   
   try {
     console.log('loadTeamForGP - loading team for user:', currentUser.id, 'GP:', selectedGP.id);
-    const resp = await fetch(API_BASE + `/team/${currentUser.id}/${selectedGP.id}`);
-    const team = await resp.json();
+    let team;
+    if (bootstrapTeam && bootstrapTeam.gp_id === selectedGP.id) {
+      // Already loaded by /bootstrap at login
+      team = bootstrapTeam;
+    } else {
+      const resp = await fetch(API_BASE + `/team/${currentUser.id}/${selectedGP.id}`);
+      team = await resp.json();
+    }
+    bootstrapTeam = null;
     
     // lock on a team level (if lock date is passed)
     console.log('Team data received:', team.drivers.length, team.constructors.length, 'can_edit:', team.can_edit);
@@ -502,6 +696,7 @@ function joinLeague() {
     if(data.error) { showToast(data.error); return; }
     myLeagues.push(code);
     activeLeague = code;
+    LEAGUES_DB[code] = data.league;  // New members count: the league's cached results are keyed on it
     $('inp-code').value = '';
     showToast('Entrato in "' + data.league.name + '"!', true);
     renderLeagues();
@@ -530,7 +725,7 @@ function renderLeagues() {
   $('gp-selector-league').innerHTML = GRANDPRIXANDALL.map(gp => {
     const isSelected = selectedLeagueGP && gp.id === selectedLeagueGP.id;
     return `<option value="${gp.id}" ${isSelected ? 'selected' : ''}>
-      ${gp.id == 50 ? "General Rank" : "Grand Prix of " + gp.name}
+      ${gp.id == GENERAL_RANK_ID ? "General Rank" : "Grand Prix of " + gp.name}
     </option>`;
   }).join('');
 
@@ -543,40 +738,192 @@ async function loadLeagueGPResults() {
   
   try {
     // Get league ID from code
-    const leagueResp = await fetch(API_BASE + '/leagues/' + activeLeague);
-    const leagueData = await leagueResp.json();
+    const leagueData = LEAGUES_DB[activeLeague] || await (await fetch(API_BASE + '/leagues/' + activeLeague)).json();
     
-    const resultsResp = await fetch(API_BASE + '/league/' + leagueData.id + '/gp/' + selectedLeagueGP.id + '/results');
-    const resultsData = await resultsResp.json();
+    const request = ++leagueResultsRequest;
+    const resultsData = await fetchLeagueGPResults(leagueData.id, selectedLeagueGP, 0);
+    if (request !== leagueResultsRequest) return;  // Another GP/league was selected meanwhile
     
     console.log('League GP results:', resultsData);
     
     // Render results
-    const results = resultsData.results || [];
-    $('lb-round').textContent = selectedLeagueGP.id == 50 ? 'General Rank' : 'Grand Prix of ' + resultsData.gp.name;
-    
-    if (results.length === 0) {
-      $('lb-body').innerHTML = '<tr><td colspan="4" style="text-align:center;padding:20px">No results yet for this GP</td></tr>';
-      return;
-    }
-    
-    $('lb-body').innerHTML = results.map((r, idx) => 
-    {
-      return `<tr style="cursor:pointer" onclick="showLeagueUserTeam(${r.user_id})">
-        <td><span class="lb-pos${idx <= 2 ? ' gold' : ''}">${idx + 1}</span></td>
-        <td><div class="lb-name">${r.team}</div></td>
-        <td><span class="lb-pts">${r.points} pts</span></td>
-        <td>👁</td>
-      </tr>`;
-    })
-    .join('');
+    leagueResultsLeagueId = leagueData.id;
+    leagueResults = resultsData.results || [];
+    leagueResultsNext = resultsData.next_offset ?? null;
+    $('lb-round').textContent = selectedLeagueGP.id == GENERAL_RANK_ID ? 'General Rank' : 'Grand Prix of ' + resultsData.gp.name;
+    $('lb-scroll').scrollTop = 0;
+    renderLeagueResults();
     console.log('Leaderboard rendered for league:', activeLeague, 'GP:', selectedLeagueGP.name);
   } catch(e) {
     console.error('Error loading league GP results:', e);
+    lbView.rows.clear();
     $('lb-body').innerHTML = '<tr><td colspan="4">Errore nel caricamento</td></tr>';
   }
 }
 
+async function loadMoreLeagueResults() {
+  if (loadingMoreResults || leagueResultsNext === null) return;
+  loadingMoreResults = true;
+  const request = leagueResultsRequest;
+  try {
+    const page = await fetchLeagueGPResults(leagueResultsLeagueId, selectedLeagueGP, leagueResultsNext);
+    if (request !== leagueResultsRequest) return;
+    leagueResults = leagueResults.concat(page.results || []);
+    leagueResultsNext = page.next_offset ?? null;
+    renderLeagueResults();
+  } catch(e) {
+    console.error('Error loading more league results:', e);
+  } finally {
+    loadingMoreResults = false;
+  }
+}
+
+async function reloadLeagueResults() {
+  // Refetch the pages loaded so far, keeping the scroll position
+  const request = ++leagueResultsRequest;
+  const loaded = leagueResults.length;
+  let results = [];
+  let next = 0;
+  try {
+    while (next !== null && results.length < loaded) {
+      const page = await fetchLeagueGPResults(leagueResultsLeagueId, selectedLeagueGP, next);
+      if (request !== leagueResultsRequest) return;
+      results = results.concat(page.results || []);
+      next = page.next_offset ?? null;
+    }
+  } catch(e) {
+    console.error('Error reloading league results:', e);
+    return;
+  }
+  leagueResults = results;
+  leagueResultsNext = next;
+  renderLeagueResults();
+}
+
+async function fetchLeagueGPResults(leagueId, gp, offset) {
+  // Past GPs only change when the server scores again (RESULTS_REVISION) or the league gets new members
+  const league = Object.values(LEAGUES_DB).find(l => l.id === leagueId);
+  const key = 'results:' + leagueId + ':' + (league ? league.members : 0) + ':' + gp.id + ':' + offset;
+  const cacheable = gp.status === 'past' && RESULTS_REVISION;
+  if (cacheable) {
+    const cached = await clientCache.get(key);
+    if (cached && cached.revision === RESULTS_REVISION) return cached.data;
+  }
+  const resp = await fetch(API_BASE + '/league/' + leagueId + '/gp/' + gp.id + '/results?offset=' + offset + '&limit=' + LB_PAGE_SIZE);
+  const data = await resp.json();
+  if (cacheable && resp.ok) clientCache.set(key, {revision: RESULTS_REVISION, data: data});
+  return data;
+}
+
+// Windowed rendering: only the rows in view (plus LB_OVERSCAN) exist in the DOM,
+// two spacer rows keep the scrollbar at the height of the whole list.
+// Rows are reused by position and patched only when their content changes.
+function renderLeagueResults() {
+  const body = $('lb-body');
+  if (!lbView.bound) {
+    lbView.bound = true;
+    $('lb-scroll').addEventListener('scroll', scheduleLeagueWindow, {passive: true});
+    window.addEventListener('resize', scheduleLeagueWindow);
+    body.addEventListener('click', e => {
+      const tr = e.target.closest('tr[data-user-id]');
+      if (tr) showLeagueUserTeam(parseInt(tr.dataset.userId));
+    });
+  }
+
+  if (leagueResults.length === 0) {
+    lbView.rows.clear();
+    body.innerHTML = '<tr><td colspan="4" style="text-align:center;padding:20px">No results yet for this GP</td></tr>';
+    return;
+  }
+  if (!body.querySelector('.lb-spacer')) {
+    lbView.rows.clear();
+    body.innerHTML = '<tr class="lb-spacer"><td colspan="4"></td></tr><tr class="lb-spacer"><td colspan="4"></td></tr>';
+  }
+  renderLeagueWindow();
+}
+
+function scheduleLeagueWindow() {
+  if (lbView.frame || !lbView.rows.size) return;
+  lbView.frame = requestAnimationFrame(() => {
+    lbView.frame = 0;
+    renderLeagueWindow();
+  });
+}
+
+function renderLeagueWindow() {
+  const scroller = $('lb-scroll');
+  const body = $('lb-body');
+  const topSpacer = body.firstElementChild;
+  const bottomSpacer = body.lastElementChild;
+  if (!topSpacer || !topSpacer.classList.contains('lb-spacer')) return;
+
+  const total = leagueResults.length;
+  const rowHeight = lbView.rowHeight;
+  const headerHeight = body.previousElementSibling ? body.previousElementSibling.offsetHeight : 0;
+  const viewTop = Math.max(0, scroller.scrollTop - headerHeight);
+  const first = Math.max(0, Math.floor(viewTop / rowHeight) - LB_OVERSCAN);
+  const last = Math.min(total - 1, Math.ceil((viewTop + scroller.clientHeight) / rowHeight) + LB_OVERSCAN);
+
+  // Drop rows that left the window
+  lbView.rows.forEach((tr, index) => {
+    if (index < first || index > last) {
+      tr.remove();
+      lbView.rows.delete(index);
+    }
+  });
+
+  // Create the missing rows in order and patch the existing ones
+  let anchor = topSpacer;
+  for (let index = first; index <= last; index++) {
+    let tr = lbView.rows.get(index);
+    if (!tr) {
+      tr = createLeagueRow();
+      lbView.rows.set(index, tr);
+      anchor.after(tr);
+    }
+    patchLeagueRow(tr, index, leagueResults[index]);
+    anchor = tr;
+  }
+
+  topSpacer.firstElementChild.style.height = (first * rowHeight) + 'px';
+  bottomSpacer.firstElementChild.style.height = (Math.max(0, total - 1 - last) * rowHeight) + 'px';
+
+  if (!lbView.measured && lbView.rows.size) {
+    const measured = lbView.rows.get(first).getBoundingClientRect().height;
+    if (measured) {
+      lbView.measured = true;
+      if (Math.abs(measured - rowHeight) > 0.5) {
+        lbView.rowHeight = measured;
+        scheduleLeagueWindow();
+      }
+    }
+  }
+
+  // Next page when the window gets close to the end of the loaded rows
+  if (leagueResultsNext !== null && last >= total - 1 - LB_OVERSCAN) loadMoreLeagueResults();
+}
+
+function createLeagueRow() {
+  const tr = document.createElement('tr');
+  tr.style.cursor = 'pointer';
+  tr.innerHTML = '<td><span class="lb-pos"></span></td><td><div class="lb-name"></div></td><td><span class="lb-pts"></span></td><td>👁</td>';
+  tr._cells = [tr.querySelector('.lb-pos'), tr.querySelector('.lb-name'), tr.querySelector('.lb-pts')];
+  return tr;
+}
+
+function patchLeagueRow(tr, index, r) {
+  const key = index + '|' + r.user_id + '|' + r.team + '|' + r.points;
+  if (tr._key === key) return;
+  tr._key = key;
+  const [pos, name, pts] = tr._cells;
+  tr.dataset.userId = r.user_id;
+  tr.classList.toggle('me-row', !!currentUser && r.user_id === currentUser.id);
+  pos.textContent = index + 1;
+  pos.className = 'lb-pos' + (index <= 2 ? ' gold' : '');
+  name.textContent = r.team;
+  pts.textContent = r.points + ' pts';
+}
+
 function changeLeagueGP(gpId) {
   const newGP = GRANDPRIXANDALL.find(gp => gp.id === parseInt(gpId));
   if (newGP) {
@@ -1,31 +1,51 @@
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from collections import Counter
 import random
 import smtplib
 import traceback
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from mailersend import EmailBuilder, MailerSendClient
 import requests
 from sqlalchemy import text
 from scheduling.pricing_job import update_pricing
-from scheduling.scoring_job import run_scoring_job
+from scheduling.scoring_job import rescore_amended_results, rescore_season, run_scoring_job
+from scheduling import scoring_rules
+from scheduling.archive_job import run_archive_job
 import migration
-from models import ConstructorPrices, DriverPrices, db, User, Team, League, LeagueMembership, GrandPrix, TeamResult, GameState, Driver, Constructor
+from models import GENERAL_RANK_GP_ID, insert_on_conflict, ScoringRules, ConstructorPrices, DriverPrices, db, User, Team, League, LeagueMembership, LeagueStanding, GrandPrix, TeamResult, GameState, Driver, Constructor
 from datetime import datetime, timedelta
 from auth import generate_token
 from dotenv import load_dotenv
 import os
 from factory import create_app
+import cache
+import events
+import leaderboard
+import league_export
+import optimizer
+import projection
+import season_archive
+import season_summary
+import serializers
+import standings
+import team_picks
 
 load_dotenv('secrets.env')
 app = create_app()
 CORS(app)
 
-# Create database tables
+GRANDPRIX_CACHE_TTL = 60  # secondi
+LEAGUES_CACHE_TTL = 60  # secondi: members_count delle iscrizioni, senza invalidare a ogni join
+# Gruppi della cache dietro il token di revisione dei dati di riferimento del client
+REFERENCE_GROUPS = ('drivers', 'constructors', 'leagues')
+
+# Schema e dati di riferimento
 with app.app_context():
-    db.create_all()
+    migration.run_migrations(db)  # Solo le migrazioni non ancora applicate (schema_migrations)
+    migration.load_reference_data(db)  # Leghe, piloti, scuderie e calendario da reference_data.json
     
     # Seed demo user if doesn't exist
     if not User.query.filter_by(email='demo@f1.com').first():
@@ -47,7 +67,7 @@ with app.app_context():
         db.session.add(game_state)
         db.session.commit()
     
-    migration.initialize_f1_data(db)  # Seed leagues, GPs, drivers, constructors
+    scoring_rules.ensure_default_rules()  # Tabella punti v1 di ogni stagione
 
 # ============ AUTH ENDPOINTS ============
 
@@ -66,7 +86,7 @@ def login():
     
     return jsonify({
         'success': True,
-        'user': user.to_dict(),
+        'user': serializers.user(user),
         'token': generate_token(user.id)
     }), 200
 
@@ -99,7 +119,7 @@ def register():
     
     return jsonify({
         'success': True,
-        'user': user.to_dict(),
+        'user': serializers.user(user),
     }), 201
 
 @app.route('/api/auth/verifyCode', methods=['POST'])
@@ -121,7 +141,7 @@ def verify_otp():
     
     return jsonify({
         'success': True,
-        'user': user.to_dict()
+        'user': serializers.user(user)
     }), 200
 
 def send_login_email(to_email, username, code):
@@ -153,52 +173,48 @@ def send_login_email(to_email, username, code):
 
 @app.route('/api/grandprix', methods=['GET'])
 def get_grandprix():
-    gps = GrandPrix.query.order_by(GrandPrix.round_num).all()
-    current_gp = find_always_current_gp(gps)
-    return jsonify([gp.to_dict(current_gp) for gp in gps]), 200
-
-def find_always_current_gp(gps):
-    """Funzione di utilità per forzare almeno un GP a essere sempre current"""
-    currentGp = [gp for gp in gps if gp.get_status() == 'current']
-    if not currentGp:
-        first_future_gp = next((gp for gp in gps if gp.get_status() == 'future'), None)
-        if first_future_gp:
-            return first_future_gp.id
-    return None    
+    return jsonify(get_cached_grandprix()), 200
+
+def get_cached_grandprix():
+    # Lo status dipende dall'orologio: TTL breve oltre all'invalidazione esplicita
+    return cache.get_or_compute(('grandprix',), build_grandprix_payload, ttl=GRANDPRIX_CACHE_TTL)
+
+def build_grandprix_payload():
+    # Il primo GP futuro è forzato a current se nessuno lo è
+    return serializers.calendar()
 
 @app.route('/api/grandprix/<int:gp_id>', methods=['GET'])
 def get_gp_detail(gp_id):
-    gp = GrandPrix.query.get(gp_id)
+    gp = serializers.grand_prix_detail(gp_id)
     if not gp:
         return jsonify({'error': 'Grand Prix non trovato'}), 404
-    return jsonify(gp.to_dict()), 200
+    return jsonify(gp), 200
 
 # ============ TEAM ENDPOINTS ============
 
 @app.route('/api/team/<int:user_id>/<int:gp_id>', methods=['GET'])
 def get_team(user_id, gp_id):
-    team = Team.query.filter_by(user_id=user_id, gp_id=gp_id).first()
-    
-    gps = GrandPrix.query.order_by(GrandPrix.round_num).all()
-    current_gp_id = find_always_current_gp(gps)
-    gp = next((gp for gp in gps if gp.id == gp_id), None)
-    if not gp:
+    team = build_team_payload(user_id, gp_id, get_cached_grandprix())
+    if not team:
         return jsonify({'error': 'Grand Prix non trovato'}), 404
-    can_edit = True if current_gp_id == gp_id else gp.get_status() == 'current'
+    return jsonify(team), 200
 
+def build_team_payload(user_id, gp_id, gps):
+    """Team dell'utente per il GP, usando il calendario già serializzato per il lock"""
+    gp = next((gp for gp in gps if gp['id'] == gp_id), None)
+    if not gp:
+        return None
+    # Il GP forzato a current dal calendario ha già status 'current'
+    can_edit = gp['status'] == 'current'
+
+    team = db.session.query(*serializers.TEAM_COLUMNS).filter(
+        Team.season == gp['season'], Team.user_id == user_id, Team.gp_id == gp_id
+    ).first()
     if not team:
         # Return empty team if it doesn't exist yet
-        
-        return jsonify({
-            'id': None,
-            'gp_id': gp_id,
-            'drivers': [],
-            'constructors': [],
-            'can_edit': can_edit,
-            'created_at': None
-        }), 200
+        return serializers.empty_team(gp_id, can_edit)
     
-    return jsonify(team.to_dict(can_edit=can_edit)), 200
+    return serializers.team(team, can_edit)
 
 @app.route('/api/team/<int:user_id>/<int:gp_id>', methods=['POST'])
 def save_team(user_id, gp_id):
@@ -219,18 +235,25 @@ def save_team(user_id, gp_id):
         return jsonify({'error': 'You cannot modify teams for past GPs'}), 403
     
     # Check if team exists
-    team = Team.query.filter_by(user_id=user_id, gp_id=gp_id).first()
-    if not team:
+    team = Team.query.filter_by(season=gp.season, user_id=user_id, gp_id=gp_id).first()
+    new_team = team is None
+    old_picks = team_picks.picks_of(team.get_drivers(), team.get_constructors()) if team else Counter()
+    if new_team:
         team = Team(user_id=user_id, gp_id=gp_id)
         db.session.add(team)
+        db.session.flush()  # serve team.id per l'indice delle scelte
     
     team.set_drivers(drivers)
     team.set_constructors(constructors)
+    # Indice e contatori di possesso nella stessa transazione del team
+    team_picks.sync_team_picks(team, old_picks, team_picks.picks_of(drivers, constructors), new_team)
     db.session.commit()
+    # Revisione nel database: il riepilogo in cache è scartato da tutti i processi
+    cache.invalidate_scope('season_summary', user_id)
     
     return jsonify({
         'success': True,
-        'team': team.to_dict()
+        'team': serializers.team(team, serializers.can_edit(gp.lock_date, serializers.game_date()))
     }), 201
 
 @app.route('/api/user/<int:user_id>/teams', methods=['GET'])
@@ -239,16 +262,36 @@ def get_user_teams(user_id):
     if not user:
         return jsonify({'error': 'Utente non trovato'}), 404
     
-    teams = Team.query.filter_by(user_id=user_id).all()
-    return jsonify([team.to_dict() for team in teams]), 200
+    return jsonify(serializers.user_teams(user_id)), 200
+
+@app.route('/api/user/<int:user_id>/season', methods=['GET'])
+def get_user_season_summary(user_id):
+    """
+    Riepilogo di stagione: team, punti, budget speso e posizioni di lega per ogni GP.
+    Parametro: ?season= (default: stagione attiva). In cache fino al prossimo
+    salvataggio dell'utente, iscrizione a una sua lega o scoring.
+    """
+    if not User.query.get(user_id):
+        return jsonify({'error': 'Utente non trovato'}), 404
+
+    season = request.args.get('season', type=int) or find_active_season(get_cached_grandprix())
+    summary = cache.get_or_compute(
+        ('season_summary', user_id, season),
+        lambda: season_summary.build_season_summary(user_id, season),
+        version=(cache.scope_revision('season_summary', user_id), season_summary.cache_version(user_id))
+    )
+    return jsonify(summary), 200
 
 # ============ LEAGUE ENDPOINTS ============
 
 @app.route('/api/leagues', methods=['GET'])
 def get_leagues():
-    leagues = League.query.all()
-    print('Fetched leagues:', [l.to_dict() for l in leagues])
-    return jsonify([league.to_dict() for league in leagues]), 200
+    leagues = cache.get_or_compute(('leagues',), build_leagues_payload, ttl=LEAGUES_CACHE_TTL)
+    print('Fetched leagues:', leagues)
+    return jsonify(leagues), 200
+
+def build_leagues_payload():
+    return serializers.all_leagues()
 
 @app.route('/api/leagues/<code>', methods=['GET'])
 def get_league(code):
@@ -256,7 +299,7 @@ def get_league(code):
     if not league:
         return jsonify({'error': 'Lega non trovata'}), 404
     
-    return jsonify(league.to_dict()), 200
+    return jsonify(serializers.league(league)), 200
 
 @app.route('/api/leagues/join/<int:user_id>/<code>', methods=['POST'])
 def join_league(user_id, code):
@@ -268,34 +311,40 @@ def join_league(user_id, code):
     if not league:
         return jsonify({'error': 'Codice lega non valido'}), 404
     
-    # Check if already member
-    existing = LeagueMembership.query.filter_by(
-        user_id=user_id,
-        league_id=league.id
-    ).first()
-    if existing:
+    # Insert condizionale sul vincolo unico (user_id, league_id): niente SELECT preventiva
+    inserted = db.session.execute(
+        insert_on_conflict(LeagueMembership).values(
+            user_id=user_id,
+            league_id=league.id,
+            team_name=f'{user.username}\'s Team'
+        ).on_conflict_do_nothing(index_elements=['user_id', 'league_id'])
+    ).rowcount
+    if not inserted:
+        db.session.rollback()
         return jsonify({'error': 'Sei gia in questa lega'}), 400
     
-    # Add membership
-    membership = LeagueMembership(
-        user_id=user_id,
-        league_id=league.id,
-        team_name=f'{user.username}\'s Team'
+    # Incremento atomico lato DB: nessun read-modify-write in Python
+    League.query.filter_by(id=league.id).update(
+        {League.members_count: League.members_count + 1},
+        synchronize_session=False
     )
-    league.members_count += 1
-    db.session.add(membership)
+    # Classifica di ogni stagione: contano tutti i GP dell'utente, anche quelli prima dell'iscrizione
+    standings.ensure_standings(user_ids=[user_id])
     db.session.commit()
+    db.session.refresh(league)
+    # Nessuna invalidazione globale: proiezione e riepiloghi sono versionati con members_count della lega
     
     return jsonify({
         'success': True,
-        'league': league.to_dict()
+        'league': serializers.league(league)
     }), 201
 
 @app.route('/api/leagues/user/<int:user_id>', methods=['GET'])
 def get_user_leagues(user_id):
-    memberships = LeagueMembership.query.filter_by(user_id=user_id).all()
-    leagues = [membership.league.to_dict() for membership in memberships]
-    return jsonify(leagues), 200
+    return jsonify(build_user_leagues_payload(user_id)), 200
+
+def build_user_leagues_payload(user_id):
+    return serializers.user_leagues(user_id)
 
 @app.route('/api/leaderboard/<int:league_id>', methods=['GET'])
 def get_leaderboard(league_id):
@@ -303,14 +352,58 @@ def get_leaderboard(league_id):
     if not league:
         return jsonify({'error': 'Lega non trovata'}), 404
     
-    memberships = LeagueMembership.query.filter_by(league_id=league_id).all()
-    leaderboard = [membership.to_dict() for membership in memberships]
+    limit = max(1, min(request.args.get('limit', leaderboard.DEFAULT_PAGE_SIZE, type=int), leaderboard.MAX_PAGE_SIZE))
+    season = request.args.get('season', type=int) or find_active_season(get_cached_grandprix())
+    me_user_id = request.args.get('user_id', type=int)
+    around_user_id = request.args.get('around', type=int)
+    cursor = request.args.get('cursor')
+
+    if around_user_id:
+        # Finestra di `limit` posizioni sopra e sotto l'utente
+        rows, next_cursor = leaderboard.get_around(league_id, season, around_user_id, window=limit)
+        if rows is None:
+            return jsonify({'error': 'Utente non presente nella lega'}), 404
+    else:
+        decoded_cursor = leaderboard.decode_cursor(cursor) if cursor else None
+        if cursor and not decoded_cursor:
+            return jsonify({'error': 'Cursore non valido'}), 400
+        rows, next_cursor = leaderboard.get_page(league_id, season, limit=limit, cursor=decoded_cursor, me_user_id=me_user_id)
     
     return jsonify({
-        'league': league.to_dict(),
-        'leaderboard': leaderboard
+        'league': serializers.league(league),
+        'season': season,
+        'leaderboard': rows,
+        'next_cursor': next_cursor
     }), 200
 
+@app.route('/api/leagues/<int:league_id>/projection', methods=['GET'])
+def get_league_projection(league_id):
+    """
+    Probabilità di vittoria e podio dei membri (simulazione Monte Carlo dei GP rimanenti).
+    Parametri: ?simulations=, ?model=form|uniform, ?dnf_rate=
+    In cache per lega fino al prossimo scoring o iscrizione (members_count).
+    """
+    league = League.query.get(league_id)
+    if not league:
+        return jsonify({'error': 'Lega non trovata'}), 404
+
+    simulations = request.args.get('simulations', projection.DEFAULT_SIMULATIONS, type=int)
+    model = request.args.get('model', 'form')
+    dnf_rate = request.args.get('dnf_rate', type=float)
+    if not 1 <= simulations <= projection.MAX_SIMULATIONS or model not in projection.MODELS \
+            or (dnf_rate is not None and not 0 <= dnf_rate < 1):
+        return jsonify({'error': 'Parametri non validi'}), 400
+
+    season = find_active_season(get_cached_grandprix())
+    result = cache.get_or_compute(
+        ('projection', league_id, season, simulations, model, dnf_rate),
+        lambda: projection.project_league(league_id, season, simulations, model, dnf_rate),
+        version=league.members_count
+    )
+    if not result:
+        return jsonify({'error': 'Nessun membro nella lega'}), 404
+    return jsonify(result), 200
+
 @app.route('/api/league/<int:league_id>/gp/<int:gp_id>/results', methods=['GET'])
 def get_gp_results(league_id, gp_id):
     league = League.query.get(league_id)
@@ -318,44 +411,92 @@ def get_gp_results(league_id, gp_id):
         return jsonify({'error': 'Lega non trovata'}), 404
     
     gp = GrandPrix.query.get(gp_id)
-    if not gp and gp_id != 50:  # id 50 is special case for overall results
+    if not gp and gp_id != GENERAL_RANK_GP_ID:  # classifica generale della stagione attiva
         return jsonify({'error': 'Grand Prix non trovato'}), 404
     
-    # Get all members of the league
-    memberships = LeagueMembership.query.filter_by(league_id=league_id).all()
-    member_ids = [m.user_id for m in memberships]
-
-    if gp_id == 50:
-        gp = GrandPrix(id=50, name='General Rank', round_num=50, date=datetime.utcnow(), circuit='Overall')
-        # gets all results
-        teamResults = TeamResult.query.filter(
-            TeamResult.user_id.in_(member_ids)
-        ).order_by(TeamResult.points.desc()).all()
-
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = request.args.get('limit', type=int)
+    if limit is not None and not 1 <= limit <= leaderboard.MAX_PAGE_SIZE:
+        return jsonify({'error': 'limit non valido'}), 400
+
+    if gp_id == GENERAL_RANK_GP_ID:
+        season = find_active_season(get_cached_grandprix())
+        gp = GrandPrix(id=GENERAL_RANK_GP_ID, name='General Rank', round_num=GENERAL_RANK_GP_ID, season=season,
+                       date=datetime.utcnow(), circuit='Overall')
+
+    # Una riga di league_standings per membro e stagione: stessi membri e stesso spareggio della leaderboard
+    members = (LeagueStanding.league_id == league_id, LeagueStanding.season == gp.season)
+    ranking = db.session.query(LeagueStanding.user_id, LeagueMembership.team_name).select_from(LeagueStanding).join(
+        LeagueMembership, LeagueMembership.id == LeagueStanding.membership_id
+    ).filter(*members)
+
+    if gp_id == GENERAL_RANK_GP_ID:
+        # Totali di stagione già in league_standings: la pagina è una range scan sul suo indice
+        points = LeagueStanding.points
     else:
-        # Get team results for this GP from league members
-        teamResults = TeamResult.query.filter(
-            TeamResult.gp_id == gp_id,
-            TeamResult.user_id.in_(member_ids)
-        ).order_by(TeamResult.points.desc()).all()
-
-
-    output = []
-    for member_id in member_ids:
-        d = dict()
-        d['user_id'] = member_id
-        d['points'] = sum((team.points for team in teamResults if team.user_id == member_id), 0)
-        d['team'] = next((m.team_name for m in memberships if m.user_id == member_id), None)
-        d['team_id'] = Team.query.filter_by(user_id=member_id, gp_id=gp_id).first().id if Team.query.filter_by(user_id=member_id, gp_id=gp_id).first() else None
-        output.append(d)
-
-    sorted_rank = sorted(output, key=lambda x: x['points'], reverse=True)
+        # Punti del GP dei membri (0 senza team), ordinati e paginati dal database
+        gp_points = db.session.query(
+            TeamResult.user_id, db.func.sum(TeamResult.points).label('points')
+        ).filter(
+            TeamResult.season == gp.season, TeamResult.gp_id == gp_id
+        ).group_by(TeamResult.user_id).subquery()
+        points = db.func.coalesce(gp_points.c.points, 0)
+        ranking = ranking.outerjoin(gp_points, gp_points.c.user_id == LeagueStanding.user_id)
+
+    ranking = ranking.add_columns(points).order_by(points.desc(), LeagueStanding.membership_id).offset(offset)
+    if limit:
+        ranking = ranking.limit(limit)
+    page = [{'user_id': user_id, 'points': pts or 0, 'team': team_name} for user_id, team_name, pts in ranking]
+    total = LeagueStanding.query.filter(*members).count()
+
+    # Team del GP solo per le righe della pagina
+    page_user_ids = [row['user_id'] for row in page]
+    team_ids = dict(db.session.query(Team.user_id, Team.id).filter(
+        Team.season == gp.season, Team.gp_id == gp_id, Team.user_id.in_(page_user_ids)
+    ).all()) if page_user_ids else {}
+    for row in page:
+        row['team_id'] = team_ids.get(row['user_id'])
+
+    next_offset = offset + len(page)
     return jsonify({
-        'league': league.to_dict(),
-        'gp': gp.to_dict(),
-        'results': sorted_rank
+        'league': serializers.league(league),
+        'gp': serializers.grand_prix([gp], serializers.game_date())[0],
+        'results': page,
+        'total': total,
+        'next_offset': next_offset if next_offset < total else None
     }), 200
 
+@app.route('/api/league/<int:league_id>/export', methods=['GET'])
+def export_league_results(league_id):
+    """
+    Risultati di stagione della lega, una riga per (membro, GP) con punti e posizione (solo admin).
+    Parametri: ?admin_id=, ?season= (default: stagione attiva), ?format=csv|jsonl.
+    Risposta in streaming dal cursore del database.
+    """
+    user_id = request.args.get('admin_id', type=int)
+    if not user_id:
+        return jsonify({'error': 'Admin ID richiesto'}), 400
+
+    admin = User.query.get(user_id)
+    if not admin or admin.role != 'Administrator':
+        return jsonify({'error': 'Solo admin può esportare i risultati'}), 403
+
+    league = League.query.get(league_id)
+    if not league:
+        return jsonify({'error': 'Lega non trovata'}), 404
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in league_export.FORMATS:
+        return jsonify({'error': 'format deve essere csv o jsonl'}), 400
+
+    season = request.args.get('season', type=int) or find_active_season(get_cached_grandprix())
+    print(f"📤 Export risultati lega {league.code} stagione {season} ({fmt})")
+    return Response(
+        stream_with_context(league_export.stream_league_results(league_id, season, fmt)),
+        mimetype=league_export.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename=league_{league.code}_{season}.{fmt}'}
+    )
+
 #@app.route('/api/teamresult/<int:team_id>/<int:gp_id>', methods=['POST']) #NOT PUBLIC
 def save_team_result(team_id, gp_id):
     data = request.get_json()
@@ -377,10 +518,11 @@ def save_team_result(team_id, gp_id):
     
     result.points = points
     db.session.commit()
+    cache.invalidate('results')
     
     return jsonify({
         'success': True,
-        'result': result.to_dict()
+        'result': serializers.team_result(result)
     }), 201
 
 # ============ JOB SCHEDULE ============
@@ -398,7 +540,7 @@ def get_weekend_points(weekend_id=None):
             'error': str(e),
             'stack': traceback.format_exc()
         }), 500
-    
+
     try:
         resultPricing = update_pricing(app, weekend_id)
     except Exception as e:
@@ -409,13 +551,21 @@ def get_weekend_points(weekend_id=None):
             'error': str(e),
             'stack': traceback.format_exc()
         }), 500
+
+    # L'archivio di stagione non è critico: un errore non invalida scoring e pricing
+    try:
+        resultArchive = run_archive_job(app)
+    except Exception as e:
+        print(traceback.format_exc(), flush=True)
+        resultArchive = f"❌ Export archivio fallito: {e}"
     
     return jsonify({
         'success': True,
         'weekend_id': weekend_id if weekend_id else 'current',
         'result': {
             'scoring': resultScoring,
-            'pricing': resultPricing
+            'pricing': resultPricing,
+            'archive': resultArchive
         }
     }), 200
 
@@ -423,74 +573,174 @@ def get_weekend_points(weekend_id=None):
 def get_current_weekend_points():
     return get_weekend_points(None)
 
+@app.route('/api/processWeekend/<int:weekend_id>/amend', methods=['GET'])
+def amend_weekend_points(weekend_id):
+    """Riscarica i risultati del weekend e aggiorna solo i team toccati dalle modifiche"""
+    try:
+        result = rescore_amended_results(app, weekend_id)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'job' : 'amend',
+            'weekend_id': weekend_id,
+            'error': str(e),
+            'stack': traceback.format_exc()
+        }), 500
+
+    return jsonify({
+        'success': True,
+        'weekend_id': weekend_id,
+        'result': {'scoring': result}
+    }), 200
+
 # ============ REFERENCE DATA ============
 
 @app.route('/api/drivers', methods=['GET'])
 def get_drivers():
-    drivers = Driver.query.all()
-    driver_prices_list = get_driver_prices()
-    list_of_drivers_dict = [driver.to_dict() for driver in drivers]
-
-    for driver_dict in list_of_drivers_dict:
-        driver_prices = driver_prices_list.get(driver_dict['number'])
-        driver_prices = sorted(driver_prices, key=lambda dp: dp.gp_id, reverse=True) if driver_prices else []
-        driver_dict['price_history'] = [dp.to_dict() for dp in driver_prices] if driver_prices else None
-        driver_dict['price'] = driver_dict['price']
-
-    return jsonify(list_of_drivers_dict), 200
+    """Piloti con storico prezzi; ?format=columnar: gp_ids condivisi e un array di prezzi per pilota"""
+    fmt = request.args.get('format')
+    if fmt not in (None, 'columnar'):
+        return jsonify({'error': 'format deve essere columnar'}), 400
+    if fmt:
+        payload = cache.get_or_compute(('drivers', 'columnar'), lambda: build_drivers_payload(columnar=True))
+        return jsonify(dict(payload, drivers=with_ownership(payload['drivers'], 'drivers', 'number'))), 200
+    drivers = cache.get_or_compute(('drivers',), build_drivers_payload)
+    return jsonify(with_ownership(drivers, 'drivers', 'number')), 200
+
+def build_drivers_payload(columnar=False):
+    return serializers.drivers(find_active_season(get_cached_grandprix()), columnar)
 
 @app.route('/api/constructors', methods=['GET'])
 def get_constructors():
-    constructors = Constructor.query.all()
-    constructor_price_list = get_constructor_prices()
-    list_of_constructors_dict = [constructor.to_dict() for constructor in constructors]
-
-    for constructor_dict in list_of_constructors_dict:
-        constructor_prices = constructor_price_list.get(constructor_dict['id'])
-        constructor_prices = sorted(constructor_prices, key=lambda cp: cp.gp_id, reverse=True) if constructor_prices else []
-        constructor_dict['price_history'] = [cp.to_dict() for cp in constructor_prices] if constructor_prices else None
-        constructor_dict['price'] = constructor_dict['price']
-    return jsonify(list_of_constructors_dict), 200
-
-def get_driver_prices():
-    driver_prices_dict = dict()
-    driver_prices = DriverPrices.query.order_by(DriverPrices.gp_id.desc()).all()
-
-    for driver_price in driver_prices:
-        if driver_price.driver_id not in driver_prices_dict:
-            driver_prices_dict[driver_price.driver_id] = []
-        
-        price_entry = PriceEntry()
-        price_entry.gp_id = driver_price.gp_id
-        price_entry.price = driver_price.price
-        driver_prices_dict[driver_price.driver_id].append(price_entry)
-
-    return driver_prices_dict
-
-def get_constructor_prices():
-    constructor_prices_dict = dict()
-    constructor_prices = ConstructorPrices.query.order_by(ConstructorPrices.gp_id.desc()).all()
-
-    for constructor_price in constructor_prices:
-        if constructor_price.constructor_id not in constructor_prices_dict:
-            constructor_prices_dict[constructor_price.constructor_id] = []
-
-        price_entry = PriceEntry()
-        price_entry.gp_id = constructor_price.gp_id
-        price_entry.price = constructor_price.price
-        constructor_prices_dict[constructor_price.constructor_id].append(price_entry)
-
-    return constructor_prices_dict
-
-class PriceEntry(object):
-    gp_id = 0
-    price = 0
-
-    def to_dict(self):
-        return {
-            'gp_id': self.gp_id,
-            'price': self.price
-        }
+    """Scuderie con storico prezzi; ?format=columnar come /api/drivers"""
+    fmt = request.args.get('format')
+    if fmt not in (None, 'columnar'):
+        return jsonify({'error': 'format deve essere columnar'}), 400
+    if fmt:
+        payload = cache.get_or_compute(('constructors', 'columnar'), lambda: build_constructors_payload(columnar=True))
+        return jsonify(dict(payload, constructors=with_ownership(payload['constructors'], 'constructors', 'id'))), 200
+    constructors = cache.get_or_compute(('constructors',), build_constructors_payload)
+    return jsonify(with_ownership(constructors, 'constructors', 'id')), 200
+
+def build_constructors_payload(columnar=False):
+    return serializers.constructors(find_active_season(get_cached_grandprix()), columnar)
+
+def find_current_gp_id(gps):
+    """GP corrente (o il primo futuro) dal calendario già serializzato"""
+    current_gp = next((gp for gp in gps if gp['status'] == 'current'), None) \
+        or next((gp for gp in gps if gp['status'] == 'future'), None)
+    return current_gp['id'] if current_gp else None
+
+def find_active_season(gps):
+    """Stagione del GP corrente, altrimenti l'ultima del calendario"""
+    current_gp_id = find_current_gp_id(gps)
+    current_gp = next((gp for gp in gps if gp['id'] == current_gp_id), None)
+    if current_gp:
+        return current_gp['season']
+    return max((gp['season'] for gp in gps), default=None)
+
+def with_ownership(entities, kind, key):
+    """
+    Copia della lista in cache con la percentuale di possesso del GP corrente.
+    Il possesso cambia ad ogni salvataggio, quindi non entra nella cache dei prezzi:
+    è una sola query sui contatori.
+    """
+    gp_id = find_current_gp_id(get_cached_grandprix())
+    ownership = team_picks.ownership_percentages(gp_id)[kind] if gp_id else {}
+    return [dict(entity, ownership=ownership.get(entity[key], 0.0)) for entity in entities]
+
+@app.route('/api/ownership/<int:gp_id>', methods=['GET'])
+def get_ownership(gp_id):
+    """Percentuale di team che possiede ogni pilota e scuderia nel GP (contatori live)"""
+    if not GrandPrix.query.get(gp_id):
+        return jsonify({'error': 'Grand Prix non trovato'}), 404
+    return jsonify(team_picks.ownership_percentages(gp_id)), 200
+
+# ============ OPTIMIZER ============
+
+@app.route('/api/optimizer', methods=['POST'])
+def optimize_team():
+    """
+    Team con più punti attesi entro il budget e le migliori alternative.
+    Body (tutto facoltativo): budget (fino a MAX_BUDGET), drivers, constructors (dimensione della rosa),
+    top_k, gp_id (GP dei prezzi, default il corrente), expected: {"drivers": {numero: punti}, "constructors": {id: punti}}
+    per sostituire i punti attesi calcolati dallo storico (risposta non in cache).
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        budget = float(data.get('budget', optimizer.BUDGET))
+        n_drivers = int(data.get('drivers', optimizer.SQUAD_DRIVERS))
+        n_constructors = int(data.get('constructors', optimizer.SQUAD_CONSTRUCTORS))
+        top_k = int(data.get('top_k', optimizer.DEFAULT_TOP_K))
+        gp_id = int(data['gp_id']) if data.get('gp_id') is not None else find_current_gp_id(get_cached_grandprix())
+        expected = data.get('expected') or {}
+        driver_overrides = {int(k): float(v) for k, v in (expected.get('drivers') or {}).items()}
+        constructor_overrides = {int(k): float(v) for k, v in (expected.get('constructors') or {}).items()}
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'error': 'Parametri non validi'}), 400
+    if not 0 < budget <= optimizer.MAX_BUDGET or n_drivers < 1 or n_constructors < 0 \
+            or not 1 <= top_k <= optimizer.MAX_TOP_K:
+        return jsonify({'error': 'Parametri non validi'}), 400
+    if gp_id is not None and all(gp['id'] != gp_id for gp in get_cached_grandprix()):
+        return jsonify({'error': 'Grand Prix non trovato'}), 404
+
+    def compute():
+        driver_history, constructor_history = cache.get_or_compute(('optimizer', 'expected'), optimizer.expected_points)
+        drivers = [
+            optimizer.Candidate(d['number'], d['name'], optimizer.price_for_gp(d, gp_id),
+                                driver_overrides.get(d['number'], driver_history.get(d['number'], 0.0)))
+            for d in cache.get_or_compute(('drivers',), build_drivers_payload)
+        ]
+        constructors = [
+            optimizer.Candidate(c['id'], c['name'], optimizer.price_for_gp(c, gp_id),
+                                constructor_overrides.get(c['id'], constructor_history.get(c['id'], 0.0)))
+            for c in cache.get_or_compute(('constructors',), build_constructors_payload)
+        ]
+        return [optimizer.solution_to_dict(s) for s in optimizer.solve(drivers, constructors, budget, n_drivers, n_constructors, top_k)]
+
+    if driver_overrides or constructor_overrides:
+        # Punti attesi del client: risposta non riutilizzabile, niente cache
+        solutions = compute()
+    else:
+        # Il solver lavora in decimi: budget che differiscono oltre il decimo danno la stessa chiave.
+        # Cache valida fino al prossimo aggiornamento di prezzi o punteggi
+        key = ('optimizer', gp_id, optimizer.to_tenths(budget), n_drivers, n_constructors, top_k)
+        solutions = cache.get_or_compute(key, compute)
+    if not solutions:
+        return jsonify({'error': 'Nessun team possibile con questo budget'}), 404
+
+    return jsonify({
+        'gp_id': gp_id,
+        'best': solutions[0],
+        'alternatives': solutions[1:],
+        'revision': cache.revision('drivers', 'constructors', 'optimizer')
+    }), 200
+
+# ============ ANALYTICS ============
+
+ANALYTICS = {
+    'picks': season_archive.average_points_per_pick,
+    'prices': season_archive.price_trajectories,
+    'ownership': season_archive.ownership_over_time,
+}
+
+@app.route('/api/analytics/<int:season>/<metric>', methods=['GET'])
+def get_season_analytics(season, metric):
+    """Statistiche di stagione lette dall'archivio colonnare (?kind=driver|constructor)"""
+    kind = request.args.get('kind', 'driver')
+    if metric not in ANALYTICS or kind not in season_archive.PICK_TABLES:
+        return jsonify({'error': 'Statistica non valida'}), 400
+
+    archive = season_archive.open_archive(season)
+    if archive is None:
+        return jsonify({'error': 'Archivio della stagione non disponibile'}), 404
+
+    return jsonify({
+        'season': season,
+        'kind': kind,
+        metric: ANALYTICS[metric](archive, kind)
+    }), 200
+
 # ============ ADMIN ENDPOINTS ============
 
 @app.route('/api/game/state', methods=['GET'])
@@ -499,7 +749,7 @@ def get_game_state():
     game_state = GameState.query.first()
     if not game_state:
         return jsonify({'error': 'Game state non trovato'}), 404
-    return jsonify(game_state.to_dict()), 200
+    return jsonify(serializers.game_state(game_state)), 200
 
 @app.route('/api/game/state', methods=['POST'])
 def update_game_state():
@@ -534,10 +784,11 @@ def update_game_state():
         game_state.current_date = game_date
     
     db.session.commit()
+    cache.invalidate('grandprix')
     
     return jsonify({
         'success': True,
-        'game_state': game_state.to_dict()
+        'game_state': serializers.game_state(game_state)
     }), 200
 
 @app.route('/api/game/state/reset', methods=['POST'])
@@ -563,15 +814,117 @@ def reset_game_state():
         game_state.offset_hours = 0
     
     db.session.commit()
+    cache.invalidate('grandprix')
     
     return jsonify({
         'success': True,
-        'game_state': game_state.to_dict()
+        'game_state': serializers.game_state(game_state)
+    }), 200
+
+@app.route('/api/scoring/rules/<int:season>', methods=['GET'])
+def get_scoring_rules(season):
+    """Ultima versione delle regole di punteggio della stagione"""
+    rules = db.session.query(
+        ScoringRules.season, ScoringRules.version, ScoringRules.rules_json, ScoringRules.created_at
+    ).filter_by(season=season).order_by(ScoringRules.version.desc()).first()
+    if not rules:
+        return jsonify({'error': 'Regole non trovate'}), 404
+    return jsonify(serializers.scoring_rules(rules)), 200
+
+@app.route('/api/scoring/rules/<int:season>', methods=['POST'])
+def update_scoring_rules(season):
+    """Salva una nuova versione delle regole e ricalcola la stagione (solo admin)"""
+    data = request.get_json()
+    
+    # Verifica admin
+    user_id = data.get('admin_id')
+    if not user_id:
+        return jsonify({'error': 'Admin ID richiesto'}), 400
+    
+    admin = User.query.get(user_id)
+    if not admin or admin.role != 'Administrator':
+        return jsonify({'error': 'Solo admin può modificare le regole'}), 403
+    
+    rules = data.get('rules')
+    if not isinstance(rules, dict) or not rules:
+        return jsonify({'error': 'rules richiesto'}), 400
+    
+    try:
+        compiled = scoring_rules.add_rules_version(season, rules)
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'error': f'Regole non valide: {e}'}), 400
+    
+    return jsonify({
+        'success': True,
+        'rules_version': compiled.version,
+        'rescored': rescore_season(app, season, compiled.version)
     }), 200
 
 @app.route('/api/health', methods=['GET'])
 def health():
     return jsonify({'status': 'ok'}), 200
 
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """Stream SSE con gli eventi dei job ('gp_scored', 'prices_updated'), da Last-Event-ID o ?last_event_id="""
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is None:
+        last_event_id = request.args.get('last_event_id', type=int)
+    return Response(
+        events.broker.stream(app, last_event_id),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # niente buffering nei reverse proxy
+        }
+    )
+
+# ============ BOOTSTRAP ============
+
+@app.route('/api/bootstrap', methods=['GET'])
+def bootstrap():
+    """
+    Tutto ciò che serve al primo caricamento in una sola richiesta:
+    dati di riferimento e calendario (dalla cache) e, con ?user_id=,
+    le leghe dell'utente e il suo team per il GP corrente.
+    Con ?reference=0 ritorna solo la parte utente.
+
+    Con ?revision= (token della copia in cache del client) e dati di riferimento
+    invariati ritorna solo calendario e possesso, con unchanged=true.
+    results_revision cambia ad ogni scoring: finché non cambia il client
+    non richiede i risultati dei GP passati. Le revisioni sono nel database,
+    uguali su tutti i worker.
+    """
+    user_id = request.args.get('user_id', type=int)
+    include_reference = request.args.get('reference', '1') != '0'
+
+    gps = get_cached_grandprix()
+    payload = {'status': 'ok'}
+    if include_reference:
+        revision = cache.revision(*REFERENCE_GROUPS)
+        payload['revision'] = revision
+        payload['results_revision'] = cache.revision('results')
+        # Il calendario dipende dall'orologio di gioco: sempre incluso
+        payload['grandprix'] = gps
+        if request.args.get('revision') == revision:
+            payload['unchanged'] = True
+            gp_id = find_current_gp_id(gps)
+            ownership = team_picks.ownership_percentages(gp_id) if gp_id else {'drivers': {}, 'constructors': {}}
+            payload['ownership'] = {'drivers': ownership['drivers'], 'constructors': ownership['constructors']}
+        else:
+            payload['drivers'] = with_ownership(cache.get_or_compute(('drivers',), build_drivers_payload), 'drivers', 'number')
+            payload['constructors'] = with_ownership(cache.get_or_compute(('constructors',), build_constructors_payload), 'constructors', 'id')
+            payload['leagues'] = cache.get_or_compute(('leagues',), build_leagues_payload, ttl=LEAGUES_CACHE_TTL)
+
+    if user_id:
+        current_gp_id = find_current_gp_id(gps)
+        payload['user'] = {
+            'leagues': build_user_leagues_payload(user_id),
+            'current_gp_id': current_gp_id,
+            'team': build_team_payload(user_id, current_gp_id, gps) if current_gp_id else None
+        }
+
+    return jsonify(payload), 200
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,377 @@
+"""
+Import massivo di utenti, iscrizioni alle leghe e team da un file JSONL,
+una riga per utente:
+
+    {"username": "mario", "email": "mario@x.com", "password": "...",
+     "leagues": [{"code": "POLE24", "team_name": "Scuderia Mario"}],
+     "teams": [{"gp_id": 3, "drivers": [1, 4, 16, 44, 81], "constructors": [2, 5]}]}
+
+Le righe sono validate contro i cataloghi (piloti, scuderie, leghe, GP) letti
+una volta all'avvio; le password sono hashate in un pool di processi mentre il
+blocco precedente viene scritto, e ogni blocco è inserito con pochi INSERT
+multi-riga in una sola transazione (nessuna email, nessuna query per riga).
+
+Dopo ogni blocco il checkpoint (<file>.checkpoint) salva l'ultima riga
+importata: rilanciando lo stesso comando l'import riprende da lì. Gli utenti
+già presenti (email o username) vengono saltati.
+
+Uso: python bulk_import.py utenti.jsonl [--batch-size 1000] [--workers N] [--report report.json]
+
+A fine import viene incrementata solo la revisione di cache dell'elenco leghe
+(nuovi members_count, anche per il token dei client). Proiezioni e riepiloghi di
+stagione sono versionati con members_count delle leghe, e gli utenti importati
+non hanno risultati: le revisioni di risultati e classifiche restano invariate.
+"""
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import itertools
+import json
+import os
+import time
+
+from sqlalchemy import insert, or_
+from werkzeug.security import generate_password_hash
+
+from models import GrandPrix, League, LeagueMembership, Team, TeamPick, User, db, gp_status, insert_on_conflict
+import cache
+import serializers
+import standings
+import team_picks
+from optimizer import SQUAD_CONSTRUCTORS, SQUAD_DRIVERS
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+
+class Catalogs:
+    """Piloti, scuderie, leghe e GP modificabili, letti una volta per tutto l'import"""
+
+    def __init__(self):
+        # Stessa forma delle scelte salvate dal client (to_dict dei modelli)
+        self.drivers = {
+            row.id: {
+                'id': row.id, 'num': row.number, 'number': row.number, 'name': row.name, 'team': row.team,
+                'price': row.price, 'pts': row.points, 'color': row.color
+            }
+            for row in db.session.query(*serializers.DRIVER_COLUMNS)
+        }
+        self.constructors = {
+            row.id: {'id': row.id, 'name': row.name, 'price': row.price, 'pts': row.points, 'color': row.color}
+            for row in db.session.query(*serializers.CONSTRUCTOR_COLUMNS)
+        }
+        self.leagues = dict(db.session.query(League.code, League.id))
+        # Come save_team: niente team per i GP già passati
+        now = serializers.game_date()
+        self.gp_seasons = {
+            row.id: row.season
+            for row in db.session.query(GrandPrix.id, GrandPrix.season, GrandPrix.date, GrandPrix.lock_date)
+            if gp_status(row.date, row.lock_date, now) != 'past'
+        }
+
+
+def validate_row(data, catalogs):
+    """
+    Normalizza una riga del file
+
+    Returns:
+        dict con username, email, password, leagues [(league_id, team_name)], teams [(gp_id, season, drivers, constructors)]
+
+    Raises:
+        ValueError: riga non valida
+    """
+    if not isinstance(data, dict):
+        raise ValueError('la riga non è un oggetto JSON')
+    username = str(data.get('username') or '').strip()
+    email = str(data.get('email') or '').strip().lower()
+    password = data.get('password') or ''
+    if not username or not email or not password:
+        raise ValueError('username, email e password obbligatori')
+    # Stessi limiti di /api/auth/register
+    if len(email) > 50 or len(username) > 30:
+        raise ValueError('email o username troppo lunghi')
+
+    leagues = {}
+    for entry in data.get('leagues') or []:
+        league_id = catalogs.leagues.get(entry.get('code'))
+        if league_id is None:
+            raise ValueError(f"lega sconosciuta: {entry.get('code')}")
+        leagues[league_id] = str(entry.get('team_name') or f"{username}'s Team")[:120]
+
+    teams = {}
+    for entry in data.get('teams') or []:
+        gp_id = entry.get('gp_id')
+        if gp_id not in catalogs.gp_seasons:
+            raise ValueError(f'GP sconosciuto o già passato: {gp_id}')
+        if gp_id in teams:
+            raise ValueError(f'due team per il GP {gp_id}')
+        drivers = entry.get('drivers') or []
+        constructors = entry.get('constructors') or []
+        if len(drivers) != SQUAD_DRIVERS or len(constructors) != SQUAD_CONSTRUCTORS:
+            raise ValueError(f'il team del GP {gp_id} deve avere {SQUAD_DRIVERS} piloti e {SQUAD_CONSTRUCTORS} scuderie')
+        unknown = [d for d in drivers if d not in catalogs.drivers] + [c for c in constructors if c not in catalogs.constructors]
+        if unknown:
+            raise ValueError(f'piloti/scuderie sconosciuti nel GP {gp_id}: {unknown}')
+        if len(set(drivers)) != len(drivers) or len(set(constructors)) != len(constructors):
+            raise ValueError(f'scelte ripetute nel GP {gp_id}')
+        teams[gp_id] = (
+            catalogs.gp_seasons[gp_id],
+            [catalogs.drivers[d] for d in drivers],
+            [catalogs.constructors[c] for c in constructors]
+        )
+
+    return {
+        'username': username,
+        'email': email,
+        'password': password,
+        'leagues': list(leagues.items()),
+        'teams': [(gp_id, season, drivers, constructors) for gp_id, (season, drivers, constructors) in teams.items()]
+    }
+
+
+def read_batches(path, start_line, batch_size):
+    """Blocchi di (numero riga, testo) dal file, saltando le righe già importate"""
+    with open(path, encoding='utf-8') as f:
+        lines = ((n, line) for n, line in enumerate(f, 1) if n > start_line and line.strip())
+        while True:
+            batch = list(itertools.islice(lines, batch_size))
+            if not batch:
+                return
+            yield batch
+
+
+def existing_users(emails, usernames):
+    """Email e username già registrati tra quelli del blocco"""
+    rows = db.session.query(User.email, User.username).filter(
+        or_(User.email.in_(emails), User.username.in_(usernames))
+    ).all()
+    return {row.email for row in rows}, {row.username for row in rows}
+
+
+class Importer:
+    def __init__(self, catalogs, pool, workers):
+        self.catalogs = catalogs
+        self.pool = pool
+        self.workers = workers
+        self.seen_emails = set()
+        self.seen_usernames = set()
+        self.totals = Counter()
+        self.timings = Counter()
+        self.errors = []
+
+    def reject(self, counts, line_number, message):
+        counts['rejected'] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def prepare(self, batch):
+        """
+        Valida il blocco e avvia l'hash delle password nel pool (non attende).
+        Scartate e già presenti del blocco entrano nei totali solo al suo insert.
+        """
+        started = time.perf_counter()
+        counts = Counter()
+        rows = []
+        for line_number, line in batch:
+            try:
+                row = validate_row(json.loads(line), self.catalogs)
+            except (ValueError, TypeError, AttributeError) as e:  # include json.JSONDecodeError
+                self.reject(counts, line_number, str(e))
+                continue
+            row['line'] = line_number
+            rows.append(row)
+
+        emails, usernames = existing_users({r['email'] for r in rows}, {r['username'] for r in rows})
+        accepted = []
+        for row in rows:
+            if row['email'] in emails or row['username'] in usernames:
+                counts['skipped'] += 1
+            elif row['email'] in self.seen_emails or row['username'] in self.seen_usernames:
+                self.reject(counts, row['line'], 'email o username ripetuti nel file')
+            else:
+                self.seen_emails.add(row['email'])
+                self.seen_usernames.add(row['username'])
+                accepted.append(row)
+
+        chunksize = max(1, len(accepted) // (self.workers * 4))
+        hashes = self.pool.map(generate_password_hash, [row['password'] for row in accepted], chunksize=chunksize)
+        self.timings['validate'] += time.perf_counter() - started
+        return batch[-1][0], accepted, hashes, counts
+
+    def insert(self, rows, hashes, counts):
+        """Scrive utenti, iscrizioni, team e indice delle scelte del blocco in una transazione"""
+        started = time.perf_counter()
+        hashes = list(hashes)
+        self.timings['hash_wait'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        user_ids = {}
+        if rows:
+            inserted = db.session.execute(
+                insert_on_conflict(User).on_conflict_do_nothing().returning(User.id, User.email),
+                [
+                    {'username': row['username'], 'email': row['email'], 'password_hash': password_hash,
+                     'role': 'Player', 'is_verified': True}
+                    for row, password_hash in zip(rows, hashes)
+                ]
+            ).all()
+            user_ids = {email: user_id for user_id, email in inserted}
+        # Registrati nel frattempo da un'altra parte: saltati con le loro iscrizioni e team
+        self.totals['skipped'] += len(rows) - len(user_ids)
+        rows = [row for row in rows if row['email'] in user_ids]
+
+        memberships = [
+            {'user_id': user_ids[row['email']], 'league_id': league_id, 'team_name': team_name}
+            for row in rows for league_id, team_name in row['leagues']
+        ]
+        if memberships:
+            joined = Counter(league_id for league_id, in db.session.execute(
+                insert_on_conflict(LeagueMembership).on_conflict_do_nothing(
+                    index_elements=['user_id', 'league_id']
+                ).returning(LeagueMembership.league_id),
+                memberships
+            ))
+            for league_id, count in joined.items():
+                League.query.filter_by(id=league_id).update(
+                    {League.members_count: League.members_count + count},
+                    synchronize_session=False
+                )
+            # Righe di classifica di ogni stagione per i nuovi membri (utenti nuovi: 0 punti)
+            standings.ensure_standings(user_ids=list(user_ids.values()))
+            self.totals['memberships'] += sum(joined.values())
+
+        teams = [
+            (user_ids[row['email']], gp_id, season, drivers, constructors)
+            for row in rows for gp_id, season, drivers, constructors in row['teams']
+        ]
+        if teams:
+            team_ids = db.session.execute(
+                insert(Team).returning(Team.id, sort_by_parameter_order=True),
+                [
+                    {'user_id': user_id, 'gp_id': gp_id, 'season': season,
+                     'drivers_json': json.dumps(drivers), 'constructors_json': json.dumps(constructors)}
+                    for user_id, gp_id, season, drivers, constructors in teams
+                ]
+            ).scalars().all()
+
+            # Indice delle scelte e contatori di possesso, come sync_team_picks ma per tutto il blocco
+            picks = []
+            ownership = {}
+            for team_id, (user_id, gp_id, _, drivers, constructors) in zip(team_ids, teams):
+                team_counts = team_picks.picks_of(drivers, constructors)
+                deltas = ownership.setdefault(gp_id, Counter())
+                deltas.update(team_counts)
+                deltas[('team', 0)] += 1
+                picks.extend(
+                    {'team_id': team_id, 'user_id': user_id, 'gp_id': gp_id, 'kind': kind, 'entity_id': entity_id}
+                    for (kind, entity_id), count in team_counts.items()
+                    for _ in range(count)
+                )
+            db.session.execute(insert(TeamPick), picks)
+            for gp_id, deltas in ownership.items():
+                team_picks.apply_ownership_deltas(gp_id, deltas)
+            self.totals['teams'] += len(teams)
+
+        db.session.commit()
+        self.totals['users'] += len(rows)
+        self.totals.update(counts)
+        self.timings['insert'] += time.perf_counter() - started
+
+
+def load_checkpoint(path, source):
+    if not os.path.exists(path):
+        return 0, Counter()
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('source') != os.path.abspath(source):
+        return 0, Counter()
+    return checkpoint['line'], Counter(checkpoint['totals'])
+
+
+def save_checkpoint(path, source, line, totals):
+    # Scrittura atomica: un'interruzione non lascia un checkpoint a metà
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'source': os.path.abspath(source), 'line': line, 'totals': dict(totals)}, f)
+    os.replace(tmp_path, path)
+
+
+def run_import(path, batch_size=BATCH_SIZE, workers=None, checkpoint_path=None, restart=False):
+    """
+    Importa il file (da riprendere dal checkpoint, se c'è)
+
+    Returns:
+        dict: report con totali, righe/s e tempi per fase
+    """
+    checkpoint_path = checkpoint_path or path + '.checkpoint'
+    start_line, previous_totals = (0, Counter()) if restart else load_checkpoint(checkpoint_path, path)
+    if start_line:
+        print(f"🔄 Ripresa dal checkpoint: righe fino alla {start_line} già importate")
+
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        importer = Importer(Catalogs(), pool, workers)
+        pending = None
+        last_line = start_line
+        # Pipeline: il blocco successivo viene validato e hashato mentre si scrive quello corrente
+        for batch in itertools.chain(read_batches(path, start_line, batch_size), [None]):
+            prepared = importer.prepare(batch) if batch else None
+            if pending:
+                batch_last_line, rows, hashes, counts = pending
+                importer.insert(rows, hashes, counts)
+                save_checkpoint(checkpoint_path, path, batch_last_line, previous_totals + importer.totals)
+                elapsed = time.perf_counter() - started
+                processed = batch_last_line - start_line
+                print(f"📦 Riga {batch_last_line}: {importer.totals['users']} utenti, "
+                      f"{importer.totals['memberships']} iscrizioni, {importer.totals['teams']} team, "
+                      f"{importer.totals['rejected']} scartate ({processed / elapsed:.0f} righe/s)", flush=True)
+                last_line = batch_last_line
+            pending = prepared
+
+    cache.invalidate('leagues')
+    elapsed = time.perf_counter() - started
+    processed = last_line - start_line
+    return {
+        'source': os.path.abspath(path),
+        'lines': last_line,
+        'resumed_from': start_line,
+        'totals': dict(previous_totals + importer.totals),
+        'this_run': dict(importer.totals),
+        'elapsed_seconds': round(elapsed, 2),
+        'rows_per_second': round(processed / elapsed, 1) if elapsed else None,
+        'users_per_second': round(importer.totals['users'] / elapsed, 1) if elapsed else None,
+        'phase_seconds': {phase: round(seconds, 2) for phase, seconds in importer.timings.items()},
+        'workers': workers,
+        'batch_size': batch_size,
+        'errors': importer.errors
+    }
+
+
+if __name__ == '__main__':
+    from factory import create_app
+
+    parser = argparse.ArgumentParser(description='Import massivo di utenti, iscrizioni e team da JSONL')
+    parser.add_argument('path', help='file JSONL, una riga per utente')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, help='processi per l\'hash delle password (default: CPU)')
+    parser.add_argument('--checkpoint', help='file di checkpoint (default: <path>.checkpoint)')
+    parser.add_argument('--restart', action='store_true', help='ignora il checkpoint e riparte dalla prima riga')
+    parser.add_argument('--report', help='file JSON con il report dell\'import')
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        report = run_import(args.path, args.batch_size, args.workers, args.checkpoint, args.restart)
+
+    totals = report['totals']
+    print(f"✅ Import completato in {report['elapsed_seconds']}s: {totals.get('users', 0)} utenti, "
+          f"{totals.get('memberships', 0)} iscrizioni, {totals.get('teams', 0)} team, "
+          f"{totals.get('skipped', 0)} già presenti, {totals.get('rejected', 0)} scartate")
+    print(f"   {report['rows_per_second']} righe/s, {report['users_per_second']} utenti/s, fasi: {report['phase_seconds']}")
+    for error in report['errors'][:10]:
+        print(f"   ⚠️  riga {error['line']}: {error['error']}")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report scritto in {args.report}")
@@ -0,0 +1,106 @@
+"""
+Cache in-process per i payload calcolati dalle API (dati di riferimento,
+calendario, ...). Le chiavi sono tuple il cui primo elemento è il "gruppo"
+(es. ('drivers',), ('team', user_id, gp_id)): invalidate() svuota interi gruppi.
+
+Le revisioni dei gruppi sono nel database (tabella cache_revisions): invalidate()
+le incrementa da qualunque processo (worker web, scheduler, import) e ogni processo
+le rilegge al più ogni REVISION_POLL_SECONDS, scartando le voci calcolate con una
+revisione precedente. La stessa revisione è il token usato dal client.
+
+Per i payload di una sola lega o di un solo utente get_or_compute accetta una
+`version` letta dai dati (es. members_count della lega): la voce vale solo con
+la stessa versione, così un'iscrizione non incrementa le revisioni globali.
+Quando la versione non si ricava dai dati, invalidate_scope() incrementa una
+revisione di un solo utente/lega (riga 'gruppo:id' di cache_revisions), che
+scope_revision() rilegge dal database ad ogni richiesta.
+"""
+
+import threading
+import time
+
+from models import db, insert_on_conflict, CacheRevision
+
+REVISION_POLL_SECONDS = 2
+
+_entries = {}
+_revisions = {}
+_revisions_read_at = None
+_lock = threading.Lock()
+
+
+def _current_revisions():
+    """Revisioni dei gruppi, rilette dal database al più ogni REVISION_POLL_SECONDS"""
+    global _revisions, _revisions_read_at
+    now = time.monotonic()
+    with _lock:
+        if _revisions_read_at is not None and now - _revisions_read_at < REVISION_POLL_SECONDS:
+            return _revisions
+    with db.engine.connect() as connection:
+        # Solo i gruppi: le revisioni per utente/lega si leggono una alla volta
+        revisions = dict(connection.execute(
+            db.select(CacheRevision.name, CacheRevision.revision).where(CacheRevision.name.notlike('%:%'))
+        ).all())
+    with _lock:
+        _revisions, _revisions_read_at = revisions, now
+    return revisions
+
+
+def get_or_compute(key, compute, ttl=None, version=None):
+    """Ritorna il valore in cache per `key` (calcolato con la stessa `version`), altrimenti lo calcola con compute()"""
+    group_revision = _current_revisions().get(key[0], 0)
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if entry and entry[2] == group_revision and entry[3] == version and (entry[1] is None or entry[1] > now):
+            return entry[0]
+
+    value = compute()
+    expires_at = now + ttl if ttl else None
+    with _lock:
+        # Non salvare un valore calcolato mentre il gruppo veniva invalidato
+        if _revisions.get(key[0], 0) == group_revision:
+            _entries[key] = (value, expires_at, group_revision, version)
+    return value
+
+
+def _increment(connection, name):
+    connection.execute(
+        insert_on_conflict(CacheRevision).values(name=name, revision=1).on_conflict_do_update(
+            index_elements=['name'], set_={'revision': CacheRevision.revision + 1}
+        )
+    )
+
+
+def invalidate(*groups):
+    """Incrementa nel database la revisione dei gruppi indicati e ne rimuove le chiavi locali"""
+    global _revisions_read_at
+    # Connessione propria: la revisione è visibile agli altri processi anche se la sessione del chiamante non fa commit
+    with db.engine.begin() as connection:
+        for group in groups:
+            _increment(connection, group)
+    with _lock:
+        for key in list(_entries):
+            if key[0] in groups:
+                del _entries[key]
+        _revisions_read_at = None
+
+
+def invalidate_scope(group, scope_id):
+    """Incrementa la revisione di un solo utente/lega del gruppo (es. season_summary dell'utente)"""
+    with db.engine.begin() as connection:
+        _increment(connection, f'{group}:{scope_id}')
+
+
+def scope_revision(group, scope_id):
+    """Revisione di un utente/lega, letta dal database (una query per chiave primaria)"""
+    with db.engine.connect() as connection:
+        return connection.execute(
+            db.select(CacheRevision.revision).where(CacheRevision.name == f'{group}:{scope_id}')
+        ).scalar() or 0
+
+
+def revision(*groups):
+    """Token di revisione dei gruppi indicati, cambia ad ogni loro invalidazione (in qualunque processo)"""
+    revisions = _current_revisions()
+    return '.'.join(str(revisions.get(group, 0)) for group in groups)
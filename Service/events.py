@@ -0,0 +1,127 @@
+"""
+Eventi live (Server-Sent Events) pubblicati dai job di scoring e pricing.
+
+Gli eventi sono righe della tabella live_events: publish() le scrive da
+qualunque processo (worker web, scheduler, CLI). In ogni processo web un solo
+thread legge i nuovi eventi ogni POLL_SECONDS e li passa ai subscriber tramite
+un buffer condiviso, quindi pubblicare costa uguale con 10 o 10.000 connessioni
+aperte. Gli id sono quelli della tabella, uguali su tutti i worker: un client
+che si riconnette con Last-Event-ID, anche su un altro worker, recupera dal
+database gli eventi persi delle ultime RETENTION_HOURS.
+
+Gli eventi dicono solo cosa è cambiato (es. il GP ricalcolato): i client
+rileggono dalle API i dati che stanno mostrando.
+"""
+
+from collections import deque
+from datetime import datetime, timedelta
+import json
+import threading
+import time
+
+from models import db, LiveEvent
+
+HISTORY_SIZE = 256
+HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 5000
+POLL_SECONDS = 2
+RETENTION_HOURS = 24
+
+
+def publish(name, data):
+    """Salva un evento per i subscriber di tutti i processi, ritorna il suo id"""
+    payload = json.dumps(data, separators=(',', ':'))
+    now = datetime.utcnow()
+    # Connessione propria: l'evento è visibile subito, anche se la sessione del chiamante non fa commit
+    with db.engine.begin() as connection:
+        event_id = connection.execute(
+            db.insert(LiveEvent).values(name=name, data=payload, created_at=now)
+        ).inserted_primary_key[0]
+        connection.execute(db.delete(LiveEvent).where(
+            LiveEvent.created_at < now - timedelta(hours=RETENTION_HOURS), LiveEvent.id < event_id
+        ))
+    return event_id
+
+
+def load_events(after_id):
+    """Eventi salvati con id > after_id, in ordine: (id, nome, payload JSON)"""
+    with db.engine.connect() as connection:
+        return [tuple(row) for row in connection.execute(
+            db.select(LiveEvent.id, LiveEvent.name, LiveEvent.data).where(LiveEvent.id > after_id).order_by(LiveEvent.id)
+        )]
+
+
+def last_event_id():
+    with db.engine.connect() as connection:
+        return connection.execute(db.select(db.func.max(LiveEvent.id))).scalar() or 0
+
+
+class EventBroker(object):
+
+    def __init__(self, history_size=HISTORY_SIZE, poll_seconds=POLL_SECONDS):
+        self._events = deque(maxlen=history_size)
+        self._last_id = None
+        self._complete_after = None  # il buffer contiene tutti gli eventi con id > _complete_after
+        self._poll_seconds = poll_seconds
+        self._condition = threading.Condition()
+
+    def start(self, app):
+        """Avvia al primo subscriber il thread che legge gli eventi (uno per processo), ritorna l'ultimo id"""
+        with self._condition:
+            if self._last_id is None:
+                with app.app_context():
+                    self._last_id = self._complete_after = last_event_id()
+                threading.Thread(target=self._poll, args=(app,), name='events-poller', daemon=True).start()
+            return self._last_id
+
+    def _poll(self, app):
+        while True:
+            time.sleep(self._poll_seconds)
+            try:
+                with app.app_context():
+                    events = load_events(self._last_id)
+            except Exception as e:
+                print(f"⚠️  Lettura eventi live fallita: {e}", flush=True)
+                continue
+            if not events:
+                continue
+            with self._condition:
+                for event in events:
+                    if len(self._events) == self._events.maxlen:
+                        self._complete_after = self._events[0][0]
+                    self._events.append(event)
+                self._last_id = events[-1][0]
+                self._condition.notify_all()
+
+    def events_after(self, last_id, timeout=None):
+        """Eventi con id > last_id, attende fino a timeout se non ce ne sono; None se non sono più nel buffer"""
+        with self._condition:
+            if self._last_id <= last_id:
+                self._condition.wait(timeout)
+            if last_id < self._complete_after:
+                return None
+            return [event for event in self._events if event[0] > last_id]
+
+    def stream(self, app, last_event_id=None, heartbeat=HEARTBEAT_SECONDS):
+        """Generatore SSE per una connessione"""
+        current_id = self.start(app)
+        # Id sconosciuto (es. di un altro database): si riparte da ora
+        last_id = last_event_id if last_event_id is not None and last_event_id <= current_id else current_id
+
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+        while True:
+            events = self.events_after(last_id, timeout=heartbeat)
+            if events is None:
+                # Riconnessione o client rimasto indietro: gli eventi persi dal database
+                with app.app_context():
+                    events = load_events(last_id)
+            if not events:
+                # Commento SSE: tiene viva la connessione attraverso i proxy
+                yield ': keepalive\n\n'
+                continue
+            for event_id, name, payload in events:
+                yield f'id: {event_id}\nevent: {name}\ndata: {payload}\n\n'
+                last_id = event_id
+
+
+broker = EventBroker()
@@ -4,6 +4,7 @@ from flask_sqlalchemy import SQLAlchemy
 import os
 from datetime import datetime
 from models import db
+import query_profiler
 from dotenv import load_dotenv
 
 load_dotenv('secrets.env')
@@ -15,4 +16,5 @@ def create_app():
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['JSON_SORT_KEYS'] = False
     db.init_app(app)
+    query_profiler.init_app(app)  # X-DB-Queries / X-DB-Time-ms fuori produzione
     return app
\ No newline at end of file
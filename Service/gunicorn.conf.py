@@ -0,0 +1,29 @@
+"""
+Configurazione di gunicorn, letta da `gunicorn app:app` lanciato da Service/.
+
+Worker gevent: ogni connessione SSE aperta (/api/events) è una greenlet in
+attesa, non un worker sync bloccato per tutta la durata della pagina.
+psycopg2 viene reso cooperativo (psycogreen) appena dopo il fork: senza, una
+query lenta bloccherebbe l'hub e con lui tutte le greenlet del worker. Il pool
+della proiezione Monte Carlo usa processi avviati con 'spawn' (projection.py),
+che non ereditano l'hub gevent né le connessioni del worker, e viene avviato
+con il worker (post_worker_init), non dentro la prima richiesta.
+"""
+
+import os
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '5000')
+worker_class = 'gevent'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+timeout = 30
+
+
+def post_fork(server, worker):
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+
+def post_worker_init(worker):
+    import projection
+    projection.start_pool()
@@ -0,0 +1,102 @@
+"""
+Classifiche di lega di una stagione paginate per chiave (keyset) su
+(points DESC, membership_id ASC). Ogni pagina costa una range scan
+sull'indice (league_id, season, points, membership_id) di league_standings:
+il costo non dipende dalla dimensione della lega.
+
+Eccezione: get_around deve conoscere la posizione dell'utente, che è un COUNT
+delle righe che lo precedono. Il COUNT legge solo lo stesso indice, ma costa O(rank).
+La posizione non è salvata in league_standings perché un'iscrizione con punti
+già fatti (o negativi) sposta quelle dei membri che seguono, e ricalcolarle
+riscriverebbe tutta la lega ad ogni join.
+"""
+
+from sqlalchemy import and_, or_
+
+from models import LeagueStanding
+import serializers
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(membership, rank):
+    """Cursore opaco: punti, id e rank dell'ultima riga restituita"""
+    return f'{membership.points or 0}:{membership.id}:{rank}'
+
+
+def decode_cursor(cursor):
+    try:
+        points, membership_id, rank = (int(part) for part in cursor.split(':'))
+    except (AttributeError, ValueError):
+        return None
+    return points, membership_id, rank
+
+
+def _base_query(league_id, season):
+    return serializers.membership_query(season).filter(LeagueStanding.league_id == league_id)
+
+
+def _after(points, membership_id):
+    """Righe che vengono dopo (points, id) nell'ordinamento della classifica"""
+    return or_(
+        LeagueStanding.points < points,
+        and_(LeagueStanding.points == points, LeagueStanding.membership_id > membership_id)
+    )
+
+
+def _before(points, membership_id):
+    """Righe che vengono prima di (points, id) nell'ordinamento della classifica"""
+    return or_(
+        LeagueStanding.points > points,
+        and_(LeagueStanding.points == points, LeagueStanding.membership_id < membership_id)
+    )
+
+
+def get_page(league_id, season, limit=DEFAULT_PAGE_SIZE, cursor=None, me_user_id=None):
+    """Ritorna (righe, next_cursor) partendo dal cursore (o dalla testa della classifica)"""
+    query = _base_query(league_id, season)
+    first_rank = 1
+    if cursor:
+        points, membership_id, rank = cursor
+        query = query.filter(_after(points, membership_id))
+        first_rank = rank + 1
+
+    # Una riga in più per sapere se esiste una pagina successiva
+    rows = query.order_by(
+        LeagueStanding.points.desc(), LeagueStanding.membership_id.asc()
+    ).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1], first_rank + len(rows) - 1) if has_more else None
+    return serializers.leaderboard(rows, first_rank, me_user_id), next_cursor
+
+
+def get_around(league_id, season, user_id, window=DEFAULT_PAGE_SIZE // 2):
+    """
+    Ritorna (righe, next_cursor) con le `window` posizioni sopra e sotto l'utente.
+    Le finestre sono range scan come get_page; la posizione dell'utente è un COUNT
+    sull'indice della classifica, quindi costa O(rank) (vedi il docstring del modulo).
+    """
+    me = _base_query(league_id, season).filter(LeagueStanding.user_id == user_id).first()
+    if not me:
+        return None, None
+
+    points = me.points or 0
+    my_rank = LeagueStanding.query.filter(
+        LeagueStanding.league_id == league_id,
+        LeagueStanding.season == season,
+        _before(points, me.id)
+    ).count() + 1
+
+    above = _base_query(league_id, season).filter(_before(points, me.id)).order_by(
+        LeagueStanding.points.asc(), LeagueStanding.membership_id.desc()
+    ).limit(window).all()
+    above.reverse()
+
+    below, next_cursor = get_page(
+        league_id, season, limit=window, cursor=(points, me.id, my_rank), me_user_id=user_id
+    )
+    rows = serializers.leaderboard(above + [me], my_rank - len(above), user_id) + below
+    return rows, next_cursor
@@ -0,0 +1,90 @@
+"""
+Export dei risultati di stagione di una lega: una riga per (membro, GP)
+con punti e posizione nella lega, in CSV o JSONL.
+
+Le righe arrivano da un cursore lato server (yield_per) e vengono scritte
+a blocchi da un generatore, quindi la memoria resta costante qualunque sia
+la dimensione della lega. Posizioni con rank() sul database, come in
+classifica: i membri senza team nel GP hanno 0 punti.
+"""
+
+import csv
+import io
+import json
+
+from sqlalchemy import and_, func
+
+from models import GrandPrix, LeagueMembership, TeamResult, User
+from factory import db
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson'
+}
+COLUMNS = ('season', 'gp_id', 'round', 'gp_name', 'user_id', 'username', 'team_name', 'points', 'rank')
+BATCH_SIZE = 1000
+
+
+def scored_gps(season):
+    """GP della stagione con almeno un risultato salvato"""
+    return db.session.query(TeamResult.gp_id).filter(TeamResult.season == season).distinct()
+
+
+def result_rows(league_id, season):
+    """Membri x GP giocati della stagione, ordinati per round e posizione, letti a blocchi"""
+    points = func.coalesce(TeamResult.points, 0)
+    return db.session.query(
+        GrandPrix.season,
+        GrandPrix.id.label('gp_id'),
+        GrandPrix.round_num,
+        GrandPrix.name,
+        LeagueMembership.user_id,
+        User.username,
+        LeagueMembership.team_name,
+        points.label('points'),
+        func.rank().over(partition_by=GrandPrix.id, order_by=points.desc()).label('rank')
+    ).select_from(LeagueMembership).join(
+        User, User.id == LeagueMembership.user_id
+    ).join(
+        GrandPrix, and_(GrandPrix.season == season, GrandPrix.id.in_(scored_gps(season)))
+    ).outerjoin(
+        TeamResult, and_(
+            TeamResult.season == season,
+            TeamResult.gp_id == GrandPrix.id,
+            TeamResult.user_id == LeagueMembership.user_id
+        )
+    ).filter(
+        LeagueMembership.league_id == league_id
+    ).order_by(
+        GrandPrix.round_num, 'rank', LeagueMembership.id
+    ).execution_options(stream_results=True).yield_per(BATCH_SIZE)
+
+
+def _csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _jsonl_chunks(rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(COLUMNS, row))))
+        if len(lines) == BATCH_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def stream_league_results(league_id, season, fmt='csv'):
+    """Generatore dei blocchi di testo dell'export nel formato richiesto ('csv' o 'jsonl')"""
+    rows = result_rows(league_id, season)
+    return _csv_chunks(rows) if fmt == 'csv' else _jsonl_chunks(rows)
@@ -0,0 +1,467 @@
+"""
+Load test locale: riproduce il picco di traffico dei minuti prima del lock_date.
+
+Avvia l'app in un processo separato su un database SQLite temporaneo, lo
+popola con utenti, lega e team, porta la data di gioco a ridosso del lock del
+prossimo GP e genera richieste con arrivi di Poisson (tasso configurabile) su
+un mix realistico: login, caricamento e salvataggio del team, classifica e
+polling di /api/grandprix. Alla fine stampa throughput, error rate e
+percentili di latenza per route.
+
+La latenza è misurata dall'istante di arrivo programmato, quindi include
+l'attesa lato client quando il server non regge il tasso richiesto.
+
+Con --join-stress ogni utente tenta più volte in parallelo l'iscrizione a una
+lega; alla fine members_count di ogni lega deve coincidere con le righe di
+league_memberships e con le iscrizioni riuscite (exit code 1 altrimenti).
+
+Con --query-budgets, dopo il seed, le route principali (bootstrap, classifica,
+risultati dei GP, riepilogo di stagione) vengono richieste nello stesso processo
+dentro assert_max_queries con i budget di QUERY_BUDGETS (exit code 1 se superati).
+
+Uso:
+    python loadtest.py --users 500 --rate 80 --duration 60
+    python loadtest.py --users 2000 --query-budgets
+    python loadtest.py --server-cmd "gunicorn -w 4 -b 127.0.0.1:{port} app:app"
+    python loadtest.py --users 300 --join-stress 4 --server-cmd "gunicorn -w 4 -b 127.0.0.1:{port} app:app"
+"""
+
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = 'loadtest123'
+
+# Mix di default: peso relativo di ogni azione
+DEFAULT_MIX = {
+    'grandprix': 35,
+    'team_load': 20,
+    'leaderboard': 20,
+    'team_save': 15,
+    'login': 10,
+}
+
+
+# ============ SERVER E DATI ============
+
+def start_server(database_url, port, server_cmd=None):
+    """Avvia l'app in un processo separato (server di sviluppo threaded, o server_cmd)"""
+    env = dict(os.environ, DATABASE_URL=database_url)
+    if server_cmd:
+        command = shlex.split(server_cmd.format(port=port))
+    else:
+        command = [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port)]
+    return subprocess.Popen(command, cwd=SERVICE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+
+def wait_ready(base_url, server, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Il server è terminato (exit code {server.returncode})")
+        try:
+            if requests.get(f'{base_url}/api/health', timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Il server non risponde su /api/health")
+
+
+def seed(database_url, n_users, league_id=1):
+    """
+    Utenti verificati (stessa password, hash calcolato una volta), tutti nella lega
+    e con un team per il GP sotto lock; data di gioco a ridosso del lock
+
+    Returns:
+        tuple: (lista utenti [(id, email)], id del GP, piloti, scuderie)
+    """
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, SERVICE_DIR)
+    from werkzeug.security import generate_password_hash
+    from factory import create_app
+    from models import db, Constructor, Driver, GameState, GrandPrix, League, LeagueMembership, LeagueStanding, Team, User
+    import team_picks
+
+    app = create_app()
+    with app.app_context():
+        now = datetime.now()
+        gp = GrandPrix.query.filter(GrandPrix.lock_date > now).order_by(GrandPrix.lock_date).first() \
+            or GrandPrix.query.filter(GrandPrix.lock_date.isnot(None)).order_by(GrandPrix.lock_date.desc()).first()
+        # get_status usa now + offset_hours: data di gioco nell'ultima ora prima del lock
+        game_state = GameState.get_game_date()
+        game_state.offset_hours = int((gp.lock_date - now).total_seconds() // 3600)
+        db.session.commit()
+
+        drivers = [d.to_dict() for d in Driver.query.all()]
+        constructors = [c.to_dict() for c in Constructor.query.all()]
+        password_hash = generate_password_hash(PASSWORD)
+        users = []
+        for i in range(n_users):
+            user = User(username=f'load{i}', email=f'load{i}@loadtest.local', password_hash=password_hash,
+                        role='Player', is_verified=True)
+            db.session.add(user)
+            db.session.flush()
+            membership = LeagueMembership(user_id=user.id, league_id=league_id, team_name=f'Load {i}')
+            db.session.add(membership)
+            db.session.flush()
+            db.session.add(LeagueStanding(membership_id=membership.id, league_id=league_id, user_id=user.id,
+                                          season=gp.season, points=random.randint(0, 500)))
+            team = Team(user_id=user.id, gp_id=gp.id)
+            team.set_drivers(random.sample(drivers, 5))
+            team.set_constructors(random.sample(constructors, 2))
+            db.session.add(team)
+            db.session.flush()
+            team_picks.sync_team_picks(team, team_picks.Counter(),
+                                       team_picks.picks_of(team.get_drivers(), team.get_constructors()), new_team=True)
+            users.append((user.id, user.email))
+        League.query.filter_by(id=league_id).update({League.members_count: League.members_count + n_users})
+        db.session.commit()
+        return users, gp.id, drivers, constructors
+
+
+def league_counts(database_url):
+    """{id lega: (members_count, righe di league_memberships)}"""
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, SERVICE_DIR)
+    from factory import create_app
+    from models import db, League, LeagueMembership
+
+    with create_app().app_context():
+        rows = db.session.query(
+            League.id, League.members_count, db.func.count(LeagueMembership.id)
+        ).outerjoin(LeagueMembership, LeagueMembership.league_id == League.id).group_by(League.id, League.members_count).all()
+        db.session.remove()
+        return {league_id: (members_count, memberships) for league_id, members_count, memberships in rows}
+
+
+# ============ STRESS DELLE ISCRIZIONI ============
+
+def join_stress(base_url, users, league_code, repeats, workers):
+    """
+    Ogni utente tenta `repeats` volte l'iscrizione alla lega, tutte le richieste
+    in parallelo e in ordine casuale (quindi anche doppioni simultanei)
+
+    Returns:
+        Counter: status HTTP delle risposte (0 per gli errori di rete)
+    """
+    attempts = [user_id for user_id, _ in users for _ in range(repeats)]
+    random.shuffle(attempts)
+    start = threading.Barrier(min(workers, len(attempts)))
+    local = threading.local()
+
+    def join(user_id):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+            # Prima richiesta di ogni thread: partono tutti insieme
+            start.wait()
+        try:
+            return local.session.post(f'{base_url}/api/leagues/join/{user_id}/{league_code}', timeout=60).status_code
+        except requests.RequestException:
+            return 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return Counter(pool.map(join, attempts))
+
+
+def run_join_stress(database_url, base_url, users, league_code, repeats, workers):
+    """Esegue lo stress e verifica i contatori, ritorna True se nessuna iscrizione è andata persa"""
+    before = league_counts(database_url)
+    started = time.monotonic()
+    statuses = join_stress(base_url, users, league_code, repeats, workers)
+    elapsed = time.monotonic() - started
+    after = league_counts(database_url)
+
+    print(f"\n📊 {sum(statuses.values())} iscrizioni tentate in {elapsed:.1f}s, status: {dict(sorted(statuses.items()))}")
+    ok = True
+    for league_id, (members_count, memberships) in sorted(after.items()):
+        added = memberships - before.get(league_id, (0, 0))[1]
+        print(f"   lega {league_id}: members_count={members_count}, iscrizioni={memberships} (+{added})")
+        if members_count != memberships:
+            print(f"❌ Lega {league_id}: members_count {members_count} != {memberships} iscrizioni")
+            ok = False
+    joined = sum(after[league_id][1] - before.get(league_id, (0, 0))[1] for league_id in after)
+    if joined != statuses[201]:
+        print(f"❌ {statuses[201]} risposte 201 ma {joined} nuove iscrizioni")
+        ok = False
+    if joined > len(users):
+        print(f"❌ {joined} nuove iscrizioni per {len(users)} utenti")
+        ok = False
+    if ok:
+        print("✅ Nessun conteggio perso")
+    return ok
+
+
+# ============ BUDGET DI QUERY ============
+
+# Query massime per richiesta, a cache fredda: non devono crescere con utenti, leghe o GP
+QUERY_BUDGETS = {
+    'bootstrap': 14,
+    'leaderboard': 4,
+    'leaderboard_around': 7,
+    'gp_results': 8,
+    'general_rank': 8,
+    'season_summary': 8,
+}
+
+
+def query_budget_paths(user_id, gp_id, league_id=1):
+    return {
+        'bootstrap': f'/api/bootstrap?user_id={user_id}',
+        'leaderboard': f'/api/leaderboard/{league_id}?user_id={user_id}',
+        'leaderboard_around': f'/api/leaderboard/{league_id}?around={user_id}&limit=10',
+        'gp_results': f'/api/league/{league_id}/gp/{gp_id}/results?limit=100',
+        'general_rank': f'/api/league/{league_id}/gp/50/results?limit=100',
+        'season_summary': f'/api/user/{user_id}/season',
+    }
+
+
+def run_query_budgets(database_url, users, gp_id):
+    """
+    Richiede le route principali nello stesso processo (test client) dentro
+    assert_max_queries: prima a cache fredda, poi calda. Ritorna True se
+    nessuna route supera il budget o esegue query ripetute (N+1)
+    """
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, SERVICE_DIR)
+    from app import app
+    from query_profiler import assert_max_queries
+
+    client = app.test_client()
+    user_id = users[len(users) // 2][0]  # a metà classifica: around e pagine non partono dalla testa
+    ok = True
+    for name, path in query_budget_paths(user_id, gp_id).items():
+        budget = QUERY_BUDGETS[name]
+        counts = []
+        for _ in range(2):
+            try:
+                with assert_max_queries(budget) as stats:
+                    response = client.get(path)
+            except AssertionError as e:
+                print(f"❌ {name} ({path}): {e}")
+                ok = False
+                break
+            if response.status_code != 200:
+                print(f"❌ {name} ({path}): status {response.status_code}")
+                ok = False
+                break
+            counts.append(stats.count)
+        else:
+            print(f"   {name}: {counts[0]} query a cache fredda, {counts[1]} calda (budget {budget})")
+    if ok:
+        print("✅ Budget di query rispettati")
+    return ok
+
+
+# ============ TRAFFICO ============
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, route, latency, ok):
+        with self.lock:
+            self.latencies.setdefault(route, []).append(latency)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def report(self, duration):
+        rows = []
+        for route in sorted(self.latencies):
+            latencies = np.array(self.latencies[route]) * 1000
+            errors = self.errors.get(route, 0)
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+            rows.append({
+                'route': route,
+                'requests': len(latencies),
+                'throughput': round(len(latencies) / duration, 1),
+                'error_rate': round(errors / len(latencies), 4),
+                'p50_ms': round(float(p50), 1),
+                'p90_ms': round(float(p90), 1),
+                'p99_ms': round(float(p99), 1),
+                'max_ms': round(float(latencies.max()), 1),
+            })
+        return rows
+
+
+class Workload:
+    """Azioni del mix: ognuna ritorna (route, ok)"""
+
+    def __init__(self, base_url, users, gp_id, drivers, constructors, league_id=1):
+        self.base_url = base_url
+        self.users = users
+        self.gp_id = gp_id
+        self.drivers = drivers
+        self.constructors = constructors
+        self.league_id = league_id
+        self.local = threading.local()
+
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def get(self, path):
+        return self.session().get(self.base_url + path, timeout=30)
+
+    def login(self):
+        _, email = random.choice(self.users)
+        response = self.session().post(self.base_url + '/api/auth/login',
+                                       json={'email': email, 'password': PASSWORD}, timeout=30)
+        return 'POST /api/auth/login', response.ok
+
+    def grandprix(self):
+        return 'GET /api/grandprix', self.get('/api/grandprix').ok
+
+    def team_load(self):
+        user_id, _ = random.choice(self.users)
+        return 'GET /api/team', self.get(f'/api/team/{user_id}/{self.gp_id}').ok
+
+    def team_save(self):
+        user_id, _ = random.choice(self.users)
+        response = self.session().post(f'{self.base_url}/api/team/{user_id}/{self.gp_id}', json={
+            'drivers': random.sample(self.drivers, 5),
+            'constructors': random.sample(self.constructors, 2)
+        }, timeout=30)
+        return 'POST /api/team', response.ok
+
+    def leaderboard(self):
+        user_id, _ = random.choice(self.users)
+        # Metà delle viste è la prima pagina, metà la finestra attorno all'utente
+        query = f'?user_id={user_id}' if random.random() < 0.5 else f'?around={user_id}&limit=10'
+        return 'GET /api/leaderboard', self.get(f'/api/leaderboard/{self.league_id}{query}').ok
+
+
+def run_load(workload, mix, rate, duration, workers, stats):
+    """Arrivi di Poisson a `rate` richieste/s per `duration` secondi (open loop)"""
+    actions = list(mix)
+    weights = np.array([mix[a] for a in actions], dtype=np.float64)
+    weights /= weights.sum()
+
+    def execute(action, scheduled):
+        try:
+            route, ok = getattr(workload, action)()
+        except requests.RequestException:
+            route, ok = action, False
+        stats.record(route, time.monotonic() - scheduled, ok)
+
+    start = time.monotonic()
+    next_arrival = start
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            next_arrival += random.expovariate(rate)
+            if next_arrival - start > duration:
+                break
+            delay = next_arrival - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(execute, np.random.choice(actions, p=weights), next_arrival)
+    return time.monotonic() - start
+
+
+def parse_mix(value):
+    """'grandprix=35,team_save=15,...'"""
+    mix = {}
+    for part in value.split(','):
+        action, weight = part.split('=')
+        if action not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Azione sconosciuta: {action}")
+        mix[action] = float(weight)
+    return mix
+
+
+def print_report(rows, duration):
+    total = sum(r['requests'] for r in rows)
+    print(f"\n📊 {total} richieste in {duration:.1f}s ({total / duration:.1f} req/s)")
+    print(f"{'route':<24}{'req':>7}{'req/s':>8}{'err%':>7}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    for r in rows:
+        print(f"{r['route']:<24}{r['requests']:>7}{r['throughput']:>8}{r['error_rate'] * 100:>6.1f}%"
+              f"{r['p50_ms']:>9}{r['p90_ms']:>9}{r['p99_ms']:>9}{r['max_ms']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test del picco prima del lock_date')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=50, help='arrivi al secondo')
+    parser.add_argument('--duration', type=float, default=30, help='secondi')
+    parser.add_argument('--workers', type=int, default=64, help='richieste concorrenti massime lato client')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--database', help='file SQLite (default: temporaneo, cancellato alla fine)')
+    parser.add_argument('--server-cmd', help='comando del server, {port} viene sostituito')
+    parser.add_argument('--output', help='scrive il report JSON')
+    parser.add_argument('--join-stress', type=int, metavar='N',
+                        help='al posto del mix: N tentativi di iscrizione paralleli per utente')
+    parser.add_argument('--join-league', default='FERRARI', help='codice della lega dello stress')
+    parser.add_argument('--query-budgets', action='store_true',
+                        help='al posto del mix: verifica QUERY_BUDGETS sulle route principali (exit code 1 se superati)')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        # Processo server: l'import di app crea tabelle e dati di riferimento
+        sys.path.insert(0, SERVICE_DIR)
+        from app import app
+        app.run(host='127.0.0.1', port=args.port, threaded=True)
+        return
+
+    temporary = None
+    database = args.database
+    if not database:
+        temporary = tempfile.mkdtemp(prefix='fantasyf1-load-')
+        database = os.path.join(temporary, 'load.db')
+    database_url = f'sqlite:///{os.path.abspath(database)}'
+    base_url = f'http://127.0.0.1:{args.port}'
+
+    server = start_server(database_url, args.port, args.server_cmd)
+    try:
+        wait_ready(base_url, server)
+        print(f"🌱 Seed di {args.users} utenti su {database}")
+        users, gp_id, drivers, constructors = seed(database_url, args.users)
+        if args.query_budgets:
+            print(f"🔢 Budget di query con {args.users} utenti in lega")
+            if not run_query_budgets(database_url, users, gp_id):
+                sys.exit(1)
+            return
+        if args.join_stress:
+            print(f"🚦 {args.join_stress} iscrizioni parallele per utente alla lega {args.join_league}")
+            if not run_join_stress(database_url, base_url, users, args.join_league, args.join_stress, args.workers):
+                sys.exit(1)
+            return
+        print(f"🚦 {args.rate} req/s per {args.duration}s sul GP {gp_id} (lock imminente)")
+
+        stats = Stats()
+        workload = Workload(base_url, users, gp_id, drivers, constructors)
+        duration = run_load(workload, args.mix, args.rate, args.duration, args.workers, stats)
+        rows = stats.report(duration)
+        print_report(rows, duration)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'rate': args.rate, 'duration': duration, 'users': args.users, 'routes': rows}, f, indent=2)
+    finally:
+        server.terminate()
+        server.wait()
+        if temporary:
+            for name in os.listdir(temporary):
+                os.remove(os.path.join(temporary, name))
+            os.rmdir(temporary)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,134 +1,362 @@
 
 from datetime import datetime
-from pydoc import text
-from models import Constructor, Driver, GrandPrix, League
-
-
-def initialize_f1_data(db):
-    
-    default_leagues = [
-        {'id' : 1, 'code': 'POLE24', 'name': 'Pole Position League', 'members': 0, 'round': 'Round 14 - Belgium GP'},
-        {'id' : 2, 'code': 'FERRARI', 'name': 'Forza Ferrari', 'members': 0, 'round': 'Round 14 - Belgium GP'},
-        {'id' : 3, 'code': 'AMICI01', 'name': 'Sunday Racers', 'members': 0, 'round': 'Round 14 - Belgium GP'},
-    ]
-    for league_data in default_leagues:
-        if not League.query.filter_by(code=league_data['code']).first():
-            league = League(
-                id=league_data['id'],
-                code=league_data['code'],
-                name=league_data['name'],
-                members_count=league_data['members'],
-                current_round=league_data['round']
-            )
-            db.session.add(league)
+import json
+import os
+
+import sqlalchemy
+import cache
+from models import Constructor, Driver, GrandPrix, League, SEASON_TABLES, insert_on_conflict
+import standings
+import team_picks
+
+
+def ensure_league_membership_constraint(db):
+    """
+    Aggiunge il vincolo unico (user_id, league_id) ai DB creati prima che
+    esistesse: rimuove i doppioni lasciati dalle join concorrenti e riallinea
+    members_count, che con il vecchio read-modify-write poteva perdere incrementi.
+    """
+    inspector = sqlalchemy.inspect(db.engine)
+    names = {c['name'] for c in inspector.get_unique_constraints('league_memberships')}
+    names |= {i['name'] for i in inspector.get_indexes('league_memberships')}
+    if 'uq_league_memberships_user_league' in names:
+        return
+
+    db.session.execute(sqlalchemy.text(
+        "DELETE FROM league_memberships WHERE id NOT IN "
+        "(SELECT MIN(id) FROM league_memberships GROUP BY user_id, league_id)"
+    ))
+    db.session.execute(sqlalchemy.text(
+        "CREATE UNIQUE INDEX uq_league_memberships_user_league ON league_memberships (user_id, league_id)"
+    ))
+    db.session.execute(sqlalchemy.text(
+        "UPDATE leagues SET members_count = "
+        "(SELECT COUNT(*) FROM league_memberships WHERE league_memberships.league_id = leagues.id)"
+    ))
     db.session.commit()
-    
-    if GrandPrix.query.count() == 0:
-        # Seed Grand Prix (2026 F1 season) 
-        # Clear existing GP data
-        GrandPrix.query.delete()
-        db.session.execute(text("ALTER SEQUENCE grand_prix_id_seq RESTART WITH 1"))
-
-        gps = [
-            # lock_date deve essere PRIMA della gara (sabato qualifiche ore 17:00, o venerdì spa gare sprint ore 18:00)
-            {'id': 1, 'round': 1, 'name': 'Bahrain', 'circuit': 'Bahrain International Circuit', 'date': datetime(2026, 3, 1), 'fp1_start': datetime(2026, 2, 27, 10, 0), 'lock_date': datetime(2026, 2, 28, 17, 0)},
-            {'id': 2,'round': 2, 'name': 'Saudi Arabia', 'circuit': 'Jeddah Corniche Circuit', 'date': datetime(2026, 3, 8), 'fp1_start': datetime(2026, 3, 6, 10, 0), 'lock_date': datetime(2026, 3, 7, 17, 0)},
-            {'id': 3,'round': 3, 'name': 'Australia', 'circuit': 'Albert Park Circuit', 'date': datetime(2026, 3, 22), 'fp1_start': datetime(2026, 3, 20, 19, 0), 'lock_date': datetime(2026, 3, 20, 18, 0)},  # Sprint
-            {'id': 4,'round': 4, 'name': 'China', 'circuit': 'Shanghai International Circuit', 'date': datetime(2026, 4, 5), 'fp1_start': datetime(2026, 4, 3, 9, 0), 'lock_date': datetime(2026, 4, 3, 18, 0)},  # Sprint
-            {'id': 5,'round': 5, 'name': 'Japan', 'circuit': 'Suzuka International Racing Course', 'date': datetime(2026, 4, 19), 'fp1_start': datetime(2026, 4, 17, 10, 0), 'lock_date': datetime(2026, 4, 18, 17, 0)},
-            {'id': 6,'round': 6, 'name': 'Monaco', 'circuit': 'Circuit de Monaco', 'date': datetime(2026, 5, 24), 'fp1_start': datetime(2026, 5, 22, 11, 0), 'lock_date': datetime(2026, 5, 23, 17, 0)},
-            {'id': 7,'round': 7, 'name': 'Canada', 'circuit': 'Circuit Gilles Villeneuve', 'date': datetime(2026, 6, 7), 'fp1_start': datetime(2026, 6, 5, 13, 0), 'lock_date': datetime(2026, 6, 6, 17, 0)},
-            {'id': 8,'round': 8, 'name': 'Spain', 'circuit': 'Circuit de Barcelona-Catalunya', 'date': datetime(2026, 6, 21), 'fp1_start': datetime(2026, 6, 19, 10, 0), 'lock_date': datetime(2026, 6, 20, 17, 0)},
-            {'id': 9,'round': 9, 'name': 'Austria', 'circuit': 'Red Bull Ring', 'date': datetime(2026, 7, 5), 'fp1_start': datetime(2026, 7, 3, 10, 0), 'lock_date': datetime(2026, 7, 4, 17, 0)},
-            {'id': 10,'round': 10, 'name': 'Britain', 'circuit': 'Silverstone Circuit', 'date': datetime(2026, 7, 19), 'fp1_start': datetime(2026, 7, 17, 10, 0), 'lock_date': datetime(2026, 7, 18, 17, 0)},
-            {'id': 11,'round': 11, 'name': 'Belgium', 'circuit': 'Circuit de Spa-Francorchamps', 'date': datetime(2026, 8, 2), 'fp1_start': datetime(2026, 7, 31, 10, 0), 'lock_date': datetime(2026, 8, 1, 17, 0)},
-            {'id': 12,'round': 12, 'name': 'Netherlands', 'circuit': 'Zandvoort Circuit', 'date': datetime(2026, 8, 30), 'fp1_start': datetime(2026, 8, 28, 11, 0), 'lock_date': datetime(2026, 8, 29, 17, 0)},
-            {'id': 13,'round': 13, 'name': 'Italy', 'circuit': 'Autodromo Nazionale di Monza', 'date': datetime(2026, 9, 6), 'fp1_start': datetime(2026, 9, 4, 10, 0), 'lock_date': datetime(2026, 9, 5, 17, 0)},
-            {'id': 14,'round': 14, 'name': 'Azerbaijan', 'circuit': 'Baku City Circuit', 'date': datetime(2026, 9, 20), 'fp1_start': datetime(2026, 9, 18, 9, 0), 'lock_date': datetime(2026, 9, 19, 17, 0)},
-            {'id': 15,'round': 15, 'name': 'Singapore', 'circuit': 'Marina Bay Street Circuit', 'date': datetime(2026, 10, 4), 'fp1_start': datetime(2026, 10, 2, 10, 0), 'lock_date': datetime(2026, 10, 3, 17, 0)},
-            {'id': 16,'round': 16, 'name': 'USA', 'circuit': 'Circuit of the Americas', 'date': datetime(2026, 10, 18), 'fp1_start': datetime(2026, 10, 16, 12, 0), 'lock_date': datetime(2026, 10, 16, 18, 0)},  # Sprint
-            {'id': 17,'round': 17, 'name': 'Mexico', 'circuit': 'Autódromo Hermanos Rodríguez', 'date': datetime(2026, 10, 25), 'fp1_start': datetime(2026, 10, 23, 11, 0), 'lock_date': datetime(2026, 10, 24, 17, 0)},
-            {'id': 18,'round': 18, 'name': 'Brazil', 'circuit': 'Autódromo José Carlos Pace', 'date': datetime(2026, 11, 1), 'fp1_start': datetime(2026, 10, 30, 12, 0), 'lock_date': datetime(2026, 10, 30, 18, 0)},  # Sprint
-            {'id': 19,'round': 19, 'name': 'Abu Dhabi', 'circuit': 'Yas Marina Circuit', 'date': datetime(2026, 11, 29), 'fp1_start': datetime(2026, 11, 27, 8, 0), 'lock_date': datetime(2026, 11, 28, 17, 0)},
-        ]
-        for gp_data in gps:
-            gp = GrandPrix(
-                id=gp_data['id'],
-                round_num=gp_data['round'],
-                name=gp_data['name'],
-                circuit=gp_data['circuit'],
-                date=gp_data['date'],
-                fp1_start=gp_data['fp1_start'],
-                lock_date=gp_data['lock_date']
-            )
-            db.session.add(gp)
+
+
+def add_missing_column(db, table, column, ddl_type):
+    """Aggiunge una colonna nullable alle tabelle create prima che esistesse (db.create_all non lo fa)"""
+    columns = {c['name'] for c in sqlalchemy.inspect(db.engine).get_columns(table)}
+    if column in columns:
+        return
+    db.session.execute(sqlalchemy.text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+    db.session.commit()
+
+
+def fold_league_standings(db):
+    """
+    Inizializza i punti delle classifiche di lega (totale dei TeamResult
+    dell'utente) sui DB in cui non erano mai stati calcolati; da lì in poi lo
+    scoring li aggiorna a delta. Sui DB creati dopo la migrazione 9 la colonna
+    league_memberships.points non esiste più e non c'è nulla da fare.
+    """
+    columns = {c['name'] for c in sqlalchemy.inspect(db.engine).get_columns('league_memberships')}
+    if 'points' not in columns:
+        return
+    has_points = db.session.execute(sqlalchemy.text("SELECT 1 FROM league_memberships WHERE points <> 0 LIMIT 1")).first()
+    has_results = db.session.execute(sqlalchemy.text("SELECT 1 FROM team_results LIMIT 1")).first()
+    if has_points or not has_results:
+        return
+    db.session.execute(sqlalchemy.text(
+        "UPDATE league_memberships SET points = "
+        "(SELECT COALESCE(SUM(points), 0) FROM team_results WHERE team_results.user_id = league_memberships.user_id)"
+    ))
+    db.session.commit()
+
+
+def league_standings_per_season(db):
+    """
+    Sposta le classifiche di lega da league_memberships.points (totale di tutte
+    le stagioni) alla tabella league_standings, una riga per (membro, stagione)
+    ricalcolata dai TeamResult della stagione, e rimuove la vecchia colonna
+    """
+    db.create_all()
+    standings.ensure_standings()
+    db.session.commit()
+
+    columns = {c['name'] for c in sqlalchemy.inspect(db.engine).get_columns('league_memberships')}
+    if 'points' in columns:
+        db.session.execute(sqlalchemy.text("DROP INDEX IF EXISTS ix_league_memberships_leaderboard"))
+        db.session.execute(sqlalchemy.text("ALTER TABLE league_memberships DROP COLUMN points"))
         db.session.commit()
-    
-    if Driver.query.count() == 0:
-        # Seed Drivers (griglia 2026)
-        Driver.query.delete()
-        db.session.execute(text("ALTER SEQUENCE drivers_id_seq RESTART WITH 1"))
-
-        drivers_data = [
-            {'num':3,  'name':'Max Verstappen',     'team':'Red Bull Racing',  'price':25.0, 'pts':0, 'color':'#0600FF'},
-            {'num':6,  'name':'Isack Hadjar',       'team':'Red Bull Racing',  'price':9.0,  'pts':0, 'color':'#0600FF'},
-            {'num':1,  'name':'Lando Norris',       'team':'McLaren',          'price':23.0, 'pts':0, 'color':'#FF8700'},
-            {'num':81, 'name':'Oscar Piastri',      'team':'McLaren',          'price':22.0, 'pts':0, 'color':'#FF8700'},
-            {'num':16, 'name':'Charles Leclerc',    'team':'Ferrari',          'price':24.0, 'pts':0, 'color':'#DC0000'},
-            {'num':44, 'name':'Lewis Hamilton',     'team':'Ferrari',          'price':24.0, 'pts':0, 'color':'#DC0000'},
-            {'num':12, 'name':'Kimi Antonelli',     'team':'Mercedes',         'price':15.0, 'pts':0, 'color':'#00D2BE'},
-            {'num':63, 'name':'George Russell',     'team':'Mercedes',         'price':20.0, 'pts':0, 'color':'#00D2BE'},
-            {'num':14, 'name':'Fernando Alonso',    'team':'Aston Martin',     'price':21.0, 'pts':0, 'color':'#006341'},
-            {'num':18, 'name':'Lance Stroll',       'team':'Aston Martin',     'price':18.0, 'pts':0, 'color':'#006341'},
-            {'num':23, 'name':'Alexander Albon',    'team':'Williams',         'price':17.0, 'pts':0, 'color':'#003262'},
-            {'num':55, 'name':'Carlos Sainz Jr.',   'team':'Williams',         'price':21.0, 'pts':0, 'color':'#003262'},
-            {'num':5,  'name':'Gabriel Bortoleto',  'team':'Audi',             'price':16.0, 'pts':0, 'color':'#E5001B'},
-            {'num':27, 'name':'Nico Hülkenberg',    'team':'Audi',             'price':19.0, 'pts':0, 'color':'#E5001B'},
-            {'num':11, 'name':'Sergio Pérez',       'team':'Cadillac',         'price':18.0, 'pts':0, 'color':'#003478'},
-            {'num':77, 'name':'Valtteri Bottas',    'team':'Cadillac',         'price':13.0, 'pts':0, 'color':'#003478'},
-            {'num':31, 'name':'Esteban Ocon',       'team':'Haas',             'price':12.0, 'pts':0, 'color':'#C8102E'},
-            {'num':87, 'name':'Oliver Bearman',     'team':'Haas',             'price':8.0, 'pts':0, 'color':'#C8102E'},
-            {'num':10, 'name':'Pierre Gasly',       'team':'Alpine',           'price':5.0, 'pts':0, 'color':'#0082FA'},
-            {'num':43, 'name':'Franco Colapinto',   'team':'Alpine',           'price':5.0, 'pts':0, 'color':'#0082FA'},
+
+
+def add_season_dimension(db):
+    """
+    Aggiunge la colonna season (e l'indice (season, gp_id)) ai DB creati prima
+    che esistesse, ricavandola dalla data del GP
+    """
+    add_missing_column(db, 'grand_prix', 'season', 'INTEGER')
+    for gp in GrandPrix.query.filter(GrandPrix.season.is_(None)).all():
+        gp.season = gp.date.year
+    db.session.execute(sqlalchemy.text("CREATE INDEX IF NOT EXISTS ix_grand_prix_season ON grand_prix (season)"))
+    db.session.commit()
+
+    for table in SEASON_TABLES:
+        add_missing_column(db, table, 'season', 'INTEGER')
+        db.session.execute(sqlalchemy.text(
+            f"UPDATE {table} SET season = (SELECT season FROM grand_prix WHERE grand_prix.id = {table}.gp_id) "
+            "WHERE season IS NULL"
+        ))
+        db.session.execute(sqlalchemy.text(f"CREATE INDEX IF NOT EXISTS ix_{table}_season_gp ON {table} (season, gp_id)"))
+    db.session.commit()
+
+
+# ============ PARTIZIONI PER STAGIONE (PostgreSQL) ============
+
+def _is_partitioned(db, table):
+    return db.session.execute(sqlalchemy.text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :table AND c.relnamespace = 'public'::regnamespace"
+    ), {'table': table}).first() is not None
+
+
+def _season_partition_ddl(table, season):
+    return f"CREATE TABLE IF NOT EXISTS {table}_{season} PARTITION OF {table} FOR VALUES IN ({season})"
+
+
+def partition_by_season(db):
+    """
+    Converte le tabelle di SEASON_TABLES in tabelle partizionate per stagione
+    (PARTITION BY LIST (season), una partizione per stagione più una DEFAULT).
+    Le query filtrate per season leggono solo la partizione della stagione e le
+    stagioni passate si archiviano staccando la partizione (archive_season).
+    Su SQLite restano tabelle normali con l'indice (season, gp_id).
+
+    Sui DB partizionati la chiave primaria diventa (id, season): le foreign key
+    verso teams.id (team_results, team_picks) non sono più possibili e vengono
+    rimosse; l'integrità è garantita dall'applicazione.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return
+
+    seasons = [row.season for row in db.session.query(GrandPrix.season).distinct() if row.season]
+    metadata = db.Model.metadata
+    for table in SEASON_TABLES:
+        if _is_partitioned(db, table):
+            continue
+        print(f"🗂️  Partizionamento di {table} per stagione")
+        statements = [
+            f"ALTER TABLE {table} RENAME TO {table}_unpartitioned",
+            f"CREATE TABLE {table} (LIKE {table}_unpartitioned INCLUDING DEFAULTS) PARTITION BY LIST (season)",
+            f"ALTER TABLE {table} ALTER COLUMN season SET NOT NULL",
+            *[_season_partition_ddl(table, season) for season in seasons],
+            f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT",
+            f"INSERT INTO {table} SELECT * FROM {table}_unpartitioned",
+            # La sequenza dell'id deve sopravvivere alla vecchia tabella
+            f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id",
+            f"DROP TABLE {table}_unpartitioned CASCADE",
+            f"ALTER TABLE {table} ADD PRIMARY KEY (id, season)",
         ]
-        for driver_data in drivers_data:
-            driver = Driver(
-                id=driver_data['num'],  # Usa il numero del pilota come ID
-                number=driver_data['num'],
-                name=driver_data['name'],
-                team=driver_data['team'],
-                price=driver_data['price'],
-                points=driver_data['pts'],
-                color=driver_data['color']
-            )
-            db.session.add(driver)
+        for fk in metadata.tables[table].foreign_keys:
+            if fk.column.table.name not in SEASON_TABLES:
+                statements.append(
+                    f"ALTER TABLE {table} ADD FOREIGN KEY ({fk.parent.name}) "
+                    f"REFERENCES {fk.column.table.name} ({fk.column.name})"
+                )
+        for statement in statements:
+            db.session.execute(sqlalchemy.text(statement))
+        # Gli indici creati sulla tabella madre valgono per tutte le partizioni
+        for index in metadata.tables[table].indexes:
+            index.create(bind=db.session.connection(), checkfirst=True)
         db.session.commit()
-    
-    if Constructor.query.count() == 0:
-        # Seed Constructors (griglia 2026)
-        Constructor.query.delete()
-        constructors_data = [
-            {'name':'Red Bull Racing',  'price':34.0, 'pts':0, 'color':'#0600FF'},
-            {'name':'McLaren',          'price':45.0, 'pts':0, 'color':'#FF8700'},
-            {'name':'Ferrari',          'price':48.0, 'pts':0, 'color':'#DC0000'},
-            {'name':'Mercedes',         'price':35.0, 'pts':0, 'color':'#00D2BE'},
-            {'name':'Aston Martin',     'price':39.0, 'pts':0, 'color':'#006341'},
-            {'name':'Williams',         'price':38.0, 'pts':0, 'color':'#003262'},
-            {'name':'Audi',             'price':35.0, 'pts':0, 'color':'#FC445A'},
-            {'name':'Cadillac',         'price':31.0, 'pts':0, 'color':'#786200'},
-            {'name':'Haas',             'price':26.0, 'pts':0, 'color':'#7A0404'},
-            {'name':'Alpine',           'price':27.0, 'pts':0, 'color':'#0082FA'},
-            {'name':'Racing Bulls',      'price':12.0, 'pts':0, 'color':'#5C00FA'},
 
-        ]
-        for constructor_data in constructors_data:
-            constructor = Constructor(
-                name=constructor_data['name'],
-                price=constructor_data['price'],
-                points=constructor_data['pts'],
-                color=constructor_data['color']
-            )
-            db.session.add(constructor)
+    for season in seasons:
+        ensure_season_partitions(db, season)
+
+
+def ensure_season_partitions(db, season):
+    """Crea le partizioni di una stagione, spostando le righe finite nella DEFAULT prima che esistessero"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for table in SEASON_TABLES:
+        exists = db.session.execute(sqlalchemy.text("SELECT to_regclass(:name)"), {'name': f'{table}_{season}'}).scalar()
+        if exists:
+            continue
+        db.session.execute(sqlalchemy.text(f"ALTER TABLE {table} DETACH PARTITION {table}_default"))
+        db.session.execute(sqlalchemy.text(_season_partition_ddl(table, season)))
+        db.session.execute(sqlalchemy.text(f"INSERT INTO {table} SELECT * FROM {table}_default WHERE season = :season"), {'season': season})
+        db.session.execute(sqlalchemy.text(f"DELETE FROM {table}_default WHERE season = :season"), {'season': season})
+        db.session.execute(sqlalchemy.text(f"ALTER TABLE {table} ATTACH PARTITION {table}_default DEFAULT"))
+    db.session.commit()
+
+
+def archive_season(db, season):
+    """
+    Archivia una stagione passata nello schema/tabelle archive_*: su PostgreSQL
+    stacca le partizioni (indici della stagione corrente non toccati), su SQLite
+    copia le righe in tabelle archive_<tabella>_<stagione> e le rimuove
+    """
+    postgres = db.engine.dialect.name == 'postgresql'
+    if postgres:
+        db.session.execute(sqlalchemy.text("CREATE SCHEMA IF NOT EXISTS archive"))
+    for table in SEASON_TABLES:
+        if postgres:
+            db.session.execute(sqlalchemy.text(f"ALTER TABLE {table} DETACH PARTITION {table}_{season}"))
+            db.session.execute(sqlalchemy.text(f"ALTER TABLE {table}_{season} SET SCHEMA archive"))
+        else:
+            db.session.execute(sqlalchemy.text(
+                f"CREATE TABLE archive_{table}_{season} AS SELECT * FROM {table} WHERE season = :season"
+            ), {'season': season})
+            db.session.execute(sqlalchemy.text(f"DELETE FROM {table} WHERE season = :season"), {'season': season})
+    db.session.commit()
+    print(f"✅ Stagione {season} archiviata")
+
+
+# ============ DATI DI RIFERIMENTO ============
+
+REFERENCE_DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reference_data.json')
+
+# Tabella -> colonne riallineate al file se la riga esiste già. Prezzi, punti e
+# contatori sono dati di gioco: il file li fornisce solo per le righe nuove
+REFERENCE_TABLES = (
+    ('leagues', League, ('code', 'name')),
+    ('constructors', Constructor, ('name', 'color')),
+    ('drivers', Driver, ('number', 'name', 'team', 'color')),
+    ('grand_prix', GrandPrix, ('season', 'round_num', 'name', 'circuit', 'date', 'fp1_start', 'lock_date')),
+)
+DATETIME_COLUMNS = ('date', 'fp1_start', 'lock_date')
+# Gruppo della cache di ogni sezione del file
+REFERENCE_CACHE_GROUPS = {'leagues': 'leagues', 'constructors': 'constructors', 'drivers': 'drivers', 'grand_prix': 'grandprix'}
+
+
+def upsert_rows(db, model, rows, update_columns):
+    """
+    Un solo INSERT ... ON CONFLICT (id) DO UPDATE per tutte le righe; le righe
+    già uguali al file non vengono riscritte
+
+    Returns:
+        int: righe inserite o modificate
+    """
+    statement = insert_on_conflict(model)
+    changed = sqlalchemy.or_(*(
+        getattr(model, column).is_distinct_from(statement.excluded[column]) for column in update_columns
+    ))
+    return len(db.session.execute(statement.on_conflict_do_update(
+        index_elements=['id'],
+        set_={column: statement.excluded[column] for column in update_columns},
+        where=changed
+    ).returning(model.id), rows).all())
+
+
+def load_reference_data(db, path=REFERENCE_DATA_FILE):
+    """
+    Leghe, scuderie, piloti e calendario da reference_data.json, con un upsert
+    per tabella: le modifiche al file (es. date del calendario) si applicano
+    alle righe esistenti ad ogni avvio. Con il file invariato non scrive nulla:
+    classifiche solo per le stagioni nuove, cache invalidata solo per le tabelle cambiate.
+    """
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+
+    known_seasons = set(db.session.scalars(sqlalchemy.select(GrandPrix.season).distinct()))
+    changed_groups = []
+    for section, model, update_columns in REFERENCE_TABLES:
+        rows = data.get(section) or []
+        if not rows:
+            continue
+        for row in rows:
+            for column in DATETIME_COLUMNS:
+                if isinstance(row.get(column), str):
+                    row[column] = datetime.fromisoformat(row[column])
+        if not upsert_rows(db, model, rows, update_columns):
+            continue
+        changed_groups.append(REFERENCE_CACHE_GROUPS[section])
+        # Id espliciti: su PostgreSQL la sequenza va portata oltre il massimo
+        if db.engine.dialect.name == 'postgresql' and model.__table__.c.id.autoincrement is not False:
+            db.session.execute(sqlalchemy.text(
+                f"SELECT setval(pg_get_serial_sequence('{model.__tablename__}', 'id'), "
+                f"(SELECT MAX(id) FROM {model.__tablename__}))"
+            ))
+    db.session.commit()
+
+    seasons = sorted({gp['season'] for gp in data.get('grand_prix') or []})
+    for season in seasons:
+        ensure_season_partitions(db, season)
+    new_seasons = [season for season in seasons if season not in known_seasons]
+    if new_seasons:
+        # Stagioni nuove del calendario: ogni membro parte da 0 nella classifica
+        for season in new_seasons:
+            standings.ensure_standings(season)
+        db.session.commit()
+        print(f"🏁 Classifiche create per le stagioni {new_seasons}")
+    if changed_groups:
+        # Il file è cambiato: anche i processi già avviati rileggono i dati di riferimento
+        cache.invalidate(*changed_groups)
+
+
+# ============ MIGRAZIONI VERSIONATE ============
+
+MIGRATIONS_LOCK_ID = 48151623  # advisory lock di PostgreSQL: una sola istanza applica le migrazioni
+
+# (versione, nome, funzione(db)): si aggiungono solo in coda, una versione applicata non si modifica
+MIGRATIONS = (
+    (1, 'create_schema', lambda db: db.create_all()),
+    (2, 'league_membership_unique', ensure_league_membership_constraint),
+    (3, 'team_results_rules_version', lambda db: add_missing_column(db, 'team_results', 'rules_version', 'INTEGER')),
+    (4, 'season_dimension', add_season_dimension),
+    (5, 'partition_by_season', partition_by_season),
+    (6, 'backfill_team_picks', lambda db: team_picks.backfill_team_picks()),
+    (7, 'backfill_ownership_counts', lambda db: team_picks.backfill_ownership_counts()),
+    (8, 'fold_league_standings', fold_league_standings),
+    (9, 'league_standings_per_season', league_standings_per_season),
+    (10, 'cache_revisions', lambda db: db.create_all()),
+    (11, 'live_events', lambda db: db.create_all()),
+)
+
+
+def applied_migrations(db):
+    db.session.execute(sqlalchemy.text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations "
+        "(version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+    return {row.version for row in db.session.execute(sqlalchemy.text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations(db):
+    """
+    Applica in ordine le migrazioni non ancora registrate in schema_migrations:
+    all'avvio costa una query se lo schema è aggiornato. Le migrazioni fino
+    alla 8 erano eseguite ad ogni avvio e sono idempotenti, quindi sui DB
+    esistenti vengono solo registrate.
+    """
+    postgres = db.engine.dialect.name == 'postgresql'
+    if postgres:
+        db.session.execute(sqlalchemy.text("SELECT pg_advisory_lock(:id)"), {'id': MIGRATIONS_LOCK_ID})
+    try:
+        applied = applied_migrations(db)
         db.session.commit()
+        for version, name, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            print(f"🔧 Migrazione {version}: {name}")
+            migrate(db)
+            db.session.execute(sqlalchemy.text(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)"
+            ), {'version': version, 'name': name, 'applied_at': datetime.utcnow()})
+            db.session.commit()
+    finally:
+        if postgres:
+            db.session.rollback()
+            db.session.execute(sqlalchemy.text("SELECT pg_advisory_unlock(:id)"), {'id': MIGRATIONS_LOCK_ID})
+            db.session.commit()
+
+
+if __name__ == '__main__':
+    # Uso: python migration.py archive-season <stagione>
+    import sys
+    from factory import create_app
+    from models import db
 
-    return
\ No newline at end of file
+    if len(sys.argv) != 3 or sys.argv[1] != 'archive-season':
+        print("Uso: python migration.py archive-season <stagione>")
+        sys.exit(1)
+    season = int(sys.argv[2])
+    with create_app().app_context():
+        latest = db.session.query(sqlalchemy.func.max(GrandPrix.season)).scalar()
+        if latest is not None and season >= latest:
+            print(f"❌ La stagione {season} non è passata (ultima stagione: {latest})")
+            sys.exit(1)
+        archive_season(db, season)
@@ -1,11 +1,41 @@
 from datetime import datetime, timedelta
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
 from werkzeug.security import generate_password_hash, check_password_hash
 import json
 
 db = SQLAlchemy()
 
+def insert_on_conflict(model):
+    """INSERT che supporta on_conflict_do_nothing/do_update per il dialetto in uso (PostgreSQL o SQLite)"""
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(model)
+
+GENERAL_RANK_GP_ID = 50  # id "GP" della classifica generale di stagione nelle API (non esiste in grand_prix)
+
+# Tabelle con la colonna season: partizionate per stagione su PostgreSQL (migration.partition_by_season)
+SEASON_TABLES = ('teams', 'team_results', 'driver_prices', 'constructor_prices')
+
+_gp_seasons = {}
+
+def season_for_gp(connection, gp_id):
+    """Stagione di un GP (cache in-process: la stagione di un GP non cambia)"""
+    if gp_id not in _gp_seasons:
+        row = connection.execute(select(GrandPrix.season, GrandPrix.date).where(GrandPrix.id == gp_id)).first()
+        if row is None:
+            return None
+        _gp_seasons[gp_id] = row.season or row.date.year
+    return _gp_seasons[gp_id]
+
+def season_of_gp(context):
+    """Default della colonna season: la stagione del GP della riga"""
+    return season_for_gp(context.connection, context.get_current_parameters()['gp_id'])
+
+def season_of_date(context):
+    return context.get_current_parameters()['date'].year
+
 class User(db.Model):
     __tablename__ = 'users'
     
@@ -46,6 +76,7 @@ class GrandPrix(db.Model):
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Use my ID as primary key
     round_num = db.Column(db.Integer, nullable=False)
+    season = db.Column(db.Integer, nullable=True, default=season_of_date, index=True)
     name = db.Column(db.String(120), nullable=False)
     date = db.Column(db.DateTime, nullable=False)
     circuit = db.Column(db.String(120), nullable=False)
@@ -53,55 +84,45 @@ class GrandPrix(db.Model):
     lock_date = db.Column(db.DateTime, nullable=True)
     teams = db.relationship('Team', backref='grand_prix', lazy=True, cascade='all, delete-orphan')
     
-    def to_dict(self):
+    def to_dict(self, current_gp_id=None, setup=None):
         return {
             'id': self.id,
             'round': self.round_num,
+            'season': self.season,
             'name': self.name,
             'date': self.date.isoformat(),
             'circuit': self.circuit,
             'fp1_start': self.fp1_start.isoformat() if self.fp1_start else None,
             'lock_date': self.lock_date.isoformat() if self.lock_date else None,
-            'status': self.get_status() 
+            'status': "current" if self.id == current_gp_id else self.get_status(setup)
         }
     
-    def to_dict(self, current_gp_id=None):
-        return {
-            'id': self.id,
-            'round': self.round_num,
-            'name': self.name,
-            'date': self.date.isoformat(),
-            'circuit': self.circuit,
-            'fp1_start': self.fp1_start.isoformat() if self.fp1_start else None,
-            'lock_date': self.lock_date.isoformat() if self.lock_date else None,
-            'status': "current" if self.id == current_gp_id else self.get_status()
-        }
-    
-    def get_status(self):
+    def get_status(self, setup=None):
         """Determina lo status del GP usando la data fittizia del gioco"""
-        setup = GameState.get_game_date()
+        setup = setup or GameState.get_game_date()
         game_date = datetime.now() + timedelta(hours=setup.offset_hours)
-        gp_date = self.date
-        gp_lock = self.lock_date
-        
-        # Se la gara è passata
-        if game_date >= gp_date:
-            return 'past'
-
-        # Se siamo nel periodo di gara (tra lock e race date)
-        elif gp_lock and game_date >= gp_lock:
-            return 'started'
-        
-        # Se siamo PRIMA del lock_date: solo se dentro 14 giorni dalla race è 'current'
-        # Altrimenti è 'future' (non ancora attivato)
-        elif gp_lock and game_date < gp_lock:
-            days_until_lock = (gp_lock - game_date).days
-            if days_until_lock <= 14:  # Entro 14 giorni dal lock è 'current'
-                return 'current'
-            else:
-                return 'future'
+        return gp_status(self.date, self.lock_date, game_date)
+
+def gp_status(gp_date, gp_lock, game_date):
+    """Status di un GP alla data di gioco (usata anche dai serializer sulle righe)"""
+    # Se la gara è passata
+    if game_date >= gp_date:
+        return 'past'
+
+    # Se siamo nel periodo di gara (tra lock e race date)
+    elif gp_lock and game_date >= gp_lock:
+        return 'started'
+    
+    # Se siamo PRIMA del lock_date: solo se dentro 14 giorni dalla race è 'current'
+    # Altrimenti è 'future' (non ancora attivato)
+    elif gp_lock and game_date < gp_lock:
+        days_until_lock = (gp_lock - game_date).days
+        if days_until_lock <= 14:  # Entro 14 giorni dal lock è 'current'
+            return 'current'
         else:
             return 'future'
+    else:
+        return 'future'
 
 class Driver(db.Model):
     __tablename__ = 'drivers'
@@ -150,10 +171,15 @@ class Team(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     gp_id = db.Column(db.Integer, db.ForeignKey('grand_prix.id'), nullable=False)
+    season = db.Column(db.Integer, nullable=False, default=season_of_gp)
     drivers_json = db.Column(db.Text, nullable=False, default='[]')
     constructors_json = db.Column(db.Text, nullable=False, default='[]')
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     
+    __table_args__ = (
+        db.Index('ix_teams_season_gp', 'season', 'gp_id'),
+    )
+    
     def set_drivers(self, drivers):
         self.drivers_json = json.dumps(drivers)
     
@@ -168,9 +194,11 @@ class Team(db.Model):
     
     def to_dict(self, can_edit=None):
         # Team can be edited if we haven't reached the lock_date yet (using game date)
-        setup = GameState.get_game_date()
-        game_date = datetime.now() + timedelta(hours=setup.offset_hours)
-        can_edit_value = self.grand_prix.lock_date and self.grand_prix.lock_date > game_date if None else can_edit
+        can_edit_value = can_edit
+        if can_edit is None:
+            setup = GameState.get_game_date()
+            game_date = datetime.now() + timedelta(hours=setup.offset_hours)
+            can_edit_value = bool(self.grand_prix.lock_date and self.grand_prix.lock_date > game_date)
         return {
             'id': self.id,
             'gp_id': self.gp_id,
@@ -180,6 +208,36 @@ class Team(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class TeamPick(db.Model):
+    """Indice invertito pilota/scuderia -> team che lo hanno scelto, per GP"""
+    __tablename__ = 'team_picks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    gp_id = db.Column(db.Integer, db.ForeignKey('grand_prix.id'), nullable=False)
+    kind = db.Column(db.String(12), nullable=False)  # 'driver' o 'constructor'
+    entity_id = db.Column(db.Integer, nullable=False)  # numero pilota o ID scuderia
+    
+    __table_args__ = (
+        db.Index('ix_team_picks_entity', 'gp_id', 'kind', 'entity_id'),
+        db.Index('ix_team_picks_team', 'team_id'),
+    )
+
+class OwnershipCount(db.Model):
+    """Contatori per GP: quanti team possiedono ogni pilota/scuderia (kind 'team', entity 0 = numero di team)"""
+    __tablename__ = 'ownership_counts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    gp_id = db.Column(db.Integer, db.ForeignKey('grand_prix.id'), nullable=False)
+    kind = db.Column(db.String(12), nullable=False)  # 'driver', 'constructor' o 'team'
+    entity_id = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('gp_id', 'kind', 'entity_id', name='uq_ownership_counts_gp_kind_entity'),
+    )
+
 class League(db.Model):
     __tablename__ = 'leagues'
     
@@ -206,20 +264,42 @@ class LeagueMembership(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     league_id = db.Column(db.Integer, db.ForeignKey('leagues.id'), nullable=False)
     team_name = db.Column(db.String(120), nullable=False)
-    points = db.Column(db.Integer, default=0)
     position = db.Column(db.Integer, default=0)
     change = db.Column(db.String(10), default='0')
     joined_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    __table_args__ = (
+        # Un utente entra in una lega una sola volta: l'insert di join_league si appoggia a questo vincolo
+        db.UniqueConstraint('user_id', 'league_id', name='uq_league_memberships_user_league'),
+    )
     
-    def to_dict(self):
+    def to_dict(self, rank=None, me=False):
         return {
-            'rank': self.position,
+            'rank': rank if rank is not None else self.position,
             'name': self.user.username,
             'team': self.team_name,
-            'pts': self.points,
             'ch': self.change,
-            'me': False
+            'me': me
         }
+
+class LeagueStanding(db.Model):
+    """Punti di un membro della lega in una stagione (classifica generale), aggiornati a delta dallo scoring"""
+    __tablename__ = 'league_standings'
+
+    id = db.Column(db.Integer, primary_key=True)
+    membership_id = db.Column(db.Integer, db.ForeignKey('league_memberships.id', ondelete='CASCADE'), nullable=False)
+    league_id = db.Column(db.Integer, db.ForeignKey('leagues.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    season = db.Column(db.Integer, nullable=False)
+    points = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('membership_id', 'season', name='uq_league_standings_membership_season'),
+        # Classifica paginata di una stagione (league_id, season, points DESC, membership_id ASC)
+        db.Index('ix_league_standings_leaderboard', 'league_id', 'season', 'points', 'membership_id'),
+        # Aggiornamenti a delta dello scoring, per utente
+        db.Index('ix_league_standings_user_season', 'user_id', 'season'),
+    )
 class TeamResult(db.Model):
     __tablename__ = 'team_results'
     
@@ -227,9 +307,15 @@ class TeamResult(db.Model):
     team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     gp_id = db.Column(db.Integer, db.ForeignKey('grand_prix.id'), nullable=False)
+    season = db.Column(db.Integer, nullable=False, default=season_of_gp)
     points = db.Column(db.Integer, default=0)
+    rules_version = db.Column(db.Integer, nullable=True)  # Versione di ScoringRules usata per il punteggio
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     
+    __table_args__ = (
+        db.Index('ix_team_results_season_gp', 'season', 'gp_id'),
+    )
+    
     team = db.relationship('Team', backref='results')
     user = db.relationship('User', backref='team_results')
     grand_prix = db.relationship('GrandPrix', backref='team_results')
@@ -241,9 +327,91 @@ class TeamResult(db.Model):
             'user_id': self.user_id,
             'gp_id': self.gp_id,
             'points': self.points,
+            'rules_version': self.rules_version,
             'username': self.user.username
         }
 
+class RaceResult(db.Model):
+    """Risultato normalizzato di un pilota in una sessione, salvato al primo fetch da Ergast"""
+    __tablename__ = 'race_results'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    gp_id = db.Column(db.Integer, db.ForeignKey('grand_prix.id'), nullable=False)
+    session = db.Column(db.String(20), nullable=False, default='race')
+    driver_number = db.Column(db.Integer, nullable=False)
+    driver_code = db.Column(db.String(3), nullable=True)
+    constructor_id = db.Column(db.Integer, nullable=False)  # ID nel nostro DB, -1 se sconosciuto
+    constructor_ref = db.Column(db.String(50), nullable=False)  # constructorId di Ergast
+    position = db.Column(db.Integer, nullable=True)
+    position_text = db.Column(db.String(5), nullable=False)  # 'R' ritirato, 'W' non partito, ...
+    status = db.Column(db.String(50), nullable=True)
+    fastest_lap = db.Column(db.Boolean, default=False, nullable=False)
+    fetched_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    
+    grand_prix = db.relationship('GrandPrix', backref='race_results')
+    
+    __table_args__ = (
+        db.UniqueConstraint('gp_id', 'session', 'driver_number', name='uq_race_results_gp_session_driver'),
+    )
+    
+    def to_dict(self):
+        return {
+            'gp_id': self.gp_id,
+            'session': self.session,
+            'driver_number': self.driver_number,
+            'driver_code': self.driver_code,
+            'constructor_id': self.constructor_id,
+            'position': self.position,
+            'position_text': self.position_text,
+            'status': self.status,
+            'fastest_lap': self.fastest_lap
+        }
+
+class ScoringRules(db.Model):
+    """Tabella punti versionata per stagione: una riga per versione, con le regole di ogni sessione"""
+    __tablename__ = 'scoring_rules'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    season = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    rules_json = db.Column(db.Text, nullable=False)  # {sessione: {positions, retired, not_started, driver_floor, fastest_lap}}
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    
+    __table_args__ = (
+        db.UniqueConstraint('season', 'version', name='uq_scoring_rules_season_version'),
+    )
+    
+    def get_rules(self):
+        return json.loads(self.rules_json)
+    
+    def to_dict(self):
+        return {
+            'season': self.season,
+            'version': self.version,
+            'rules': self.get_rules(),
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class LiveEvent(db.Model):
+    """Evento live (SSE) pubblicato dai job, letto da tutti i processi web (events.py)"""
+    __tablename__ = 'live_events'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    data = db.Column(db.Text, nullable=False)  # payload JSON
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_live_events_created_at', 'created_at'),
+    )
+
+class CacheRevision(db.Model):
+    """Revisione di un gruppo della cache in-process (cache.py), condivisa da tutti i processi"""
+    __tablename__ = 'cache_revisions'
+
+    name = db.Column(db.String(50), primary_key=True)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+
 class GameState(db.Model):
     __tablename__ = 'game_state'
     
@@ -276,9 +444,14 @@ class DriverPrices(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     driver_id = db.Column(db.Integer, db.ForeignKey('drivers.id'), nullable=False)
     gp_id = db.Column(db.Integer, db.ForeignKey('grand_prix.id'), nullable=False)
+    season = db.Column(db.Integer, nullable=False, default=season_of_gp)
     price = db.Column(db.Float, nullable=False)
     computed_on = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
     
+    __table_args__ = (
+        db.Index('ix_driver_prices_season_gp', 'season', 'gp_id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -294,9 +467,14 @@ class ConstructorPrices(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     constructor_id = db.Column(db.Integer, db.ForeignKey('constructors.id'), nullable=False)
     gp_id = db.Column(db.Integer, db.ForeignKey('grand_prix.id'), nullable=False)
+    season = db.Column(db.Integer, nullable=False, default=season_of_gp)
     price = db.Column(db.Float, nullable=False)
     computed_on = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
     
+    __table_args__ = (
+        db.Index('ix_constructor_prices_season_gp', 'season', 'gp_id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
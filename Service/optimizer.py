@@ -0,0 +1,159 @@
+"""
+Ottimizzatore del team: dato un budget, il numero di piloti/scuderie e i punti
+attesi di ognuno, trova il team con più punti attesi e le migliori alternative.
+
+Solver esatto branch-and-bound sui piloti e poi sulle scuderie: gli elementi
+sono ordinati per punti attesi decrescenti, quindi il limite superiore di un
+ramo è la somma dei prossimi elementi; i prezzi sono in decimi (interi) per
+non accumulare errori di arrotondamento sul budget.
+"""
+
+from collections import namedtuple
+import heapq
+import itertools
+
+from models import GrandPrix, RaceResult
+from factory import db
+from scheduling import scoring_rules
+from scheduling.race_results import load_session_results
+
+BUDGET = 100
+MAX_BUDGET = 1000
+SQUAD_DRIVERS = 5
+SQUAD_CONSTRUCTORS = 2
+DEFAULT_TOP_K = 5
+MAX_TOP_K = 20
+
+Candidate = namedtuple('Candidate', 'id name price points')
+Solution = namedtuple('Solution', 'points cost drivers constructors')
+
+
+def price_for_gp(entity, gp_id):
+    """
+    Prezzo con cui il client mette a budget pilota/scuderia nel GP: quello
+    calcolato dopo il GP precedente (price_history), altrimenti il prezzo base.
+    Senza GP (stagione finita) vale l'ultimo prezzo calcolato.
+    """
+    history = entity.get('price_history') or []
+    if gp_id is None:
+        return history[0]['price'] if history else entity['price']
+    return next((ph['price'] for ph in history if ph['gp_id'] == gp_id - 1), None) or entity['price']
+
+
+def to_tenths(price):
+    return int(round(price * 10))
+
+
+class _KindSearch:
+    """Elementi di un tipo (piloti o scuderie) ordinati per punti, con i limiti precalcolati"""
+
+    def __init__(self, candidates, slots):
+        self.items = sorted(candidates, key=lambda c: (-c.points, c.price, c.id))
+        self.prices = [to_tenths(c.price) for c in self.items]
+        self.slots = slots
+        n = len(self.items)
+        # best[i][k]: somma dei k punti migliori da i in poi (gli items sono già ordinati)
+        self.best = [[0] * (slots + 1) for _ in range(n + 1)]
+        # cheapest[i][k]: costo minimo di k elementi da i in poi (inf se non ce ne sono abbastanza)
+        self.cheapest = [[0] + [float('inf')] * slots for _ in range(n + 1)]
+        for i in range(n - 1, -1, -1):
+            suffix_prices = sorted(self.prices[i:])
+            for k in range(1, slots + 1):
+                self.best[i][k] = self.best[i + 1][k - 1] + self.items[i].points if n - i >= k else float('-inf')
+                self.cheapest[i][k] = sum(suffix_prices[:k]) if n - i >= k else float('inf')
+        self.best_total = self.best[0][slots] if slots <= n else float('-inf')
+
+
+def solve(drivers, constructors, budget=BUDGET, n_drivers=SQUAD_DRIVERS, n_constructors=SQUAD_CONSTRUCTORS, top_k=DEFAULT_TOP_K):
+    """
+    Le top_k combinazioni (n_drivers piloti, n_constructors scuderie) con più punti
+    attesi entro il budget
+
+    Args:
+        drivers, constructors: liste di Candidate
+
+    Returns:
+        list[Solution] in ordine di punti decrescenti (a parità, costo crescente)
+    """
+    driver_search = _KindSearch(drivers, n_drivers)
+    constructor_search = _KindSearch(constructors, n_constructors)
+    budget = to_tenths(budget)
+    heap = []  # min-heap (punti, -costo, contatore, scelte) delle top_k soluzioni
+    counter = itertools.count()
+
+    def threshold():
+        return heap[0][0] if len(heap) >= top_k else float('-inf')
+
+    def offer(points, cost, chosen_drivers, chosen_constructors):
+        entry = (points, -cost, next(counter), (chosen_drivers, chosen_constructors))
+        if len(heap) < top_k:
+            heapq.heappush(heap, entry)
+        elif entry[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entry)
+
+    def search(kind, i, slots, remaining, points, chosen, on_complete, extra_bound, extra_cost):
+        if slots == 0:
+            on_complete(points, remaining, chosen)
+            return
+        n = len(kind.items)
+        while i < n:
+            # Limite superiore: i prossimi `slots` elementi sono i migliori rimasti
+            if points + kind.best[i][slots] + extra_bound < threshold():
+                return
+            # Budget insufficiente anche scegliendo gli elementi più economici
+            if kind.cheapest[i][slots] + extra_cost > remaining:
+                return
+            if kind.prices[i] <= remaining:
+                search(kind, i + 1, slots - 1, remaining - kind.prices[i], points + kind.items[i].points,
+                       chosen + (kind.items[i],), on_complete, extra_bound, extra_cost)
+            i += 1
+
+    def drivers_done(points, remaining, chosen_drivers):
+        def constructors_done(total, left, chosen_constructors):
+            offer(total, budget - left, chosen_drivers, chosen_constructors)
+        search(constructor_search, 0, n_constructors, remaining, points, (), constructors_done, 0, 0)
+
+    search(driver_search, 0, n_drivers, budget, 0, (), drivers_done,
+           constructor_search.best_total, constructor_search.cheapest[0][n_constructors])
+
+    solutions = []
+    for points, neg_cost, _, (chosen_drivers, chosen_constructors) in sorted(heap, reverse=True):
+        solutions.append(Solution(round(points, 2), -neg_cost / 10, chosen_drivers, chosen_constructors))
+    return solutions
+
+
+def expected_points():
+    """
+    Punti attesi dallo storico: media per GP dei punti di ogni pilota e scuderia
+    sui risultati salvati, con le regole di punteggio correnti della stagione
+
+    Returns:
+        tuple: (dict numero pilota -> punti, dict id scuderia -> punti)
+    """
+    gp_ids = [row.gp_id for row in db.session.query(RaceResult.gp_id).filter_by(session='race').distinct()]
+    if not gp_ids:
+        return {}, {}
+
+    driver_totals = None
+    constructor_totals = None
+    for gp in GrandPrix.query.filter(GrandPrix.id.in_(gp_ids)).all():
+        results_by_session = load_session_results(gp.id)
+        rules = scoring_rules.get_rules(gp.season)
+        driver_scores, constructor_scores = scoring_rules.entity_scores(results_by_session, rules)
+        driver_totals = driver_scores if driver_totals is None else driver_totals + driver_scores
+        constructor_totals = constructor_scores if constructor_totals is None else constructor_totals + constructor_scores
+
+    n = len(gp_ids)
+    return (
+        {number: float(total) / n for number, total in enumerate(driver_totals) if total},
+        {constructor_id: float(total) / n for constructor_id, total in enumerate(constructor_totals) if total}
+    )
+
+
+def solution_to_dict(solution):
+    return {
+        'points': solution.points,
+        'cost': solution.cost,
+        'drivers': [candidate._asdict() for candidate in solution.drivers],
+        'constructors': [candidate._asdict() for candidate in solution.constructors]
+    }
@@ -0,0 +1,308 @@
+"""
+Proiezione Monte Carlo della classifica di una lega: a partire dai punti attuali
+dei membri, simula i GP rimanenti, li valuta con la tabella punti della stagione
+e conta quante volte ogni membro vince la lega o finisce sul podio.
+
+Modello degli esiti (configurabile):
+- 'form': ordine di arrivo Plackett-Luce con forza dalla posizione media e probabilità
+  di ritiro per pilota, dalle gare della stagione (race_results) pesate per recenza
+- 'uniform': tutti i piloti equivalenti, stessa probabilità di ritiro
+
+Le simulazioni sono divise in blocchi su un pool di processi, avviato con il
+worker web (start_pool, hook post_worker_init di gunicorn); ogni membro corre
+i GP rimanenti con l'ultimo team salvato.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+import numpy as np
+from sqlalchemy import func
+
+from models import Constructor, Driver, GrandPrix, LeagueMembership, LeagueStanding, RaceResult, Team
+from factory import db
+from scheduling import scoring_rules
+
+MODELS = ('form', 'uniform')
+DEFAULT_SIMULATIONS = 10000
+MAX_SIMULATIONS = 100000
+DEFAULT_DNF_RATE = 0.1
+FORM_SPREAD = 3.0  # posizioni medie: più è alto, più le gare sono aperte
+FORM_HALF_LIFE = 5  # GP: il peso di una gara si dimezza ogni 5 gare più vecchie
+CHUNK_SIZE = 2500
+BATCH_SIZE = 500  # simulazioni per passaggio vettoriale dentro un blocco
+POOL_WORKERS = os.cpu_count() or 1
+
+_pool = None
+
+
+def get_pool():
+    """
+    Pool di processi condiviso (creato da start_pool, o al primo uso). Processi 'spawn':
+    non ereditano dal worker web l'hub gevent, i moduli patchati e le connessioni al DB
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _warm_up(_):
+    return os.getpid()
+
+
+def start_pool():
+    """
+    Crea il pool e avvia i suoi processi (import di numpy e dei moduli compresi),
+    così la prima proiezione non paga l'avvio dentro una richiesta web
+    """
+    pool = get_pool()
+    pids = set(pool.map(_warm_up, range(POOL_WORKERS)))
+    print(f"🎲 Pool della proiezione avviato: {len(pids)} processi")
+    return pool
+
+
+# ============ DATI DAL DB ============
+
+def remaining_gp_count(season):
+    """GP della stagione senza risultati di gara salvati"""
+    scored = db.session.query(RaceResult.gp_id).filter_by(session='race').distinct()
+    return GrandPrix.query.filter(
+        GrandPrix.season == season,
+        ~GrandPrix.id.in_(scored)
+    ).count()
+
+
+def load_members(league_id, season):
+    """Membri della lega con i punti della stagione e le scelte dell'ultimo team salvato nella stagione"""
+    memberships = db.session.query(
+        LeagueMembership.user_id, LeagueMembership.team_name, LeagueStanding.points
+    ).join(LeagueStanding, LeagueStanding.membership_id == LeagueMembership.id).filter(
+        LeagueMembership.league_id == league_id,
+        LeagueStanding.season == season
+    ).order_by(LeagueMembership.id).all()
+    user_ids = [m.user_id for m in memberships]
+
+    latest = db.session.query(Team.user_id, func.max(Team.gp_id).label('gp_id')).filter(
+        Team.season == season, Team.user_id.in_(user_ids)
+    ).group_by(Team.user_id).subquery()
+    teams = Team.query.join(latest, (Team.user_id == latest.c.user_id) & (Team.gp_id == latest.c.gp_id)).filter(
+        Team.season == season
+    ).all()
+    teams_by_user = {team.user_id: team for team in teams}
+
+    picks = []
+    for membership in memberships:
+        team = teams_by_user.get(membership.user_id)
+        drivers = [d['id'] for d in team.get_drivers()] if team else []
+        constructors = [c['id'] for c in team.get_constructors()] if team else []
+        picks.append((drivers, constructors))
+    return memberships, picks
+
+
+def form_stats(season):
+    """
+    Posizione media, partenze e ritiri per pilota nelle gare della stagione (o,
+    prima della prima gara, dell'ultima stagione con risultati), pesati per
+    recenza: il peso di una gara si dimezza ogni FORM_HALF_LIFE gare
+
+    Returns:
+        dict: numero pilota -> (posizione media o None, partenze pesate, ritiri pesati)
+    """
+    form_season = db.session.query(func.max(GrandPrix.season)).join(RaceResult, RaceResult.gp_id == GrandPrix.id).filter(
+        RaceResult.session == 'race', GrandPrix.season <= season
+    ).scalar()
+    if form_season is None:
+        return {}
+    rows = db.session.query(
+        RaceResult.driver_number, RaceResult.position, RaceResult.position_text, GrandPrix.round_num
+    ).join(GrandPrix, GrandPrix.id == RaceResult.gp_id).filter(
+        RaceResult.session == 'race', GrandPrix.season == form_season
+    ).all()
+
+    last_round = max(row.round_num for row in rows)
+    totals = {}
+    for number, position, position_text, round_num in rows:
+        weight = 0.5 ** ((last_round - round_num) / FORM_HALF_LIFE)
+        position_sum, position_weight, starts, retired = totals.get(number, (0.0, 0.0, 0.0, 0.0))
+        if position is not None:
+            position_sum += weight * position
+            position_weight += weight
+        totals[number] = (position_sum, position_weight, starts + weight,
+                          retired + (weight if position_text in ('R', 'W') else 0.0))
+    return {
+        number: (position_sum / position_weight if position_weight else None, starts, retired)
+        for number, (position_sum, position_weight, starts, retired) in totals.items()
+    }
+
+
+def load_field(model, season, dnf_rate=None):
+    """
+    Piloti in griglia con scuderia, forza (log) e probabilità di ritiro
+
+    Returns:
+        tuple: (numeri pilota, id scuderia per pilota, log forza, probabilità di ritiro)
+    """
+    numbers = [number for number, in db.session.query(Driver.number).order_by(Driver.number)]
+    latest_gp = db.session.query(func.max(RaceResult.gp_id)).filter_by(session='race').scalar()
+
+    # Scuderia attuale di ogni pilota dall'ultima gara salvata, altrimenti dal nome del team
+    constructor_of = {}
+    if latest_gp:
+        for number, constructor_id in db.session.query(RaceResult.driver_number, RaceResult.constructor_id).filter_by(
+            gp_id=latest_gp, session='race'
+        ):
+            constructor_of[number] = constructor_id
+    if len(constructor_of) < len(numbers):
+        constructor_ids = {c.name: c.id for c in Constructor.query.all()}
+        for driver in Driver.query.all():
+            constructor_of.setdefault(driver.number, constructor_ids.get(driver.team, -1))
+    constructors = np.array([constructor_of.get(number, -1) for number in numbers], dtype=np.int64)
+
+    log_strength = np.zeros(len(numbers))
+    dnf = np.full(len(numbers), DEFAULT_DNF_RATE if dnf_rate is None else dnf_rate)
+    if model == 'form':
+        stats = form_stats(season)
+        if stats:
+            field_average = np.mean([s[0] for s in stats.values() if s[0] is not None] or [len(numbers) / 2])
+            for i, number in enumerate(numbers):
+                average, starts, retired = stats.get(number, (None, 0.0, 0.0))
+                log_strength[i] = -(average if average is not None else field_average) / FORM_SPREAD
+                if dnf_rate is None:
+                    # Media pesata ammorbidita verso il valore di default (10 gare "virtuali")
+                    dnf[i] = (retired + DEFAULT_DNF_RATE * 10) / (starts + 10)
+    return numbers, constructors, log_strength, dnf
+
+
+# ============ SIMULAZIONE (nei processi del pool) ============
+
+def simulate_chunk(n_simulations, seed, n_gps, current_points, team_drivers, team_constructors,
+                   driver_constructor, log_strength, dnf_rate, driver_points, constructor_points, fastest_lap):
+    """
+    Simula n_simulations stagioni: ritorna (vittorie, podi) per membro.
+    Funzione pura sugli array (niente DB), eseguita nei processi del pool.
+
+    Args:
+        team_drivers, team_constructors: matrici [membri, piloti] / [membri, scuderie] con le scelte
+        driver_constructor: indice scuderia (colonna di team_constructors) per pilota, -1 se sconosciuta
+        driver_points, constructor_points: array [codice posizione] -> punti
+    """
+    rng = np.random.default_rng(seed)
+    n_members, n_drivers = team_drivers.shape
+    n_constructors = team_constructors.shape[1]
+    wins = np.zeros(n_members, dtype=np.int64)
+    podiums = np.zeros(n_members, dtype=np.int64)
+
+    known = driver_constructor >= 0
+    to_constructor = np.zeros((n_drivers, n_constructors))
+    to_constructor[np.flatnonzero(known), driver_constructor[known]] = 1.0
+    positions = np.arange(1, n_drivers + 1)
+    positions = np.where(positions <= scoring_rules.MAX_POSITION, positions, scoring_rules.UNCLASSIFIED)
+
+    done = 0
+    while done < n_simulations:
+        batch = min(BATCH_SIZE, n_simulations - done)
+        rows = np.arange(batch)[:, None]
+        totals = np.tile(current_points.astype(np.float64), (batch, 1))
+        for _ in range(n_gps):
+            # Plackett-Luce con il trucco di Gumbel: ordinare forza + rumore di Gumbel
+            keys = log_strength + rng.gumbel(size=(batch, n_drivers))
+            retired = rng.random((batch, n_drivers)) < dnf_rate
+            keys[retired] = -np.inf
+            order = np.argsort(-keys, axis=1)
+            codes = np.empty((batch, n_drivers), dtype=np.int64)
+            codes[rows, order] = positions
+            codes[retired] = scoring_rules.RETIRED
+
+            points = driver_points[codes].astype(np.float64)
+            fastest = np.argmax(np.where(retired, -1.0, rng.random((batch, n_drivers))), axis=1)
+            points[np.arange(batch), fastest] += fastest_lap
+            constructor_totals = constructor_points[codes].astype(np.float64) @ to_constructor
+
+            totals += points @ team_drivers.T + constructor_totals @ team_constructors.T
+
+        # Parità risolte a caso
+        totals += rng.random(totals.shape) * 1e-3
+        np.add.at(wins, np.argmax(totals, axis=1), 1)
+        top = min(3, n_members)
+        podium = np.argpartition(-totals, top - 1, axis=1)[:, :top]
+        np.add.at(podiums, podium.ravel(), 1)
+        done += batch
+    return wins, podiums
+
+
+def _run_chunk(args):
+    return simulate_chunk(*args)
+
+
+# ============ PROIEZIONE ============
+
+def project_league(league_id, season, simulations=DEFAULT_SIMULATIONS, model='form', dnf_rate=None):
+    """
+    Probabilità di vittoria e di podio di ogni membro della lega nella stagione
+
+    Returns:
+        dict con gp rimanenti, simulazioni e lista membri ordinata per probabilità di vittoria
+    """
+    memberships, picks = load_members(league_id, season)
+    if not memberships:
+        return None
+
+    n_gps = remaining_gp_count(season)
+    numbers, constructors, log_strength, dnf = load_field(model, season, dnf_rate)
+    driver_index = {number: i for i, number in enumerate(numbers)}
+    constructor_ids = sorted({c for c in constructors if c >= 0} | {c for _, cs in picks for c in cs})
+    constructor_index = {constructor_id: i for i, constructor_id in enumerate(constructor_ids)}
+
+    team_drivers = np.zeros((len(memberships), len(numbers)))
+    team_constructors = np.zeros((len(memberships), len(constructor_ids)))
+    for m, (drivers, team_ctors) in enumerate(picks):
+        for number in drivers:
+            if number in driver_index:
+                team_drivers[m, driver_index[number]] += 1
+        for constructor_id in team_ctors:
+            team_constructors[m, constructor_index[constructor_id]] += 1
+    driver_constructor = np.array([constructor_index.get(c, -1) for c in constructors], dtype=np.int64)
+
+    race_rules = scoring_rules.get_rules(season).sessions['race']
+    current_points = np.array([m.points or 0 for m in memberships], dtype=np.float64)
+
+    wins = np.zeros(len(memberships), dtype=np.int64)
+    podiums = np.zeros(len(memberships), dtype=np.int64)
+    if n_gps == 0:
+        # Stagione finita: la classifica è quella attuale
+        order = np.argsort(-current_points, kind='stable')
+        wins[order[0]] = simulations
+        podiums[order[:3]] = simulations
+    else:
+        seeds = np.random.SeedSequence().spawn((simulations + CHUNK_SIZE - 1) // CHUNK_SIZE)
+        chunks = [
+            (min(CHUNK_SIZE, simulations - i * CHUNK_SIZE), seed, n_gps, current_points, team_drivers,
+             team_constructors, driver_constructor, log_strength, dnf, race_rules.driver_points,
+             race_rules.constructor_points, race_rules.fastest_lap)
+            for i, seed in enumerate(seeds)
+        ]
+        for chunk_wins, chunk_podiums in get_pool().map(_run_chunk, chunks):
+            wins += chunk_wins
+            podiums += chunk_podiums
+
+    members = [
+        {
+            'user_id': membership.user_id,
+            'team_name': membership.team_name,
+            'points': membership.points or 0,
+            'win_probability': round(float(wins[m]) / simulations, 4),
+            'podium_probability': round(float(podiums[m]) / simulations, 4),
+        }
+        for m, membership in enumerate(memberships)
+    ]
+    members.sort(key=lambda member: (-member['win_probability'], -member['podium_probability'], -member['points']))
+    return {
+        'league_id': league_id,
+        'season': season,
+        'model': model,
+        'simulations': simulations,
+        'remaining_gps': n_gps,
+        'members': members
+    }
@@ -0,0 +1,103 @@
+"""
+Profiler SQL per richiesta: conta le query e il tempo passato nel DB tramite
+gli eventi di SQLAlchemy, e segnala gli N+1 (stessa query ripetuta con
+parametri diversi).
+
+Fuori produzione (app in debug o QUERY_PROFILER=1) ogni risposta ha gli header
+X-DB-Queries e X-DB-Time-ms e gli N+1 vengono stampati nel log.
+Per i test: `with assert_max_queries(3): client.get(...)`.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+import os
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+REPEATED_THRESHOLD = 5  # stessa query ripetuta almeno N volte nella richiesta = probabile N+1
+
+_local = threading.local()
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def repeated(self, threshold=REPEATED_THRESHOLD):
+        """Query ripetute almeno `threshold` volte, dalla più frequente"""
+        return [(statement, n) for statement, n in self.statements.most_common() if n >= threshold]
+
+
+def _active_stats():
+    """Statistiche da aggiornare: quella della richiesta e quelle dei blocchi assert_max_queries aperti"""
+    stats = list(getattr(_local, 'budgets', ()))
+    if has_request_context() and '_query_stats' in g:
+        stats.append(g._query_stats)
+    return stats
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    for stats in _active_stats():
+        stats.count += 1
+        stats.seconds += elapsed
+        # Lo statement è già parametrizzato: testo uguale = stessa forma
+        stats.statements[statement] += 1
+
+
+def profiling_enabled(app):
+    return app.debug or os.getenv('QUERY_PROFILER') == '1'
+
+
+def init_app(app):
+    """Registra i contatori per richiesta sull'app"""
+
+    @app.before_request
+    def _start_query_stats():
+        g._query_stats = QueryStats()
+
+    @app.after_request
+    def _report_query_stats(response):
+        stats = g.pop('_query_stats', None)
+        if stats is None or not profiling_enabled(current_app):
+            return response
+        response.headers['X-DB-Queries'] = str(stats.count)
+        response.headers['X-DB-Time-ms'] = f'{stats.seconds * 1000:.1f}'
+        for statement, n in stats.repeated():
+            print(f"⚠️  N+1 in {request.method} {request.path}: {n}x {' '.join(statement.split())[:200]}", flush=True)
+        return response
+
+
+@contextmanager
+def assert_max_queries(budget, allow_repeated=False):
+    """
+    Fallisce se nel blocco vengono eseguite più di `budget` query
+    (o, con allow_repeated=False, se una query si ripete come un N+1)
+    """
+    stats = QueryStats()
+    budgets = getattr(_local, 'budgets', None)
+    if budgets is None:
+        budgets = _local.budgets = []
+    budgets.append(stats)
+    try:
+        yield stats
+    finally:
+        budgets.remove(stats)
+
+    details = '\n'.join(f"  {n}x {' '.join(s.split())[:200]}" for s, n in stats.statements.most_common(5))
+    assert stats.count <= budget, f"{stats.count} query eseguite, budget {budget}:\n{details}"
+    if not allow_repeated:
+        repeated = stats.repeated()
+        assert not repeated, f"Query ripetute (N+1): {repeated[0][1]}x {' '.join(repeated[0][0].split())[:200]}"
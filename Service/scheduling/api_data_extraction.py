@@ -1,61 +1,130 @@
+# Schedule module
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import os
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Per i test e i benchmark offline: ERGAST_BASE_URL=http://127.0.0.1:8001 (scheduling.ergast_server)
+ERGAST_BASE_URL = os.getenv('ERGAST_BASE_URL') or 'https://api.jolpi.ca/ergast/f1'
+ERGAST_SEASON = os.getenv('ERGAST_SEASON') or 'current'  # 'current' o un anno
+MAX_CONNECTIONS_PER_HOST = 3
+REQUEST_TIMEOUT = 10
+REQUEST_RETRIES = 3  # errori 429/5xx transitori, con backoff esponenziale
+
+# Sessione -> (endpoint Ergast, chiave della lista di risultati nella gara)
+SESSION_ENDPOINTS = {
+    'race': ('results', 'Results'),
+    'sprint': ('sprint', 'SprintResults'),
+    'qualifying': ('qualifying', 'QualifyingResults'),
+}
+
+# Weekend con tutte le sessioni: dict sessione -> lista di risultati Ergast
+Weekend = namedtuple('Weekend', 'round date race_name race sessions')
+
+_http = None
+
+
+def get_http_session():
+    """Sessione HTTP condivisa: al massimo MAX_CONNECTIONS_PER_HOST connessioni per host"""
+    global _http
+    if _http is None:
+        retry = Retry(total=REQUEST_RETRIES, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=('GET',))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONNECTIONS_PER_HOST, pool_block=True,
+                              max_retries=retry)
+        _http = requests.Session()
+        _http.mount('http://', adapter)
+        _http.mount('https://', adapter)
+    return _http
+
+
+def session_url(session, weekend_id=None):
+    endpoint = SESSION_ENDPOINTS[session][0]
+    return f'{ERGAST_BASE_URL}/{ERGAST_SEASON}/{weekend_id or "last"}/{endpoint}.json'
+
+
+def validate_session(session, race):
+    """Controlla che ogni risultato abbia i campi usati dallo scoring, ritorna la lista di risultati"""
+    results = race.get(SESSION_ENDPOINTS[session][1])
+    if not isinstance(results, list) or not results:
+        raise ValueError(f"{session}: nessun risultato")
+    for result in results:
+        driver = result.get('Driver') or {}
+        if not (driver.get('permanentNumber') or result.get('number')):
+            raise ValueError(f"{session}: pilota senza numero ({driver.get('code')})")
+        if not (result.get('Constructor') or {}).get('constructorId'):
+            raise ValueError(f"{session}: scuderia mancante per {driver.get('code')}")
+        if 'position' not in result:
+            raise ValueError(f"{session}: posizione mancante per {driver.get('code')}")
+    return results
+
+
+def fetch_session(session, weekend_id=None):
+    """Scarica una sessione; ritorna la gara Ergast o None se la sessione non esiste"""
+    response = get_http_session().get(session_url(session, weekend_id), timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    races = data.get('MRData', {}).get('RaceTable', {}).get('Races')
+    if not races:
+        return None
+    return races[0]
+
+
+def fetch_weekend(weekend_id=None, sessions=tuple(SESSION_ENDPOINTS)):
+    """
+    Scarica in parallelo tutte le sessioni del weekend e le valida.
+    La gara è obbligatoria; sprint e qualifiche sono facoltative (weekend senza sprint,
+    sessione non ancora pubblicata) e vengono scartate se appartengono a un altro round.
+    Un errore di rete/HTTP su una sessione qualsiasi non vale come "sessione assente":
+    il weekend è incompleto e non viene caricato, così il job successivo lo riscarica.
+
+    Returns:
+        Weekend oppure None se la gara non è disponibile o non valida, o il weekend è incompleto
+    """
+    with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+        futures = {session: pool.submit(fetch_session, session, weekend_id) for session in sessions}
+
+    races = {}
+    failed = []
+    for session, future in futures.items():
+        try:
+            races[session] = future.result()
+        except Exception as e:
+            print(f"❌ Errore nel caricamento {session} da Ergast API: {e}")
+            failed.append(session)
+
+    if failed:
+        print(f"⏳ Weekend incompleto ({', '.join(failed)} non scaricate): da riprovare")
+        return None
+
+    race = races.get('race')
+    if not race:
+        print("❌ Nessun risultato disponibile")
+        return None
+
+    weekend_sessions = {}
+    for session, session_race in races.items():
+        if not session_race:
+            continue
+        if session_race.get('round') != race.get('round'):
+            # Con 'last' l'ultima sprint può essere di un weekend precedente
+            continue
+        try:
+            weekend_sessions[session] = validate_session(session, session_race)
+        except ValueError as e:
+            print(f"❌ Payload non valido: {e}")
+            if session == 'race':
+                return None
+
+    print(f"✅ Caricato weekend: {race['raceName']} ({race['date']}) - sessioni: {', '.join(weekend_sessions)}")
+    return Weekend(race.get('round'), race.get('date'), race.get('raceName'), race, weekend_sessions)
 
 
 def get_race(weekend_id=None):
     """Ottiene il risultato della gara più recente da Ergast API"""
-    try:
-        url = f'https://api.jolpi.ca/ergast/f1/current/{weekend_id}/results.json' if weekend_id else 'https://api.jolpi.ca/ergast/f1/current/last/results.json'
-
-        if weekend_id == 100:
-            #testing api
-            url = f'https://api.jolpi.ca/ergast/f1/2025/11/results.json'
-
-        response = requests.get(url, timeout=10)
-        data = response.json()
-        #print(data)  # Debug: mostra la risposta completa
-        
-        if 'MRData' not in data or 'RaceTable' not in data['MRData']:
-            print("❌ Nessuna gara trovata su Ergast API")
-            return None
-        
-        races = data['MRData']['RaceTable']['Races']
-        if not races:
-            print("❌ Nessun risultato disponibile")
-            return None
-        
-        race = races[0]
-        print(f"✅ Caricata gara: {race['raceName']} ({race['date']})")
-        return race
-    except Exception as e:
-        print(f"❌ Errore nel caricamento da Ergast API: {e}")
-        return None
-    
-# def get_quali(weekend_id=None):
-#     """Ottiene il risultato delle qualifiche gara più recente da Ergast API"""
-#     try:
-#         url = f'https://api.jolpi.ca/ergast/f1/current/{weekend_id}/qualifying.json' if weekend_id else 'https://api.jolpi.ca/ergast/f1/current/last/qualifying.json'
-
-#         if weekend_id == 100:
-#             #testing api
-#             url = f'https://api.jolpi.ca/ergast/f1/2025/11/qualifying.json'
-
-#         response = requests.get(url, timeout=10)
-#         data = response.json()
-#         #print(data)  # Debug: mostra la risposta completa
-        
-#         if 'MRData' not in data or 'RaceTable' not in data['MRData']:
-#             print("❌ Nessuna qualifica gara trovata su Ergast API")
-#             return None
-        
-#         races = data['MRData']['RaceTable']['Races']  # ????
-#         if not races:
-#             print("❌ Nessun risultato qualifica disponibile")
-#             return None
-        
-#         race = races[0]
-#         print(f"✅ Caricata gara: {race['raceName']} ({race['date']})")
-#         return race
-#     except Exception as e:
-#         print(f"❌ Errore nel caricamento da Ergast API: {e}")
-#         return None
\ No newline at end of file
+    weekend = fetch_weekend(weekend_id, sessions=('race',))
+    return weekend.race if weekend else None
@@ -0,0 +1,90 @@
+"""
+Fantasy F1 Archive Job
+Esporta risultati, scelte dei team e prezzi della stagione nell'archivio
+colonnare (season_archive) dopo ogni scoring
+"""
+
+from datetime import datetime
+import json
+
+from sqlalchemy import func
+
+from models import Team, TeamResult, GrandPrix, DriverPrices, ConstructorPrices
+from factory import db
+import season_archive
+
+BATCH_SIZE = 5000
+
+
+def season_gp_ids(season):
+    """Id dei GP della stagione"""
+    return [row.id for row in db.session.query(GrandPrix.id).filter_by(season=season).all()]
+
+
+def current_season():
+    """Ultima stagione del calendario"""
+    season = db.session.query(func.max(GrandPrix.season)).scalar()
+    return season or datetime.utcnow().year
+
+
+def export_team_results(season, gp_ids):
+    columns = {'team_id': [], 'user_id': [], 'gp_id': [], 'points': []}
+    rows = db.session.query(
+        TeamResult.team_id, TeamResult.user_id, TeamResult.gp_id, TeamResult.points
+    ).filter(TeamResult.season == season, TeamResult.gp_id.in_(gp_ids)).order_by(TeamResult.team_id).yield_per(BATCH_SIZE)
+    for row in rows:
+        columns['team_id'].append(row.team_id)
+        columns['user_id'].append(row.user_id)
+        columns['gp_id'].append(row.gp_id)
+        columns['points'].append(row.points or 0)
+    return columns
+
+
+def export_team_picks(season, gp_ids):
+    """Una riga per ogni pilota/scuderia scelto: unico punto in cui si decodifica il JSON dei team"""
+    drivers = {'team_id': [], 'user_id': [], 'gp_id': [], 'entity_id': []}
+    constructors = {'team_id': [], 'user_id': [], 'gp_id': [], 'entity_id': []}
+    rows = db.session.query(
+        Team.id, Team.user_id, Team.gp_id, Team.drivers_json, Team.constructors_json
+    ).filter(Team.season == season, Team.gp_id.in_(gp_ids)).order_by(Team.id).yield_per(BATCH_SIZE)
+    for row in rows:
+        for picks, entities in ((drivers, json.loads(row.drivers_json)), (constructors, json.loads(row.constructors_json))):
+            for entity in entities:
+                picks['team_id'].append(row.id)
+                picks['user_id'].append(row.user_id)
+                picks['gp_id'].append(row.gp_id)
+                picks['entity_id'].append(entity['id'])
+    return drivers, constructors
+
+
+def export_prices(model, entity_column, season, gp_ids):
+    columns = {'entity_id': [], 'gp_id': [], 'price': []}
+    rows = db.session.query(entity_column, model.gp_id, model.price).filter(
+        model.season == season, model.gp_id.in_(gp_ids)
+    ).order_by(entity_column, model.gp_id)
+    for entity_id, gp_id, price in rows:
+        columns['entity_id'].append(entity_id)
+        columns['gp_id'].append(gp_id)
+        columns['price'].append(price)
+    return columns
+
+
+def run_archive_job(app, season=None):
+    """Esporta l'archivio della stagione (default: stagione del calendario corrente)"""
+    with app.app_context():
+        season = season or current_season()
+        gp_ids = season_gp_ids(season)
+        print(f"🗄️  Export archivio stagione {season} ({len(gp_ids)} GP)")
+
+        driver_picks, constructor_picks = export_team_picks(season, gp_ids)
+        version = season_archive.write_archive(season, {
+            'team_results': export_team_results(season, gp_ids),
+            'driver_picks': driver_picks,
+            'constructor_picks': constructor_picks,
+            'driver_prices': export_prices(DriverPrices, DriverPrices.driver_id, season, gp_ids),
+            'constructor_prices': export_prices(ConstructorPrices, ConstructorPrices.constructor_id, season, gp_ids),
+        })
+
+        message = f"✅ Archivio stagione {season} scritto ({version})"
+        print(message)
+        return message
@@ -0,0 +1,342 @@
+"""
+Server locale compatibile con Ergast, per eseguire e misurare scoring, pricing
+e archivio senza rete: risponde agli stessi URL usati da api_data_extraction
+(/<stagione|current>/<round|last>/<results|sprint|qualifying>.json).
+
+Serve payload registrati (--recorded, file <dir>/<stagione>/<round>/<endpoint>.json,
+scaricabili con --record) oppure stagioni sintetiche deterministiche con griglia,
+ritiri e weekend sprint configurabili. Latenza ed errori HTTP iniettabili per
+provare i retry e il comportamento dei job sotto carico.
+
+Uso:
+    python -m scheduling.ergast_server --port 8001 --rounds 19 --sprint-rounds 3,4,16,18 --dnf-rate 0.1
+    ERGAST_BASE_URL=http://127.0.0.1:8001 python app.py
+
+    python -m scheduling.ergast_server --record recorded/ --season 2025 --rounds 24
+    python -m scheduling.ergast_server --recorded recorded/ --current-season 2025
+"""
+
+from collections import namedtuple
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+
+from .race_results import CONSTRUCTOR_MAPPING
+from .scoring_rules import MAX_DRIVER_NUMBER, MAX_POSITION
+
+REFERENCE_DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'reference_data.json')
+UPSTREAM_URL = 'https://api.jolpi.ca/ergast/f1'
+ENDPOINTS = {'results': 'Results', 'sprint': 'SprintResults', 'qualifying': 'QualifyingResults'}
+PATH_PATTERN = re.compile(r'/(current|\d{4})/(last|\d+)/(results|sprint|qualifying)\.json$')
+
+FORM_SPREAD = 4.0  # posizioni in griglia: più è alto, più gli arrivi sono casuali
+RACE_POINTS = (25, 18, 15, 12, 10, 8, 6, 4, 2, 1)
+SPRINT_POINTS = (8, 7, 6, 5, 4, 3, 2, 1)
+RETIREMENTS = ('Accident', 'Collision', 'Engine', 'Gearbox', 'Hydraulics', 'Power Unit', 'Spun off')
+
+GridDriver = namedtuple('GridDriver', 'number code name constructor_ref constructor_name')
+
+
+def load_reference_data(path=REFERENCE_DATA_FILE):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_grid(size, reference):
+    """
+    Griglia di `size` piloti: quelli di reference_data.json nell'ordine del file,
+    poi piloti sintetici con numeri liberi distribuiti sulle scuderie
+    """
+    if not 1 <= size <= MAX_POSITION:
+        raise ValueError(f'La griglia deve avere da 1 a {MAX_POSITION} piloti')
+    constructor_names = {c['id']: c['name'] for c in reference['constructors']}
+    constructor_ids = {c['name']: c['id'] for c in reference['constructors']}
+    refs = {constructor_id: ref for ref, constructor_id in CONSTRUCTOR_MAPPING.items()}
+
+    grid = []
+    for driver in reference['drivers'][:size]:
+        constructor_id = constructor_ids.get(driver['team'])
+        code = ''.join(c for c in driver['name'].split()[-1].upper() if c.isalpha())[:3]
+        grid.append(GridDriver(driver['number'], code, driver['name'], refs.get(constructor_id, 'unknown'), driver['team']))
+
+    used = {d.number for d in grid}
+    free_numbers = (n for n in range(2, MAX_DRIVER_NUMBER) if n not in used)
+    ordered_refs = sorted(refs.items())
+    while len(grid) < size:
+        number = next(free_numbers)
+        constructor_id, ref = ordered_refs[len(grid) % len(ordered_refs)]
+        grid.append(GridDriver(number, f'S{number:02d}', f'Synthetic Driver {number}', ref,
+                               constructor_names.get(constructor_id, ref)))
+    return grid
+
+
+class SyntheticSeason:
+    """Risultati deterministici per (seed, stagione, round, sessione)"""
+
+    def __init__(self, grid, rounds=24, completed=None, sprint_rounds=(), dnf_rate=0.1, seed=0, calendar=()):
+        self.grid = grid
+        self.rounds = rounds
+        self.completed = rounds if completed is None else min(completed, rounds)
+        self.sprint_rounds = set(sprint_rounds)
+        self.dnf_rate = dnf_rate
+        self.seed = seed
+        self.calendar = {(gp['season'], gp['round_num']): gp for gp in calendar}
+
+    def resolve_round(self, round_ref, endpoint):
+        """Round richiesto; 'last' è l'ultimo corso (per le sprint l'ultima sprint corsa, come Ergast)"""
+        if round_ref != 'last':
+            return int(round_ref)
+        if endpoint == 'sprint':
+            return max((r for r in self.sprint_rounds if r <= self.completed), default=None)
+        return self.completed or None
+
+    def race_info(self, season, round_num):
+        gp = self.calendar.get((season, round_num))
+        if gp:
+            return f"{gp['name']} Grand Prix", gp['circuit'], gp['date'][:10]
+        race_date = date(season, 3, 1) + timedelta(weeks=2 * (round_num - 1))
+        return f'Synthetic Grand Prix {round_num}', f'Synthetic Circuit {round_num}', race_date.isoformat()
+
+    def finishing_order(self, rng):
+        """Plackett-Luce con il trucco di Gumbel: forza dalla posizione nella griglia più rumore"""
+        keys = [
+            -i / FORM_SPREAD - math.log(-math.log(rng.random() or 1e-12))
+            for i in range(len(self.grid))
+        ]
+        return sorted(range(len(self.grid)), key=lambda i: -keys[i])
+
+    def driver_payload(self, driver):
+        given, _, family = driver.name.partition(' ')
+        return {
+            'driverId': driver.name.lower().replace(' ', '_'),
+            'permanentNumber': str(driver.number),
+            'code': driver.code,
+            'givenName': given,
+            'familyName': family
+        }
+
+    def constructor_payload(self, driver):
+        return {'constructorId': driver.constructor_ref, 'name': driver.constructor_name}
+
+    def classification(self, rng, points_table):
+        """Risultati di gara/sprint: i ritirati in fondo con positionText 'R', giro veloce tra i classificati"""
+        order = self.finishing_order(rng)
+        retired = {i for i in order if rng.random() < self.dnf_rate}
+        finishers = [i for i in order if i not in retired]
+        # I ritirati in ordine di giri percorsi (casuale)
+        ordered = finishers + sorted(retired, key=lambda i: rng.random())
+        fastest = [rng.choice(finishers[:10])] if finishers else []
+        lap_ranks = {i: rank for rank, i in enumerate(fastest + [i for i in finishers if i not in fastest], 1)}
+
+        results = []
+        for position, i in enumerate(ordered, 1):
+            driver = self.grid[i]
+            is_retired = i in retired
+            result = {
+                'number': str(driver.number),
+                'position': str(position),
+                'positionText': 'R' if is_retired else str(position),
+                'points': str(points_table[position - 1] if not is_retired and position <= len(points_table) else 0),
+                'Driver': self.driver_payload(driver),
+                'Constructor': self.constructor_payload(driver),
+                'status': rng.choice(RETIREMENTS) if is_retired else 'Finished'
+            }
+            if not is_retired:
+                result['FastestLap'] = {'rank': str(lap_ranks[i])}
+            results.append(result)
+        return results
+
+    def qualifying(self, rng):
+        return [
+            {
+                'number': str(self.grid[i].number),
+                'position': str(position),
+                'Driver': self.driver_payload(self.grid[i]),
+                'Constructor': self.constructor_payload(self.grid[i]),
+                'Q1': f'1:{29 + position // 4}.{rng.randrange(1000):03d}'
+            }
+            for position, i in enumerate(self.finishing_order(rng), 1)
+        ]
+
+    def races(self, season, round_ref, endpoint):
+        """Lista Races della risposta (vuota se la sessione non esiste o non è ancora corsa)"""
+        round_num = self.resolve_round(round_ref, endpoint)
+        if not round_num or not 1 <= round_num <= self.completed:
+            return []
+        if endpoint == 'sprint' and round_num not in self.sprint_rounds:
+            return []
+
+        rng = random.Random(f'{self.seed}:{season}:{round_num}:{endpoint}')
+        if endpoint == 'qualifying':
+            results = self.qualifying(rng)
+        else:
+            results = self.classification(rng, RACE_POINTS if endpoint == 'results' else SPRINT_POINTS)
+        race_name, circuit, race_date = self.race_info(season, round_num)
+        return [{
+            'season': str(season),
+            'round': str(round_num),
+            'raceName': race_name,
+            'Circuit': {'circuitId': circuit.lower().replace(' ', '_'), 'circuitName': circuit},
+            'date': race_date,
+            'time': '14:00:00Z',
+            ENDPOINTS[endpoint]: results
+        }]
+
+
+class RecordedPayloads:
+    """Risposte Ergast salvate su disco: <dir>/<stagione>/<round>/<endpoint>.json"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get(self, season, round_ref, endpoint):
+        season_dir = os.path.join(self.directory, str(season))
+        if round_ref == 'last':
+            rounds = sorted(
+                (int(name) for name in os.listdir(season_dir) if name.isdigit()
+                 and os.path.exists(os.path.join(season_dir, name, f'{endpoint}.json'))),
+                reverse=True
+            ) if os.path.isdir(season_dir) else []
+            if not rounds:
+                return None
+            round_ref = rounds[0]
+        path = os.path.join(season_dir, str(round_ref), f'{endpoint}.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+def mrdata(season, round_ref, races):
+    return {
+        'MRData': {
+            'series': 'f1',
+            'limit': '30',
+            'offset': '0',
+            'total': str(len(races)),
+            'RaceTable': {'season': str(season), 'round': str(round_ref), 'Races': races}
+        }
+    }
+
+
+def make_handler(season_source, recorded=None, current_season=None, latency=0.0, jitter=0.0,
+                 failure_rate=0.0, failure_status=503, verbose=False):
+    injection = random.Random()
+
+    class ErgastHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            if verbose:
+                super().log_message(format, *args)
+
+        def send_json(self, status, body):
+            payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if latency or jitter:
+                time.sleep(latency + injection.uniform(0, jitter))
+            if failure_rate and injection.random() < failure_rate:
+                self.send_json(failure_status, {'error': 'Errore iniettato'})
+                return
+
+            match = PATH_PATTERN.search(self.path.split('?')[0])
+            if not match:
+                self.send_json(404, {'error': 'URL non supportato'})
+                return
+            season_ref, round_ref, endpoint = match.groups()
+            season = current_season if season_ref == 'current' else int(season_ref)
+
+            if recorded:
+                body = recorded.get(season, round_ref, endpoint)
+                if body is not None:
+                    self.send_json(200, body)
+                    return
+            races = season_source.races(season, round_ref, endpoint) if season_source else []
+            self.send_json(200, mrdata(season, round_ref, races))
+
+    return ErgastHandler
+
+
+def start(port=8001, host='127.0.0.1', **options):
+    """Avvia il server in un thread (per test e benchmark); ritorna il server, da chiudere con shutdown()"""
+    server = ThreadingHTTPServer((host, port), make_handler(**options))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def record(directory, season, rounds, upstream=UPSTREAM_URL, delay=0.5):
+    """Scarica da Ergast le sessioni dei round della stagione in <dir>/<stagione>/<round>/"""
+    from .api_data_extraction import get_http_session
+    saved = 0
+    for round_num in range(1, rounds + 1):
+        for endpoint in ENDPOINTS:
+            response = get_http_session().get(f'{upstream}/{season}/{round_num}/{endpoint}.json', timeout=30)
+            response.raise_for_status()
+            if response.json().get('MRData', {}).get('RaceTable', {}).get('Races'):
+                round_dir = os.path.join(directory, str(season), str(round_num))
+                os.makedirs(round_dir, exist_ok=True)
+                with open(os.path.join(round_dir, f'{endpoint}.json'), 'wb') as f:
+                    f.write(response.content)
+                saved += 1
+            time.sleep(delay)  # limite di richieste dell'API pubblica
+        print(f"📥 Round {round_num}/{rounds}")
+    return saved
+
+
+def parse_rounds(value):
+    return [int(r) for r in value.split(',') if r.strip()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Server locale compatibile con Ergast')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--current-season', type=int, default=date.today().year, help="stagione di 'current'")
+    parser.add_argument('--season', type=int, help='stagione da registrare con --record')
+    parser.add_argument('--grid', type=int, default=20, help=f'piloti in griglia (max {MAX_POSITION})')
+    parser.add_argument('--rounds', type=int, default=24)
+    parser.add_argument('--completed', type=int, help="round già corsi ('last'), default tutti")
+    parser.add_argument('--sprint-rounds', type=parse_rounds, default=[], help='es. 3,4,16,18')
+    parser.add_argument('--dnf-rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help='secondi aggiunti ad ogni risposta')
+    parser.add_argument('--jitter', type=float, default=0.0, help='latenza casuale aggiuntiva massima (secondi)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='frazione di risposte con errore HTTP')
+    parser.add_argument('--failure-status', type=int, default=503)
+    parser.add_argument('--recorded', help='cartella di payload registrati (hanno la precedenza)')
+    parser.add_argument('--recorded-only', action='store_true', help='niente dati sintetici')
+    parser.add_argument('--record', metavar='DIR', help='scarica la stagione --season da Ergast in DIR ed esce')
+    parser.add_argument('--upstream', default=UPSTREAM_URL)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if args.record:
+        saved = record(args.record, args.season or args.current_season, args.rounds, args.upstream)
+        print(f"✅ {saved} payload salvati in {args.record}")
+    else:
+        reference = load_reference_data()
+        synthetic = None if args.recorded_only else SyntheticSeason(
+            build_grid(args.grid, reference), args.rounds, args.completed, args.sprint_rounds,
+            args.dnf_rate, args.seed, reference['grand_prix']
+        )
+        handler = make_handler(
+            synthetic, RecordedPayloads(args.recorded) if args.recorded else None, args.current_season,
+            args.latency, args.jitter, args.failure_rate, args.failure_status, args.verbose
+        )
+        server = ThreadingHTTPServer((args.host, args.port), handler)
+        print(f"🏁 Ergast locale su http://{args.host}:{args.port} (stagione current: {args.current_season})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
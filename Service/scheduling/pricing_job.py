@@ -1,109 +1,102 @@
 from copyreg import constructor
 from datetime import datetime, timedelta
 from models import Constructor, Driver, GrandPrix, Team, DriverPrices, ConstructorPrices, TeamResult
-from .api_data_extraction import get_race
+from .race_results import load_weekend_results
 from factory import db, create_app
+import numpy as np
+import cache
+import events
+import team_picks
+
+# (learning_rate, blend): blend è il peso del prezzo precedente nel nuovo prezzo
+DRIVER_PRICING = (0.1, 0.7)
+CONSTRUCTOR_PRICING = (0.1, 0.6)
 
 def update_pricing(app, weekend_id):
     print(f"Updating pricing for weekend_id: {weekend_id}")
 
     with app.app_context():
-        race_data = get_race(weekend_id)
-        if not race_data:
-            message ="❌ Job abortito: nessun dato di gara disponibile"
-            print(message)
-            return message
-            
-        # 2. Trova il GP corrispondente nel nostro DB
-        # Ergast usa formato YYYY-MM-DD, il nostro DB ha datetime
-        race_date_str = race_data.get('date')
-        gp = GrandPrix.query.filter(
-            GrandPrix.date <= datetime.fromisoformat(race_date_str),
-            GrandPrix.date + timedelta(hours=106) >= datetime.fromisoformat(race_date_str)
-        ).first()
-
-        if weekend_id == 100:
-            gp = GrandPrix.query.filter_by(id=1).first() 
-
-        if not gp:  # Se è un test, non serve trovare il GP
-            message =f"❌ Nessun GP trovato per la data {race_date_str}"
+        # Risultati già salvati dallo scoring: nessuna chiamata di rete
+        gp, race_data = load_weekend_results(weekend_id)
+        if not gp:
+            message = race_data
             print(message)
             return message
 
         match_message = f"🎯 Matched GP: {gp.name} (ID {gp.id})"
         print(match_message)
         
-        teams_for_weekend = Team.query.filter_by(gp_id=gp.id).all()
+        # Contatori di possesso aggiornati ad ogni salvataggio: nessuna scansione dei team
+        driver_counts = team_picks.ownership_counts(gp.id, 'driver')
+        constructor_counts = team_picks.ownership_counts(gp.id, 'constructor')
 
-        driver_new_prices = update_driver_prices(gp.id, teams_for_weekend, race_data)
-        constructors_new_prices = update_constructor_prices(gp.id, teams_for_weekend, race_data)
+        driver_new_prices = update_driver_prices(gp.id, gp.season, driver_counts, race_data)
+        constructors_new_prices = update_constructor_prices(gp.id, gp.season, constructor_counts, race_data)
         save_new_prices_history_table(gp.id, driver_new_prices, constructors_new_prices)
+        cache.invalidate('drivers', 'constructors', 'optimizer')
+        events.publish('prices_updated', {
+            'gp_id': gp.id,
+            'drivers': driver_new_prices,
+            'constructors': constructors_new_prices
+        })
         return {
             'drivers': driver_new_prices,
             'constructors': constructors_new_prices
         }
 
-def update_driver_prices(gp_id, teams_for_weekend, race_data):
+def price_update(previous_prices, occurrences, learning_rate, blend):
+    """
+    Regola di aggiornamento dei prezzi, condivisa dal job e dal simulatore
+    (pricing_simulation): vettoriale sull'ultima dimensione (entità).
+
+    Il prezzo si sposta in proporzione allo scarto delle scelte dalla media,
+    poi viene mediato con il prezzo precedente (blend = peso del precedente).
+    learning_rate e blend possono essere array [combinazioni, 1] per simulare
+    più parametri in un solo passaggio.
+    """
+    previous_prices = np.asarray(previous_prices, dtype=np.float64)
+    occurrences = np.asarray(occurrences, dtype=np.float64)
+    average_occurrence = occurrences.mean(axis=-1, keepdims=True)
+    safe_average = np.where(average_occurrence > 0, average_occurrence, 1.0)
+    perc_occurence = np.where(average_occurrence > 0, (occurrences - average_occurrence) / safe_average, 0.0)
+    adjusted_price = previous_prices * (1 + learning_rate * perc_occurence)
+    new_price = blend * previous_prices + (1 - blend) * adjusted_price
+    return np.round(new_price, 1)
+
+def update_driver_prices(gp_id, season, driver_counts, race_data):
     
     print(f"Updating driver prices for weekend_id: {gp_id}")
-    learning_rate = 0.1
-    total_occurences = 0
+    learning_rate, blend = DRIVER_PRICING
 
     all_drivers = Driver.query.all()
-    drivers_occurrence = {driver.number: 0 for driver in all_drivers}
-    drivers_new_prices = {driver.number: 0 for driver in all_drivers}
-    for team in teams_for_weekend:
-        drivers = team.get_drivers()
-        print(drivers)
-        for driver in drivers:
-            driver_number = driver['num']
-            if driver_number in drivers_occurrence:
-                drivers_occurrence[driver_number] += 1
-                total_occurences += 1
-
-    driver_prices = DriverPrices.query.filter_by(gp_id=gp_id-1)
-    average_occurrence = total_occurences / len(drivers_occurrence) if len(drivers_occurrence) > 0 else 0
-    print(f"Total occurrences: {total_occurences}, Average occurrence: {average_occurrence}")
-    for driver in all_drivers:
-        previous_gp_entry = next((dp for dp in driver_prices if dp.driver_id == driver.number), None)
-        previous_gp_price = previous_gp_entry.price if previous_gp_entry else driver.price        
-        perc_occurence = (drivers_occurrence[driver.number] - average_occurrence) / average_occurrence if average_occurrence > 0 else 0
-        adjusted_price = previous_gp_price * (1 + learning_rate * perc_occurence)
-        print(adjusted_price)
-        new_price = 0.7 * previous_gp_price + 0.3 * adjusted_price
-        drivers_new_prices[driver.number] = round(new_price, 1)
-        print(f"- {driver.name}, new price: {new_price}, old price: {previous_gp_price}, occurrence: {drivers_occurrence[driver.number]}")
+    previous_prices = {dp.driver_id: dp.price for dp in DriverPrices.query.filter_by(season=season, gp_id=gp_id-1)}
+    previous = [previous_prices.get(driver.number, driver.price) for driver in all_drivers]
+    occurrences = [driver_counts.get(driver.number, 0) for driver in all_drivers]
+    print(f"Total occurrences: {sum(occurrences)}")
+
+    new_prices = price_update(previous, occurrences, learning_rate, blend) if all_drivers else []
+    drivers_new_prices = {}
+    for driver, old_price, occurrence, new_price in zip(all_drivers, previous, occurrences, new_prices):
+        drivers_new_prices[driver.number] = float(new_price)
+        print(f"- {driver.name}, new price: {new_price}, old price: {old_price}, occurrence: {occurrence}")
 
     return drivers_new_prices
 
-def update_constructor_prices(gp_id, teams_for_weekend, race_data):
+def update_constructor_prices(gp_id, season, constructor_counts, race_data):
     print(f"Updating  constructor prices for gp_id: {gp_id}")
-    learning_rate = 0.1
-    total_occurences = 0
+    learning_rate, blend = CONSTRUCTOR_PRICING
 
     all_constructors = Constructor.query.all()
-    constructors_occurrence = {constructor.id: 0 for constructor in all_constructors}
-    constructors_new_prices = {constructor.id: 0 for constructor in all_constructors}
-    for team in teams_for_weekend:
-        constructors = team.get_constructors()
-        print(constructors)
-        for constructor in constructors:
-            constructor_id = constructor['id']
-            if constructor_id in constructors_occurrence:
-                constructors_occurrence[constructor_id] += 1
-                total_occurences += 1
-
-    ctor_prices = ConstructorPrices.query.filter_by(gp_id=gp_id-1)
-    average_occurrence = total_occurences / len(constructors_occurrence) if len(constructors_occurrence) > 0 else 0
-    print(f"Total occurrences: {total_occurences}, Average occurrence: {average_occurrence}")
-    for constructor in all_constructors:
-        previous_gp_entry = next((c for c in ctor_prices if c.constructor_id == constructor.id), None)
-        previous_gp_price = previous_gp_entry.price if previous_gp_entry else constructor.price
-        perc_occurence = (constructors_occurrence[constructor.id] - average_occurrence) / average_occurrence if average_occurrence > 0 else 0
-        adjusted_price = previous_gp_price * (1 + learning_rate * perc_occurence)
-        new_price = 0.6 * previous_gp_price + 0.4 * adjusted_price
-        constructors_new_prices[constructor.id] = round(new_price, 1)
-        print(f"- {constructor.name}, new price: {new_price}, old price: {previous_gp_price}, occurrence: {constructors_occurrence[constructor.id]}")
+    previous_prices = {cp.constructor_id: cp.price for cp in ConstructorPrices.query.filter_by(season=season, gp_id=gp_id-1)}
+    previous = [previous_prices.get(constructor.id, constructor.price) for constructor in all_constructors]
+    occurrences = [constructor_counts.get(constructor.id, 0) for constructor in all_constructors]
+    print(f"Total occurrences: {sum(occurrences)}")
+
+    new_prices = price_update(previous, occurrences, learning_rate, blend) if all_constructors else []
+    constructors_new_prices = {}
+    for constructor, old_price, occurrence, new_price in zip(all_constructors, previous, occurrences, new_prices):
+        constructors_new_prices[constructor.id] = float(new_price)
+        print(f"- {constructor.name}, new price: {new_price}, old price: {old_price}, occurrence: {occurrence}")
 
     return constructors_new_prices
 
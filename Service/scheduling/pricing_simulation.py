@@ -0,0 +1,186 @@
+"""
+Simulatore what-if del pricing: riapplica la regola di pricing_job.price_update
+alle scelte registrate per GP (ownership_counts) con migliaia di combinazioni
+di learning_rate / blend in un solo passaggio NumPy (una riga per combinazione),
+e riporta traiettorie, volatilità e deriva dei prezzi per ciascuna.
+
+Uso offline:
+    python -m scheduling.pricing_simulation --kind driver --learning-rates 0.01:0.5:50 --blends 0.3:0.95:40
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from models import Constructor, ConstructorPrices, Driver, DriverPrices, OwnershipCount
+from factory import db
+from .pricing_job import CONSTRUCTOR_PRICING, DRIVER_PRICING, price_update
+
+# kind -> (modello, colonna id, modello storico prezzi, colonna id nello storico, parametri di produzione)
+KINDS = {
+    'driver': (Driver, Driver.number, DriverPrices, DriverPrices.driver_id, DRIVER_PRICING),
+    'constructor': (Constructor, Constructor.id, ConstructorPrices, ConstructorPrices.constructor_id, CONSTRUCTOR_PRICING),
+}
+
+
+def load_pick_history(kind):
+    """
+    Scelte registrate per GP, nello stesso ordine di entità usato dal job
+
+    Returns:
+        tuple: (gp_ids, entity_ids, prezzi base [entità], scelte [GP, entità])
+    """
+    model, id_column, _, _, _ = KINDS[kind]
+    entities = db.session.query(id_column, model.price).order_by(id_column).all()
+    entity_ids = [entity_id for entity_id, _ in entities]
+    base_prices = np.array([price for _, price in entities], dtype=np.float64)
+
+    rows = db.session.query(OwnershipCount.gp_id, OwnershipCount.entity_id, OwnershipCount.count).filter_by(kind=kind).all()
+    gp_ids = sorted({gp_id for gp_id, _, _ in rows})
+    gp_index = {gp_id: i for i, gp_id in enumerate(gp_ids)}
+    entity_index = {entity_id: i for i, entity_id in enumerate(entity_ids)}
+    counts = np.zeros((len(gp_ids), len(entity_ids)), dtype=np.float64)
+    for gp_id, entity_id, count in rows:
+        if entity_id in entity_index:
+            counts[gp_index[gp_id], entity_index[entity_id]] = count
+    return gp_ids, entity_ids, base_prices, counts
+
+
+def load_recorded_prices(kind, gp_ids, entity_ids):
+    """Prezzi calcolati dal job in produzione [GP, entità] (NaN se mancanti)"""
+    _, _, history_model, history_id_column, _ = KINDS[kind]
+    recorded = np.full((len(gp_ids), len(entity_ids)), np.nan)
+    gp_index = {gp_id: i for i, gp_id in enumerate(gp_ids)}
+    entity_index = {entity_id: i for i, entity_id in enumerate(entity_ids)}
+    rows = db.session.query(history_model.gp_id, history_id_column, history_model.price).filter(
+        history_model.gp_id.in_(gp_ids)
+    ).all()
+    for gp_id, entity_id, price in rows:
+        if entity_id in entity_index:
+            recorded[gp_index[gp_id], entity_index[entity_id]] = price
+    return recorded
+
+
+def simulate(base_prices, counts, learning_rates, blends):
+    """
+    Traiettorie dei prezzi per ogni combinazione di parametri
+
+    Args:
+        base_prices: array [entità], prezzi prima del primo GP
+        counts: array [GP, entità], scelte registrate
+        learning_rates, blends: array [combinazioni]
+
+    Returns:
+        array [combinazioni, GP, entità]
+    """
+    learning_rates = np.asarray(learning_rates, dtype=np.float64)[:, None]
+    blends = np.asarray(blends, dtype=np.float64)[:, None]
+    n_gps, n_entities = counts.shape
+    trajectories = np.empty((len(learning_rates), n_gps, n_entities))
+    prices = np.broadcast_to(base_prices, (len(learning_rates), n_entities))
+    # Ogni GP parte dai prezzi del precedente: il ciclo è sui GP, non sulle combinazioni
+    for g in range(n_gps):
+        prices = price_update(prices, counts[g], learning_rates, blends)
+        trajectories[:, g] = prices
+    return trajectories
+
+
+def summarize(base_prices, trajectories):
+    """
+    Volatilità: deviazione standard delle variazioni relative GP su GP (media sulle entità).
+    Deriva: variazione relativa media tra prezzo base e prezzo finale; max_drift la massima in valore assoluto.
+    """
+    n_combinations = trajectories.shape[0]
+    if trajectories.shape[1] == 0:
+        zeros = np.zeros(n_combinations)
+        return {'volatility': zeros, 'drift': zeros, 'max_drift': zeros}
+    path = np.concatenate([np.broadcast_to(base_prices, (n_combinations, 1, len(base_prices))), trajectories], axis=1)
+    previous = np.where(path[:, :-1] != 0, path[:, :-1], np.nan)
+    changes = np.diff(path, axis=1) / previous
+    base = np.where(base_prices != 0, base_prices, np.nan)
+    drift = (trajectories[:, -1] - base_prices) / base
+    return {
+        'volatility': np.nanmean(np.nanstd(changes, axis=1), axis=1),
+        'drift': np.nanmean(drift, axis=1),
+        'max_drift': np.nanmax(np.abs(drift), axis=1),
+    }
+
+
+def parameter_grid(learning_rates, blends):
+    """Prodotto cartesiano: array piatti (learning_rates, blends) della stessa lunghezza"""
+    lr_grid, blend_grid = np.meshgrid(np.asarray(learning_rates, dtype=np.float64), np.asarray(blends, dtype=np.float64), indexing='ij')
+    return lr_grid.ravel(), blend_grid.ravel()
+
+
+def run_simulation(kind, learning_rates, blends):
+    """
+    Simula la griglia di parametri sullo storico; include sempre i parametri
+    di produzione come prima combinazione, confrontata con i prezzi registrati
+    """
+    production = KINDS[kind][4]
+    gp_ids, entity_ids, base_prices, counts = load_pick_history(kind)
+    lr_values, blend_values = parameter_grid(learning_rates, blends)
+    lr_values = np.concatenate([[production[0]], lr_values])
+    blend_values = np.concatenate([[production[1]], blend_values])
+
+    trajectories = simulate(base_prices, counts, lr_values, blend_values)
+    metrics = summarize(base_prices, trajectories)
+
+    recorded = load_recorded_prices(kind, gp_ids, entity_ids)
+    mismatch = np.abs(trajectories[0] - recorded)
+    return {
+        'kind': kind,
+        'gp_ids': gp_ids,
+        'entity_ids': entity_ids,
+        'base_prices': base_prices,
+        'learning_rates': lr_values,
+        'blends': blend_values,
+        'trajectories': trajectories,
+        'production_max_error': float(np.nanmax(mismatch)) if not np.isnan(mismatch).all() else None,
+        **metrics,
+    }
+
+
+def parse_range(value):
+    """'start:stop:num' (estremi inclusi) oppure lista separata da virgole"""
+    if ':' in value:
+        start, stop, num = value.split(':')
+        return np.linspace(float(start), float(stop), int(num))
+    return np.array([float(v) for v in value.split(',')])
+
+
+if __name__ == '__main__':
+    from factory import create_app
+
+    parser = argparse.ArgumentParser(description='Simulatore what-if dei parametri di pricing')
+    parser.add_argument('--kind', choices=sorted(KINDS), default='driver')
+    parser.add_argument('--learning-rates', type=parse_range, default=parse_range('0.01:0.5:50'))
+    parser.add_argument('--blends', type=parse_range, default=parse_range('0.3:0.95:40'))
+    parser.add_argument('--top', type=int, default=10, help='combinazioni meno volatili da stampare')
+    parser.add_argument('--output', help='file JSON con metriche e traiettorie di tutte le combinazioni')
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        result = run_simulation(args.kind, args.learning_rates, args.blends)
+
+    if not result['gp_ids']:
+        print("❌ Nessuna scelta registrata (ownership_counts vuota)")
+        sys.exit(1)
+
+    n = len(result['learning_rates'])
+    print(f"📈 {n} combinazioni x {len(result['gp_ids'])} GP x {len(result['entity_ids'])} {args.kind}")
+    if result['production_max_error'] is not None:
+        print(f"   Parametri di produzione: scarto massimo dai prezzi registrati {result['production_max_error']:.2f}")
+    for i in np.argsort(result['volatility'], kind='stable')[:args.top]:
+        print(f"   learning_rate={result['learning_rates'][i]:.3f} blend={result['blends'][i]:.3f} "
+              f"volatility={result['volatility'][i]:.4f} drift={result['drift'][i]:+.4f} max_drift={result['max_drift'][i]:.4f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                key: value.tolist() if isinstance(value, np.ndarray) else value
+                for key, value in result.items()
+            }, f)
+        print(f"✅ Risultati scritti in {args.output}")
@@ -0,0 +1,123 @@
+"""
+Risultati di gara persistiti: il JSON di Ergast viene normalizzato in righe
+RaceResult al primo fetch, collegate al GrandPrix tramite il round.
+Al primo fetch tutte le sessioni del weekend (gara, sprint, qualifiche) vengono
+scaricate in parallelo. Scoring e pricing leggono da qui, quindi un rescoring
+non usa la rete.
+"""
+
+from sqlalchemy import func
+
+from models import GrandPrix, RaceResult
+from factory import db
+import serializers
+from .api_data_extraction import ERGAST_SEASON, fetch_weekend
+
+# Mapping scuderia -> ID nel nostro DB
+CONSTRUCTOR_MAPPING = {
+    'red_bull': 1,
+    'mclaren': 2,
+    'ferrari': 3,
+    'mercedes': 4,
+    'aston_martin': 5,
+    'williams': 6,
+    'audi' : 7,
+    'cadillac': 8,
+    'haas': 9,
+    'alpine': 10,
+    'rb': 11,
+}
+
+
+def parse_race_results(results, session='race'):
+    """Converte i risultati Ergast di una sessione in una lista di dict con le colonne di RaceResult"""
+    rows = []
+    for result in results:
+        d = result['Driver']
+        # Senza numero permanente (debuttanti) vale il numero di gara del risultato
+        driver_num = int(d.get('permanentNumber') or result['number'])
+
+        position = result.get('position')
+        constructor_ref = result['Constructor']['constructorId']
+        rows.append({
+            'session': session,
+            'driver_number': driver_num,
+            'driver_code': d.get('code'),
+            'constructor_id': CONSTRUCTOR_MAPPING.get(constructor_ref, -1),
+            'constructor_ref': constructor_ref,
+            'position': int(position) if position and position.isdigit() else None,
+            'position_text': result.get('positionText', position or ''),  # le qualifiche non hanno positionText
+            'status': result.get('status'),
+            'fastest_lap': result.get('FastestLap', {}).get('rank') == '1'
+        })
+    return rows
+
+
+def store_race_results(gp_id, rows, session='race'):
+    """Sostituisce i risultati salvati per (GP, sessione) con quelli nuovi. Non fa commit."""
+    RaceResult.query.filter_by(gp_id=gp_id, session=session).delete(synchronize_session=False)
+    db.session.add_all(RaceResult(gp_id=gp_id, **row) for row in rows)
+    db.session.flush()
+
+
+def job_season():
+    """Stagione dei job: ERGAST_SEASON se è un anno, altrimenti l'ultima del calendario"""
+    if ERGAST_SEASON.isdigit():
+        return int(ERGAST_SEASON)
+    return db.session.query(func.max(GrandPrix.season)).scalar()
+
+
+def find_gp_for_race(race):
+    """GP della gara Ergast: stagione e round del payload"""
+    season = int(race['season']) if race.get('season') else job_season()
+    return GrandPrix.query.filter_by(season=season, round_num=int(race['round'])).first()
+
+
+def find_stored_gp(weekend_id=None):
+    """GP richiesto (round della stagione dei job) o, senza weekend_id, l'ultimo GP già corso alla data di gioco"""
+    if weekend_id:
+        return GrandPrix.query.filter_by(season=job_season(), round_num=weekend_id).first()
+    return GrandPrix.query.filter(GrandPrix.date <= serializers.game_date()).order_by(GrandPrix.date.desc()).first()
+
+
+def load_weekend_results(weekend_id=None, refresh=False, commit=True):
+    """
+    Ritorna (gp, risultati per sessione) per il weekend richiesto.
+    Usa le righe RaceResult già salvate; va su Ergast solo al primo fetch
+    (o con refresh=True, ad esempio dopo penalità).
+    Con commit=False i risultati scaricati restano nella transazione del
+    chiamante, che li salva insieme ai punteggi calcolati da questi.
+
+    Returns:
+        tuple: (GrandPrix, dict sessione -> list[RaceResult]) oppure (None, messaggio di errore)
+    """
+    gp = find_stored_gp(weekend_id)
+    if gp and not refresh:
+        results_by_session = load_session_results(gp.id)
+        if 'race' in results_by_session:
+            print(f"💾 Risultati di {gp.name} letti dal database ({', '.join(results_by_session)})")
+            return gp, results_by_session
+
+    weekend = fetch_weekend(weekend_id)
+    if not weekend:
+        return None, "❌ Job abortito: risultati del weekend non disponibili o incompleti, da riprovare"
+
+    gp = find_gp_for_race(weekend.race)
+    if not gp:
+        return None, f"❌ Nessun GP trovato per il round {weekend.round} ({weekend.date})"
+
+    for session, results in weekend.sessions.items():
+        store_race_results(gp.id, parse_race_results(results, session), session)
+    if commit:
+        db.session.commit()
+    results_by_session = load_session_results(gp.id)
+    print(f"💾 Salvati i risultati di {gp.name} ({', '.join(results_by_session)})")
+    return gp, results_by_session
+
+
+def load_session_results(gp_id):
+    """Tutte le sessioni salvate del GP: dict sessione -> righe RaceResult"""
+    results_by_session = {}
+    for result in RaceResult.query.filter_by(gp_id=gp_id).all():
+        results_by_session.setdefault(result.session, []).append(result)
+    return results_by_session
@@ -1,182 +1,242 @@
 """
 Fantasy F1 Scoring Job
-Calcola i punteggi dei team basandosi sui risultati ufficiali F1 (Ergast API)
+Calcola i punteggi dei team basandosi sui risultati ufficiali F1 (Ergast API,
+salvati nella tabella race_results al primo fetch) e sulle regole versionate
+della stagione (scoring_rules)
 Schedulato per girare ogni domenica sera dopo il GP o chiamata da API
 """
 
-from datetime import datetime, timedelta
-from .api_data_extraction import get_race
-from models import Team, TeamResult, GrandPrix
+from collections import defaultdict
+from datetime import datetime
+import time
+
+import numpy as np
+
+from .race_results import find_stored_gp, load_session_results, load_weekend_results
+from . import scoring_rules
+from models import GrandPrix, LeagueMembership, Team, TeamResult
 from factory import db, create_app
+import cache
+import events
+import standings
+import team_picks
 
+# Gruppi della cache che dipendono dai punteggi (revisioni nel DB: valgono per tutti i processi)
+SCORED_CACHE_GROUPS = ('optimizer', 'projection', 'season_summary', 'results')
+# Oltre queste righe (es. primo scoring del GP) gp_scored non porta i delta: i client rileggono con un ritardo casuale
+EVENT_MAX_ROWS = 5000
 
-# Punti F1 standard
-FantasyF1_POINTS = {
-    1: 50, 2: 36, 3: 30, 4: 24, 5: 20,
-    6: 16, 7: 12, 8: 8, 9: 4, 10: 2,
-    11:1, 12: 1, 13: 0, 14: 0, 15: 0, 
-    16: 0, 17: 0, 18: 0, 19: 0, 20: 0,
-    -10: -25,  # Ritiro
-    -1: -25    # Non partito (W)
-}
-
-# Mapping scuderia -> ID nel nostro DB
-CONSTRUCTOR_MAPPING = {
-    'red_bull': 1,
-    'mclaren': 2,
-    'ferrari': 3,
-    'mercedes': 4,
-    'aston_martin': 5,
-    'williams': 6,
-    'audi' : 7,
-    'cadillac': 8,
-    'haas': 9,
-    'alpine': 10,
-    'rb': 11,
-}
-
-def calculate_team_score(drivers, constructors, race_results):
+
+def publish_gp_scored(gp, deltas):
     """
-    Calcola il punteggio totale di un team basandosi sui driver selezionati
-    
-    Args:
-        team: oggetto Team con i driver selezionati
-        race_results: dict con i risultati della gara da Ergast
-    
-    Returns:
-        int: punteggio totale del team
+    Notifica gp_scored ai client con le sole righe cambiate, raggruppate per lega:
+    {league_id: [[user_id, punti del GP, variazione]]}, così ogni client aggiorna
+    in place le righe che mostra
     """
-    total_score = 0
-    fast_lap_driver_id = None
-    # Crea un dict <pilota, posizione> 
-    results_by_number = {}
-    driver_and_constructor = {}
-    for result in race_results.get('Results', []):
-        position = result.get('position')
-        position_text = result.get('positionText')
-        d = result['Driver']
-        driver_num = int(d.get('permanentNumber', 0))
-        if driver_num == 0 and d['code'] == 'LIN':
-            driver_num = 41
-
-        is_driver_with_fatest_lap = result.get('FastestLap', {}).get('rank') == '1'
-        constructor_name = result['Constructor']['constructorId']
-        print(f"Risultato: Driver #{driver_num} ({constructor_name}) - posizione {position} (text: {position_text})")
-        constructor_id = CONSTRUCTOR_MAPPING.get(constructor_name, -1)
-        if position_text == 'R':
-            position_value = -10  # Ritiro
-            results_by_number[driver_num] = position_value  # Ritiro = -10
-        elif position_text == 'W':
-            position_value = -1  # Non partito (W)
-            results_by_number[driver_num] = position_value   # Non partito (W) = -1
-        else:
-            position_value = int(position) if position.isdigit() else 0
-            results_by_number[driver_num] = position_value
-        
-        position_list = driver_and_constructor.get(constructor_id, [])
-        position_list.append(position_value)
-        driver_and_constructor[constructor_id] = position_list
-        fast_lap_driver_id = driver_num if is_driver_with_fatest_lap else fast_lap_driver_id
-
-    # Punteggi driver
-    for driver in drivers:
-        driver_id = driver['id']
-        position = results_by_number.get(driver_id, 0)
-        points = FantasyF1_POINTS.get(position, 0)
-        driver_point_adj = points if points > 0 else -5
-        total_score += driver_point_adj
-
-        if driver_id == fast_lap_driver_id:
-            print(f"Driver #{driver_id} has the fastest lap! +25 pts")
-            total_score += 25
-            
-        print(f"Driver ID {driver['id']}: posizione {position} = {points} pts")
-
-    # Punteggi costruttori (esempio semplificato: +10 se il costruttore ha un driver in top 10)
-    for constructor in constructors:    
-            position_values = driver_and_constructor.get(constructor['id'], [])
-            print(position_values)
-            for position in position_values:
-                points = FantasyF1_POINTS.get(position, 0)
-                print(f"Costruttore {constructor['name']} points {points} (position {position})")
-                total_score += points
-
-    print(f"Punteggio totale team: {total_score} pts")
-    return total_score
-
-def process_race_results(race_data, gp_id):
+    changed = {}
+    for user_id, points, change in deltas:
+        if change:
+            previous = changed.get(user_id, (0, 0))
+            changed[user_id] = (previous[0] + points, previous[1] + change)
+
+    leagues = defaultdict(list)
+    rows = 0
+    if changed:
+        memberships = db.session.query(LeagueMembership.league_id, LeagueMembership.user_id).join(
+            TeamResult, db.and_(
+                TeamResult.user_id == LeagueMembership.user_id, TeamResult.season == gp.season, TeamResult.gp_id == gp.id
+            )
+        ).distinct()
+        for league_id, user_id in memberships:
+            if user_id in changed:
+                leagues[league_id].append([user_id, *changed[user_id]])
+                rows += 1
+
+    payload = {'gp_id': gp.id, 'name': gp.name}
+    if rows <= EVENT_MAX_ROWS:
+        payload['leagues'] = leagues
+    events.publish('gp_scored', payload)
+
+
+def process_race_results(results_by_session, gp, rules=None):
     """
-    Elabora i risultati della gara e aggiorna i punteggi dei team
+    Elabora i risultati del weekend e aggiorna i punteggi dei team
+
+    Args:
+        results_by_session: dict sessione -> righe RaceResult
+        gp: GrandPrix del weekend
+        rules: CompiledRules da usare (default: ultima versione della stagione)
+
+    Returns:
+        list: [user_id, punti, variazione] per ogni team, la variazione è
+        rispetto al punteggio salvato in precedenza (rescoring)
     """
-    print(f"\n📊 Elaborazione risultati per GP ID {gp_id}...")
+    print(f"\n📊 Elaborazione risultati per GP ID {gp.id}...")
+    rules = rules or scoring_rules.get_rules(gp.season)
     
     # Ottieni tutti i team per questo GP
-    teams = Team.query.filter_by(gp_id=gp_id).all()
+    teams = Team.query.filter_by(season=gp.season, gp_id=gp.id).all()
     
     if not teams:
         print(f"⚠️  Nessun team trovato per questo GP")
-        return
-    
-    print(f"Found {len(teams)} teams")
+        return []
     
-    # Per ogni team, calcola il punteggio
-    for team in teams:
-        # Semplificato: usa il numero di driver selezionati come base
-        # In una versione reale, faresti il matching con Ergast
-        drivers = team.get_drivers()
-        constructors = team.get_constructors()
-        
-        score = calculate_team_score(drivers, constructors, race_data)
-        
+    print(f"Found {len(teams)} teams, regole v{rules.version} ({', '.join(results_by_session)})")
+    # Righe di classifica della stagione prima di scrivere i punti del GP (i delta valgono da qui)
+    standings.ensure_standings(gp.season)
+
+    # Punti per pilota/scuderia una volta sola, poi tutti i team in un passaggio
+    driver_scores, constructor_scores = scoring_rules.entity_scores(results_by_session, rules)
+    scores = scoring_rules.team_scores(
+        [[d['id'] for d in team.get_drivers()] for team in teams],
+        [[c['id'] for c in team.get_constructors()] for team in teams],
+        driver_scores, constructor_scores
+    )
+
+    existing = {r.team_id: r for r in TeamResult.query.filter_by(season=gp.season, gp_id=gp.id).all()}
+    deltas = []
+    for team, score in zip(teams, scores):
         # Salva/aggiorna il risultato
-        result = TeamResult.query.filter_by(team_id=team.id, gp_id=gp_id).first()
+        result = existing.get(team.id)
         if not result:
-            result = TeamResult(team_id=team.id, user_id=team.user_id, gp_id=gp_id)
+            result = TeamResult(team_id=team.id, user_id=team.user_id, gp_id=gp.id)
             db.session.add(result)
         
+        previous_points = result.points or 0
         result.points = int(score)
-        print(f"Team {team.user.username} (GP {gp_id}): {score} pts")
+        result.rules_version = rules.version
+        deltas.append([team.user_id, result.points, result.points - previous_points])
     
+    standings.apply_deltas(gp.season, {user_id: change for user_id, _, change in deltas})
     db.session.commit()
+    cache.invalidate(*SCORED_CACHE_GROUPS)
     print("Punteggi salvati nel database")
+    return deltas
+
+def scored_with_rules(gp, version):
+    """True se il GP ha già punteggi e sono tutti calcolati con la versione di regole indicata"""
+    results = TeamResult.query.filter_by(season=gp.season, gp_id=gp.id)
+    if not results.first():
+        return False
+    return results.filter(
+        db.or_(TeamResult.rules_version != version, TeamResult.rules_version.is_(None))
+    ).first() is None
+
+def rescore_amended_results(app, weekend_id=None):
+    """
+    Rescoring incrementale dopo una modifica ai risultati (penalità, squalifiche):
+    riscarica il weekend, confronta i punti di piloti e scuderie con quelli dei
+    risultati salvati e aggiorna solo i team che possiedono quelli cambiati,
+    trovati tramite l'indice team_picks.
+    """
+    with app.app_context():
+        started = time.perf_counter()
+        gp = find_stored_gp(weekend_id)
+        old_results = load_session_results(gp.id) if gp else {}
+        rules = scoring_rules.get_rules(gp.season) if gp else None
+
+        if 'race' not in old_results or not scored_with_rules(gp, rules.version):
+            # Nulla da confrontare (o regole cambiate): passaggio completo sui risultati riscaricati
+            return run_scoring_job(app, weekend_id, refresh=True)
+
+        old_drivers, old_constructors = scoring_rules.entity_scores(old_results, rules)
+        standings.ensure_standings(gp.season)
+        # Risultati nuovi, punti dei team e classifiche in una sola transazione
+        gp, new_results = load_weekend_results(weekend_id, refresh=True, commit=False)
+        if not gp:
+            print(new_results)
+            return new_results
+        new_drivers, new_constructors = scoring_rules.entity_scores(new_results, rules)
+
+        driver_deltas = new_drivers - old_drivers
+        constructor_deltas = new_constructors - old_constructors
+        changed_drivers = np.flatnonzero(driver_deltas).tolist()
+        changed_constructors = np.flatnonzero(constructor_deltas).tolist()
+
+        # Variazione per team: somma delle variazioni dei piloti/scuderie che possiede
+        team_changes = defaultdict(int)
+        team_users = {}
+        for team_id, user_id, kind, entity_id in team_picks.teams_owning(gp.id, changed_drivers, changed_constructors):
+            table = driver_deltas if kind == 'driver' else constructor_deltas
+            team_changes[team_id] += int(table[entity_id])
+            team_users[team_id] = user_id
+
+        teams_by_change = defaultdict(list)
+        for team_id, change in team_changes.items():
+            if change:
+                teams_by_change[change].append(team_id)
+        for change, team_ids in teams_by_change.items():
+            TeamResult.query.filter(TeamResult.season == gp.season, TeamResult.gp_id == gp.id, TeamResult.team_id.in_(team_ids)).update(
+                {TeamResult.points: TeamResult.points + change},
+                synchronize_session=False
+            )
+
+        user_changes = defaultdict(int)
+        for team_id, change in team_changes.items():
+            user_changes[team_users[team_id]] += change
+        standings.apply_deltas(gp.season, user_changes)
+        db.session.commit()
+        cache.invalidate(*SCORED_CACHE_GROUPS)
+
+        updated = TeamResult.query.filter(
+            TeamResult.season == gp.season, TeamResult.gp_id == gp.id, TeamResult.team_id.in_(list(team_changes))
+        ).all() if team_changes else []
+        publish_gp_scored(gp, [[r.user_id, r.points, team_changes[r.team_id]] for r in updated])
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        updated_teams = sum(len(team_ids) for team_ids in teams_by_change.values())
+        message = (f"✅ Rescoring incrementale {gp.name}: {len(changed_drivers)} piloti e "
+                   f"{len(changed_constructors)} scuderie cambiati, {updated_teams} team aggiornati "
+                   f"in {elapsed_ms:.0f} ms")
+        print(message)
+        return message
+
+def rescore_season(app, season, version=None):
+    """
+    Ricalcola tutti i GP già corsi della stagione con una versione delle regole
+    (default: l'ultima), usando solo i risultati salvati in race_results
+    """
+    with app.app_context():
+        rules = scoring_rules.get_rules(season, version)
+        gps = GrandPrix.query.filter_by(season=season).order_by(GrandPrix.round_num).all()
+
+        rescored = []
+        for gp in gps:
+            results_by_session = load_session_results(gp.id)
+            if not results_by_session:
+                continue
+            deltas = process_race_results(results_by_session, gp, rules)
+            rescored.append(gp.id)
+            publish_gp_scored(gp, deltas)
+
+        message = f"✅ Stagione {season} ricalcolata con regole v{rules.version}: {len(rescored)} GP"
+        print(message)
+        return {'season': season, 'rules_version': rules.version, 'gp_ids': rescored}
 
-def run_scoring_job(app, weekend_id=None):
-    """Main job - eseguito ogni domenica sera"""
+def run_scoring_job(app, weekend_id=None, refresh=False):
+    """Main job - eseguito ogni domenica sera (refresh=True riscarica i risultati da Ergast)"""
     print(f"\n{'='*60}")
     print(f"FANTASY F1 SCORING JOB - {datetime.now().isoformat()} - Weekend ID: {weekend_id if weekend_id else 'LAST'}")
     print(f"{'='*60}\n")
 
     with app.app_context():
-        # 1. Ottieni i risultati della gara più recente da Ergast
-        race_data = get_race(weekend_id)
-        if not race_data:
-            message ="❌ Job abortito: nessun dato di gara disponibile"
-            print(message)
-            return message
-        
-        # 2. Trova il GP corrispondente nel nostro DB
-        # Ergast usa formato YYYY-MM-DD, il nostro DB ha datetime
-        race_date_str = race_data.get('date')
-        print("Found race date:", race_date_str)
-        gp = GrandPrix.query.filter(
-            GrandPrix.date <= datetime.fromisoformat(race_date_str),
-            GrandPrix.date + timedelta(hours=106) >= datetime.fromisoformat(race_date_str)
-        ).first()
-
-        if weekend_id == 100:
-            print("Test process")
-            gp = GrandPrix.query.filter_by(id=1).first() 
-
-        if not gp:  # Se è un test, non serve trovare il GP
-            message =f"❌ Nessun GP trovato per la data {race_date_str}"
+        # 1-2. Risultati del weekend (dal DB, o da Ergast al primo fetch) e GP collegato per round
+        # Risultati riscaricati salvati nella stessa transazione dei punteggi
+        gp, results_by_session = load_weekend_results(weekend_id, refresh=refresh, commit=False)
+        if not gp:
+            message = results_by_session
             print(message)
             return message
 
         match_message = f"🎯 Matched GP: {gp.name} (ID {gp.id})"
         print(match_message)
         
-        # 3. Processa i risultati e calcola i punteggi
-        process_race_results(race_data, gp.id)
+        # 3. Processa i risultati di tutte le sessioni e calcola i punteggi
+        deltas = process_race_results(results_by_session, gp)
+        db.session.commit()  # anche senza team: i risultati scaricati restano salvati
+
+        # 4. Notifica i client connessi (SSE) con i soli punteggi cambiati, per lega
+        publish_gp_scored(gp, deltas)
         
         message = "✅ Job completato con successo"
         print(message)
@@ -0,0 +1,164 @@
+"""
+Regole di punteggio versionate per stagione e sessione (race, sprint, qualifying).
+
+Le regole sono dati (tabella scoring_rules, inizializzata da scoring_rules.json)
+e vengono compilate in array densi indicizzati per codice di posizione, usati
+dallo scorer vettoriale: cambiare la tabella punti significa salvare una nuova
+versione e ricalcolare, non fare un deploy.
+"""
+
+from collections import namedtuple
+import json
+import os
+
+import numpy as np
+
+from models import ScoringRules
+from factory import db
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scoring_rules.json')
+SESSIONS = ('race', 'sprint', 'qualifying')
+
+# Codici di posizione: 0 = non classificato / assente, 1..MAX_POSITION = posizione
+MAX_POSITION = 30
+UNCLASSIFIED = 0
+RETIRED = MAX_POSITION + 1
+NOT_STARTED = MAX_POSITION + 2
+POSITION_CODES = MAX_POSITION + 3
+
+# Dimensione degli array per numero pilota / ID scuderia
+MAX_DRIVER_NUMBER = 100
+MAX_CONSTRUCTOR_ID = 64
+
+CompiledSession = namedtuple('CompiledSession', 'driver_points constructor_points fastest_lap')
+CompiledRules = namedtuple('CompiledRules', 'season version sessions')
+
+_compiled = {}
+
+
+def compile_session(rules):
+    """Array [codice posizione] -> punti per pilota e per scuderia"""
+    points = np.zeros(POSITION_CODES, dtype=np.int32)
+    for position, value in rules.get('positions', {}).items():
+        position = int(position)
+        if not 1 <= position <= MAX_POSITION:
+            raise ValueError(f'Posizione {position} fuori range (1-{MAX_POSITION})')
+        points[position] = int(value)
+    points[RETIRED] = int(rules.get('retired', 0))
+    points[NOT_STARTED] = int(rules.get('not_started', 0))
+
+    # Il pilota non scende mai sotto driver_floor (anche se assente); le scuderie sommano i punti pieni
+    floor = rules.get('driver_floor')
+    driver_points = points if floor is None else np.where(points > 0, points, int(floor)).astype(np.int32)
+    return CompiledSession(driver_points, points, int(rules.get('fastest_lap', 0)))
+
+
+def compile_rules(season, version, rules):
+    unknown = set(rules) - set(SESSIONS)
+    if unknown:
+        raise ValueError(f'Sessioni sconosciute: {", ".join(sorted(unknown))}')
+    return CompiledRules(season, version, {session: compile_session(r) for session, r in rules.items()})
+
+
+def position_code(result):
+    """Codice di posizione di una riga RaceResult"""
+    if result.position_text == 'R':
+        return RETIRED  # Ritiro
+    if result.position_text == 'W':
+        return NOT_STARTED  # Non partito (W)
+    if result.position and 1 <= result.position <= MAX_POSITION:
+        return result.position
+    return UNCLASSIFIED
+
+
+def ensure_default_rules():
+    """Salva come versione 1 le regole di default delle stagioni che non ne hanno"""
+    with open(DEFAULT_RULES_FILE) as f:
+        defaults = json.load(f)
+    for season, rules in defaults.items():
+        if not ScoringRules.query.filter_by(season=int(season)).first():
+            db.session.add(ScoringRules(season=int(season), version=1, rules_json=json.dumps(rules)))
+    db.session.commit()
+
+
+def get_rules(season, version=None):
+    """Regole compilate della stagione: ultima versione o quella indicata"""
+    query = ScoringRules.query.filter_by(season=season)
+    row = query.filter_by(version=version).first() if version else query.order_by(ScoringRules.version.desc()).first()
+    if not row:
+        raise LookupError(f'Nessuna regola di punteggio per la stagione {season}')
+
+    key = (row.season, row.version)
+    if key not in _compiled:
+        _compiled[key] = compile_rules(row.season, row.version, row.get_rules())
+    return _compiled[key]
+
+
+def add_rules_version(season, rules):
+    """Salva una nuova versione delle regole (validata compilandola) e la ritorna compilata"""
+    latest = ScoringRules.query.filter_by(season=season).order_by(ScoringRules.version.desc()).first()
+    version = latest.version + 1 if latest else 1
+    compiled = compile_rules(season, version, rules)
+    db.session.add(ScoringRules(season=season, version=version, rules_json=json.dumps(rules)))
+    db.session.commit()
+    _compiled[(season, version)] = compiled
+    return compiled
+
+
+# ============ SCORER VETTORIALE ============
+
+def entity_scores(results_by_session, rules):
+    """
+    Punti di ogni pilota e scuderia sommati su tutte le sessioni disponibili
+
+    Args:
+        results_by_session: dict sessione -> righe RaceResult
+        rules: CompiledRules
+
+    Returns:
+        tuple: (array [numero pilota] -> punti, array [id scuderia] -> punti)
+    """
+    driver_scores = np.zeros(MAX_DRIVER_NUMBER, dtype=np.int32)
+    constructor_scores = np.zeros(MAX_CONSTRUCTOR_ID, dtype=np.int32)
+
+    for session, results in results_by_session.items():
+        compiled = rules.sessions.get(session)
+        if not compiled or not results:
+            continue
+
+        # Piloti assenti dai risultati: codice UNCLASSIFIED
+        codes = np.full(MAX_DRIVER_NUMBER, UNCLASSIFIED, dtype=np.int32)
+        numbers = np.array([r.driver_number for r in results], dtype=np.int32)
+        result_codes = np.array([position_code(r) for r in results], dtype=np.int32)
+        codes[numbers] = result_codes
+        driver_scores += compiled.driver_points[codes]
+
+        fastest = [r.driver_number for r in results if r.fastest_lap]
+        if fastest:
+            driver_scores[fastest[-1]] += compiled.fastest_lap
+
+        constructor_ids = np.array([r.constructor_id for r in results], dtype=np.int32)
+        known = constructor_ids >= 0
+        np.add.at(constructor_scores, constructor_ids[known], compiled.constructor_points[result_codes[known]])
+
+    return driver_scores, constructor_scores
+
+
+def team_scores(driver_picks, constructor_picks, driver_scores, constructor_scores):
+    """
+    Punteggio di ogni team in un solo passaggio
+
+    Args:
+        driver_picks, constructor_picks: per ogni team la lista di numeri pilota / id scuderia scelti
+
+    Returns:
+        array [indice team] -> punti
+    """
+    n_teams = len(driver_picks)
+    scores = np.zeros(n_teams, dtype=np.int64)
+    for picks, entity_table in ((driver_picks, driver_scores), (constructor_picks, constructor_scores)):
+        team_index = np.repeat(np.arange(n_teams), [len(p) for p in picks])
+        entity_ids = np.fromiter((e for p in picks for e in p), dtype=np.int64, count=len(team_index))
+        valid = (entity_ids >= 0) & (entity_ids < len(entity_table))
+        scores += np.bincount(team_index[valid], weights=entity_table[entity_ids[valid]], minlength=n_teams).astype(np.int64)
+    return scores
@@ -0,0 +1,174 @@
+"""
+Archivio colonnare di stagione: risultati, scelte dei team e prezzi salvati
+come file .npy a larghezza fissa (una colonna per file), scritti dopo ogni
+scoring e letti in memory mapping dagli endpoint di analytics e dagli script
+offline, senza copie e senza carico sul database.
+
+Struttura su disco:
+    <SEASON_ARCHIVE_DIR>/<season>/CURRENT        -> nome della versione attiva
+    <SEASON_ARCHIVE_DIR>/<season>/<versione>/<tabella>/<colonna>.npy
+"""
+
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+ARCHIVE_DIR = os.getenv('SEASON_ARCHIVE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive')
+VERSIONS_TO_KEEP = 2
+
+# Schema: tabella -> colonne (nome, dtype). team_results e *_picks sono ordinati per team_id
+SCHEMA = {
+    'team_results': [('team_id', np.int32), ('user_id', np.int32), ('gp_id', np.int16), ('points', np.int32)],
+    'driver_picks': [('team_id', np.int32), ('user_id', np.int32), ('gp_id', np.int16), ('entity_id', np.int16)],
+    'constructor_picks': [('team_id', np.int32), ('user_id', np.int32), ('gp_id', np.int16), ('entity_id', np.int16)],
+    'driver_prices': [('entity_id', np.int16), ('gp_id', np.int16), ('price', np.float32)],
+    'constructor_prices': [('entity_id', np.int16), ('gp_id', np.int16), ('price', np.float32)],
+}
+
+PICK_TABLES = {'driver': 'driver_picks', 'constructor': 'constructor_picks'}
+PRICE_TABLES = {'driver': 'driver_prices', 'constructor': 'constructor_prices'}
+
+_open_archives = {}
+
+
+def write_archive(season, tables):
+    """
+    Scrive una nuova versione dell'archivio della stagione.
+
+    Args:
+        season: anno della stagione
+        tables: dict tabella -> dict colonna -> sequenza di valori, secondo SCHEMA
+    """
+    season_dir = os.path.join(ARCHIVE_DIR, str(season))
+    version = f'v{time.time_ns()}'
+    version_dir = os.path.join(season_dir, version)
+
+    meta = {'season': season, 'generated_at': time.time(), 'rows': {}}
+    for table, columns in SCHEMA.items():
+        table_dir = os.path.join(version_dir, table)
+        os.makedirs(table_dir)
+        values = tables.get(table, {})
+        for column, dtype in columns:
+            np.save(os.path.join(table_dir, column + '.npy'), np.asarray(values.get(column, []), dtype=dtype))
+        meta['rows'][table] = len(values.get(columns[0][0], []))
+    with open(os.path.join(version_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    # Switch atomico: i lettori vedono la versione vecchia o quella nuova, mai una a metà
+    pointer_tmp = os.path.join(season_dir, 'CURRENT.tmp')
+    with open(pointer_tmp, 'w') as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(season_dir, 'CURRENT'))
+
+    # I file già mappati dai lettori restano validi anche dopo la rimozione
+    versions = sorted(d for d in os.listdir(season_dir) if d.startswith('v'))
+    for old_version in versions[:-VERSIONS_TO_KEEP]:
+        shutil.rmtree(os.path.join(season_dir, old_version), ignore_errors=True)
+    return version
+
+
+def open_archive(season):
+    """
+    Ritorna dict tabella -> dict colonna -> array in memory mapping (sola lettura),
+    oppure None se la stagione non è stata archiviata.
+    """
+    season_dir = os.path.join(ARCHIVE_DIR, str(season))
+    try:
+        with open(os.path.join(season_dir, 'CURRENT')) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+
+    cached = _open_archives.get(season)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    version_dir = os.path.join(season_dir, version)
+    archive = {
+        table: {
+            column: np.load(os.path.join(version_dir, table, column + '.npy'), mmap_mode='r')
+            for column, _ in columns
+        }
+        for table, columns in SCHEMA.items()
+    }
+    _open_archives[season] = (version, archive)
+    return archive
+
+
+# ============ ANALYTICS ============
+
+def average_points_per_pick(archive, kind='driver'):
+    """Punteggio medio dei team che hanno scelto ciascun pilota/scuderia, {entity_id: media}"""
+    picks = archive[PICK_TABLES[kind]]
+    results = archive['team_results']
+    if not len(picks['team_id']) or not len(results['team_id']):
+        return {}
+
+    # Entrambe le tabelle sono ordinate per team_id: join con searchsorted
+    index = np.searchsorted(results['team_id'], picks['team_id'])
+    index = np.minimum(index, len(results['team_id']) - 1)
+    scored = results['team_id'][index] == picks['team_id']
+
+    entity_ids = picks['entity_id'][scored]
+    points = results['points'][index[scored]]
+    counts = np.bincount(entity_ids)
+    totals = np.bincount(entity_ids, weights=points)
+    return {int(e): round(float(totals[e] / counts[e]), 2) for e in np.flatnonzero(counts)}
+
+
+def price_trajectories(archive, kind='driver'):
+    """Prezzi per GP di ogni pilota/scuderia: {'gp_ids': [...], 'prices': {entity_id: [...]}}"""
+    prices = archive[PRICE_TABLES[kind]]
+    gp_ids, gp_index = np.unique(prices['gp_id'], return_inverse=True)
+    entity_ids, entity_index = np.unique(prices['entity_id'], return_inverse=True)
+
+    matrix = np.full((len(entity_ids), len(gp_ids)), np.nan, dtype=np.float32)
+    matrix[entity_index, gp_index] = prices['price']
+    return {
+        'gp_ids': gp_ids.tolist(),
+        'prices': {
+            int(entity_id): [None if np.isnan(p) else round(float(p), 1) for p in row]
+            for entity_id, row in zip(entity_ids, matrix)
+        }
+    }
+
+
+def ownership_over_time(archive, kind='driver'):
+    """Percentuale di team che possiede ciascun pilota/scuderia per GP: {'gp_ids': [...], 'ownership': {entity_id: [...]}}"""
+    picks = archive[PICK_TABLES[kind]]
+    gp_ids, gp_index = np.unique(picks['gp_id'], return_inverse=True)
+    entity_ids, entity_index = np.unique(picks['entity_id'], return_inverse=True)
+
+    counts = np.zeros((len(entity_ids), len(gp_ids)), dtype=np.int32)
+    np.add.at(counts, (entity_index, gp_index), 1)
+
+    # Team distinti per GP (le scelte sono ordinate per team_id)
+    team_starts = np.ones(len(picks['team_id']), dtype=bool)
+    team_starts[1:] = picks['team_id'][1:] != picks['team_id'][:-1]
+    teams_per_gp = np.bincount(gp_index[team_starts], minlength=len(gp_ids))
+
+    percentages = 100.0 * counts / np.maximum(teams_per_gp, 1)
+    return {
+        'gp_ids': gp_ids.tolist(),
+        'ownership': {
+            int(entity_id): [round(float(p), 1) for p in row]
+            for entity_id, row in zip(entity_ids, percentages)
+        }
+    }
+
+
+if __name__ == '__main__':
+    # Uso offline: python season_archive.py <season>
+    season = int(sys.argv[1]) if len(sys.argv) > 1 else time.gmtime().tm_year
+    archive = open_archive(season)
+    if archive is None:
+        print(f"❌ Nessun archivio per la stagione {season}")
+        sys.exit(1)
+    print(json.dumps({
+        'average_points_per_driver_pick': average_points_per_pick(archive, 'driver'),
+        'average_points_per_constructor_pick': average_points_per_pick(archive, 'constructor'),
+    }, indent=2))
@@ -0,0 +1,125 @@
+"""
+Riepilogo di stagione di un utente: per ogni GP il team salvato, i punti,
+il budget speso e la posizione nelle sue leghe, più la classifica generale
+di ogni lega.
+
+Query a numero fisso, indipendente dal numero di GP e di leghe:
+team + risultati + GP in un solo join, le posizioni con funzioni finestra.
+"""
+
+from sqlalchemy import and_, func
+from sqlalchemy.orm import contains_eager
+
+from models import GrandPrix, League, LeagueMembership, LeagueStanding, Team, TeamResult
+from factory import db
+
+
+def cache_version(user_id):
+    """Leghe dell'utente con il numero di membri: cambia quando lui o un altro si iscrive a una sua lega"""
+    return tuple(tuple(row) for row in db.session.query(League.id, League.members_count).join(
+        LeagueMembership, LeagueMembership.league_id == League.id
+    ).filter(LeagueMembership.user_id == user_id).order_by(League.id).all())
+
+
+def load_teams(user_id, season):
+    """Team della stagione con GP e risultato caricati nello stesso join"""
+    return Team.query.join(Team.grand_prix).outerjoin(
+        TeamResult, and_(TeamResult.team_id == Team.id, TeamResult.season == Team.season)
+    ).options(
+        contains_eager(Team.grand_prix),
+        contains_eager(Team.results)
+    ).filter(
+        Team.season == season,
+        Team.user_id == user_id
+    ).order_by(GrandPrix.round_num).all()
+
+
+def load_league_standings(user_id, season):
+    """Leghe dell'utente con la sua posizione nella classifica generale della stagione (stesso ordinamento della leaderboard)"""
+    user_leagues = db.session.query(LeagueMembership.league_id).filter_by(user_id=user_id)
+    ranked = db.session.query(
+        LeagueStanding.league_id,
+        LeagueStanding.user_id,
+        LeagueMembership.team_name,
+        LeagueStanding.points,
+        func.row_number().over(
+            partition_by=LeagueStanding.league_id,
+            order_by=(LeagueStanding.points.desc(), LeagueStanding.membership_id)
+        ).label('rank')
+    ).join(LeagueMembership, LeagueMembership.id == LeagueStanding.membership_id).filter(
+        LeagueStanding.season == season,
+        LeagueStanding.league_id.in_(user_leagues)
+    ).subquery()
+    return db.session.query(ranked, League.name).join(League, League.id == ranked.c.league_id).filter(
+        ranked.c.user_id == user_id
+    ).order_by(ranked.c.league_id).all()
+
+
+def load_gp_ranks(user_id, season):
+    """Posizione dell'utente per ogni GP della stagione in ogni sua lega: {gp_id: [(league_id, rank)]}"""
+    user_leagues = db.session.query(LeagueMembership.league_id).filter_by(user_id=user_id)
+    ranked = db.session.query(
+        LeagueMembership.league_id,
+        TeamResult.gp_id,
+        TeamResult.user_id,
+        func.rank().over(
+            partition_by=(LeagueMembership.league_id, TeamResult.gp_id),
+            order_by=TeamResult.points.desc()
+        ).label('rank')
+    ).join(TeamResult, TeamResult.user_id == LeagueMembership.user_id).filter(
+        TeamResult.season == season,
+        LeagueMembership.league_id.in_(user_leagues)
+    ).subquery()
+
+    ranks = {}
+    for league_id, gp_id, _, rank in db.session.query(ranked).filter(ranked.c.user_id == user_id).order_by(
+        ranked.c.league_id
+    ):
+        ranks.setdefault(gp_id, []).append({'league_id': league_id, 'rank': rank})
+    return ranks
+
+
+def spent(picks):
+    """Budget speso: i prezzi salvati nel team sono quelli al momento della scelta"""
+    return round(sum(pick.get('price') or 0 for pick in picks), 1)
+
+
+def build_season_summary(user_id, season):
+    teams = load_teams(user_id, season)
+    gp_ranks = load_gp_ranks(user_id, season)
+
+    gps = []
+    for team in teams:
+        drivers = team.get_drivers()
+        constructors = team.get_constructors()
+        result = team.results[0] if team.results else None
+        gps.append({
+            'gp_id': team.gp_id,
+            'round': team.grand_prix.round_num,
+            'name': team.grand_prix.name,
+            'date': team.grand_prix.date.isoformat(),
+            'team_id': team.id,
+            'drivers': drivers,
+            'constructors': constructors,
+            'spent': spent(drivers + constructors),
+            'points': result.points if result else None,
+            'rules_version': result.rules_version if result else None,
+            'league_ranks': gp_ranks.get(team.gp_id, [])
+        })
+
+    return {
+        'user_id': user_id,
+        'season': season,
+        'total_points': sum(gp['points'] or 0 for gp in gps),
+        'leagues': [
+            {
+                'league_id': row.league_id,
+                'name': row.name,
+                'team_name': row.team_name,
+                'points': row.points or 0,
+                'rank': row.rank
+            }
+            for row in load_league_standings(user_id, season)
+        ],
+        'gps': gps
+    }
@@ -0,0 +1,330 @@
+"""
+Serializzazione a blocchi dei payload delle API.
+
+Ogni funzione converte un intero result set in una passata: il contesto
+condiviso (orologio di gioco, GP corrente, lock dei GP) viene calcolato una
+volta sola e le query leggono solo le colonne usate (righe, non oggetti ORM),
+quindi niente lazy load né GameState interrogato riga per riga.
+I to_dict dei modelli restano per gli script e gli oggetti singoli.
+"""
+
+from datetime import datetime, timedelta
+import itertools
+import json
+
+import numpy as np
+
+from models import (
+    Constructor, ConstructorPrices, Driver, DriverPrices, GameState, GrandPrix, League,
+    LeagueMembership, LeagueStanding, Team, User, gp_status
+)
+from factory import db
+
+GP_COLUMNS = (
+    GrandPrix.id, GrandPrix.round_num, GrandPrix.season, GrandPrix.name, GrandPrix.date,
+    GrandPrix.circuit, GrandPrix.fp1_start, GrandPrix.lock_date
+)
+TEAM_COLUMNS = (Team.id, Team.gp_id, Team.drivers_json, Team.constructors_json, Team.created_at)
+LEAGUE_COLUMNS = (League.id, League.code, League.name, League.members_count, League.current_round)
+MEMBERSHIP_COLUMNS = (
+    LeagueMembership.id, LeagueMembership.user_id, LeagueMembership.team_name,
+    LeagueMembership.position, LeagueMembership.change
+)
+DRIVER_COLUMNS = (Driver.id, Driver.number, Driver.name, Driver.team, Driver.price, Driver.points, Driver.color)
+CONSTRUCTOR_COLUMNS = (Constructor.id, Constructor.name, Constructor.price, Constructor.points, Constructor.color)
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+# ============ CONTESTO ============
+
+def game_date(setup=None):
+    """Data di gioco: ora corrente più l'offset del GameState"""
+    setup = setup or GameState.get_game_date()
+    return datetime.now() + timedelta(hours=setup.offset_hours)
+
+
+def lock_dates(gp_ids=None):
+    """{gp_id: lock_date} in una query"""
+    query = db.session.query(GrandPrix.id, GrandPrix.lock_date)
+    if gp_ids is not None:
+        query = query.filter(GrandPrix.id.in_(gp_ids))
+    return dict(query.all())
+
+
+def can_edit(lock_date, now):
+    return bool(lock_date and lock_date > now)
+
+
+# ============ UTENTI ============
+
+def users(rows):
+    return [
+        {'id': row.id, 'username': row.username, 'email': row.email, 'role': row.role}
+        for row in rows
+    ]
+
+
+def user(row):
+    return users([row])[0]
+
+
+# ============ CALENDARIO ============
+
+def grand_prix(rows, now, current_gp_id=None):
+    """GP con lo status calcolato sulla stessa data di gioco; current_gp_id forza lo status 'current'"""
+    return [
+        {
+            'id': row.id,
+            'round': row.round_num,
+            'season': row.season,
+            'name': row.name,
+            'date': row.date.isoformat(),
+            'circuit': row.circuit,
+            'fp1_start': _isoformat(row.fp1_start),
+            'lock_date': _isoformat(row.lock_date),
+            'status': 'current' if row.id == current_gp_id else gp_status(row.date, row.lock_date, now)
+        }
+        for row in rows
+    ]
+
+
+def calendar():
+    """
+    Calendario completo. Se nessun GP è 'current' il primo 'future' viene
+    forzato a 'current', così c'è sempre un team modificabile.
+    """
+    rows = db.session.query(*GP_COLUMNS).order_by(GrandPrix.season, GrandPrix.round_num).all()
+    now = game_date()
+    statuses = [gp_status(row.date, row.lock_date, now) for row in rows]
+    current_gp_id = None
+    if 'current' not in statuses:
+        current_gp_id = next((row.id for row, status in zip(rows, statuses) if status == 'future'), None)
+    return grand_prix(rows, now, current_gp_id)
+
+
+def grand_prix_detail(gp_id):
+    row = db.session.query(*GP_COLUMNS).filter(GrandPrix.id == gp_id).first()
+    return grand_prix([row], game_date())[0] if row else None
+
+
+# ============ TEAM ============
+
+def teams(rows, editable):
+    """
+    Team con le scelte decodificate
+
+    Args:
+        editable: {gp_id: bool} oppure un bool valido per tutte le righe
+    """
+    return [
+        {
+            'id': row.id,
+            'gp_id': row.gp_id,
+            'drivers': json.loads(row.drivers_json),
+            'constructors': json.loads(row.constructors_json),
+            'can_edit': editable if isinstance(editable, bool) else editable.get(row.gp_id, False),
+            'created_at': _isoformat(row.created_at)
+        }
+        for row in rows
+    ]
+
+
+def team(row, editable):
+    return teams([row], editable)[0]
+
+
+def empty_team(gp_id, editable):
+    return {
+        'id': None,
+        'gp_id': gp_id,
+        'drivers': [],
+        'constructors': [],
+        'can_edit': editable,
+        'created_at': None
+    }
+
+
+def user_teams(user_id):
+    """Tutti i team dell'utente: lock dei GP letti una volta per tutti"""
+    rows = db.session.query(*TEAM_COLUMNS).filter(Team.user_id == user_id).order_by(Team.gp_id).all()
+    now = game_date()
+    locks = lock_dates({row.gp_id for row in rows})
+    return teams(rows, {gp_id: can_edit(lock, now) for gp_id, lock in locks.items()})
+
+
+def team_result(result):
+    username = db.session.query(User.username).filter(User.id == result.user_id).scalar()
+    return {
+        'id': result.id,
+        'team_id': result.team_id,
+        'user_id': result.user_id,
+        'gp_id': result.gp_id,
+        'points': result.points,
+        'rules_version': result.rules_version,
+        'username': username
+    }
+
+
+# ============ LEGHE ============
+
+def leagues(rows):
+    return [
+        {
+            'id': row.id,
+            'code': row.code,
+            'name': row.name,
+            'members': row.members_count,
+            'round': row.current_round
+        }
+        for row in rows
+    ]
+
+
+def league(row):
+    return leagues([row])[0]
+
+
+def all_leagues():
+    return leagues(db.session.query(*LEAGUE_COLUMNS).order_by(League.id).all())
+
+
+def user_leagues(user_id):
+    return leagues(
+        db.session.query(*LEAGUE_COLUMNS).join(LeagueMembership, LeagueMembership.league_id == League.id).filter(
+            LeagueMembership.user_id == user_id
+        ).order_by(LeagueMembership.id).all()
+    )
+
+
+def membership_query(season):
+    """Righe della classifica di una stagione: punti, colonne della membership e username, in un join"""
+    return db.session.query(*MEMBERSHIP_COLUMNS, LeagueStanding.points, User.username).select_from(LeagueStanding).join(
+        LeagueMembership, LeagueMembership.id == LeagueStanding.membership_id
+    ).join(User, User.id == LeagueMembership.user_id).filter(LeagueStanding.season == season)
+
+
+def leaderboard(rows, first_rank, me_user_id=None):
+    return [
+        {
+            'rank': first_rank + i,
+            'name': row.username,
+            'team': row.team_name,
+            'pts': row.points,
+            'ch': row.change,
+            'me': row.user_id == me_user_id
+        }
+        for i, row in enumerate(rows)
+    ]
+
+
+# ============ DATI DI RIFERIMENTO ============
+
+def price_history(model, entity_column, season):
+    """{id entità: [{gp_id, price}] dal GP più recente} per la stagione, in una query"""
+    history = {}
+    for entity_id, gp_id, price in db.session.query(entity_column, model.gp_id, model.price).filter(
+        model.season == season
+    ).order_by(model.gp_id.desc()):
+        history.setdefault(entity_id, []).append({'gp_id': gp_id, 'price': price})
+    return history
+
+
+def price_matrix(model, entity_column, season):
+    """
+    Prezzi della stagione come matrice densa [entità, GP], letta direttamente
+    dalle tuple del cursore (NaN dove un'entità non ha il prezzo del GP)
+
+    Returns:
+        tuple: (array id entità, array id GP dal più recente, matrice float64)
+    """
+    result = db.session.execute(
+        db.select(entity_column, model.gp_id, model.price).where(model.season == season)
+    )
+    rows = np.fromiter(itertools.chain.from_iterable(result), dtype=np.float64).reshape(-1, 3)
+    entity_ids, entity_index = np.unique(rows[:, 0].astype(np.int64), return_inverse=True)
+    gp_ids, gp_index = np.unique(rows[:, 1].astype(np.int64), return_inverse=True)
+    matrix = np.full((len(entity_ids), len(gp_ids)), np.nan)
+    matrix[entity_index, gp_index] = rows[:, 2]
+    return entity_ids, gp_ids[::-1], matrix[:, ::-1]
+
+
+def price_columns(model, entity_column, season, entity_ids):
+    """
+    Formato colonnare: (gp_ids condivisi, {id entità: [prezzo per GP]}) per tutte
+    le entità indicate, con null dove manca il prezzo (anche per l'intera riga)
+    """
+    priced_ids, gp_ids, matrix = price_matrix(model, entity_column, season)
+    prices = matrix.tolist()
+    # Solo le celle mancanti diventano None, la matrice resta float64
+    for i, j in zip(*np.nonzero(np.isnan(matrix))):
+        prices[i][j] = None
+    history = dict(zip(priced_ids.tolist(), prices))
+    return gp_ids.tolist(), {
+        entity_id: history.get(entity_id) or [None] * len(gp_ids)
+        for entity_id in entity_ids
+    }
+
+
+def drivers(season, columnar=False):
+    """Piloti con lo storico prezzi; columnar=True: {'gp_ids', 'drivers'} con un array di prezzi per pilota"""
+    rows = db.session.query(*DRIVER_COLUMNS).all()
+    if columnar:
+        gp_ids, history = price_columns(DriverPrices, DriverPrices.driver_id, season, [row.number for row in rows])
+    else:
+        history = price_history(DriverPrices, DriverPrices.driver_id, season)
+    entities = [
+        {
+            'id': row.id,
+            'num': row.number,
+            'number': row.number,
+            'name': row.name,
+            'team': row.team,
+            'price': row.price,
+            'pts': row.points,
+            'color': row.color,
+            'price_history': history.get(row.number)
+        }
+        for row in rows
+    ]
+    return {'gp_ids': gp_ids, 'drivers': entities} if columnar else entities
+
+
+def constructors(season, columnar=False):
+    rows = db.session.query(*CONSTRUCTOR_COLUMNS).all()
+    if columnar:
+        gp_ids, history = price_columns(ConstructorPrices, ConstructorPrices.constructor_id, season, [row.id for row in rows])
+    else:
+        history = price_history(ConstructorPrices, ConstructorPrices.constructor_id, season)
+    entities = [
+        {
+            'id': row.id,
+            'name': row.name,
+            'price': row.price,
+            'pts': row.points,
+            'color': row.color,
+            'price_history': history.get(row.id)
+        }
+        for row in rows
+    ]
+    return {'gp_ids': gp_ids, 'constructors': entities} if columnar else entities
+
+
+# ============ STATO DEL GIOCO ============
+
+def game_state(row):
+    return {
+        'current_date': row.current_date.isoformat(),
+        'offset_hours': row.offset_hours
+    }
+
+
+def scoring_rules(row):
+    return {
+        'season': row.season,
+        'version': row.version,
+        'rules': json.loads(row.rules_json),
+        'created_at': _isoformat(row.created_at)
+    }
@@ -0,0 +1,72 @@
+"""
+Classifiche generali di lega per stagione (tabella league_standings): una riga
+per (membro, stagione) con il totale dei suoi TeamResult della stagione.
+
+Lo scoring le aggiorna a delta, le righe mancanti (nuove iscrizioni, stagioni
+nuove del calendario) si creano in blocco dal totale dei TeamResult: la
+leaderboard resta una range scan sull'indice (league_id, season, points).
+"""
+
+from collections import defaultdict
+
+from sqlalchemy import and_, func, true
+
+from models import db, insert_on_conflict, GrandPrix, LeagueMembership, LeagueStanding, TeamResult
+
+
+def ensure_standings(season=None, user_ids=None):
+    """
+    Crea con un solo INSERT ... SELECT le righe mancanti di (membro, stagione)
+    per le stagioni del calendario (o solo `season`), opzionalmente per i soli
+    utenti indicati. Non fa commit.
+    """
+    seasons = db.select(GrandPrix.season).where(GrandPrix.season.isnot(None)).distinct()
+    if season is not None:
+        seasons = seasons.where(GrandPrix.season == season)
+    seasons = seasons.subquery()
+
+    # Totali per (utente, stagione) in un solo passaggio sui risultati
+    totals = db.select(
+        TeamResult.user_id, TeamResult.season, func.sum(TeamResult.points).label('points')
+    ).group_by(TeamResult.user_id, TeamResult.season)
+    if season is not None:
+        totals = totals.where(TeamResult.season == season)
+    if user_ids is not None:
+        totals = totals.where(TeamResult.user_id.in_(user_ids))
+    totals = totals.subquery()
+
+    existing = db.select(LeagueStanding.id).where(
+        LeagueStanding.membership_id == LeagueMembership.id,
+        LeagueStanding.season == seasons.c.season
+    ).exists()
+
+    missing = db.select(
+        LeagueMembership.id, LeagueMembership.league_id, LeagueMembership.user_id, seasons.c.season,
+        func.coalesce(totals.c.points, 0)
+    ).select_from(LeagueMembership).join(seasons, true()).outerjoin(
+        totals, and_(totals.c.user_id == LeagueMembership.user_id, totals.c.season == seasons.c.season)
+    ).where(~existing)
+    if user_ids is not None:
+        missing = missing.where(LeagueMembership.user_id.in_(user_ids))
+
+    db.session.execute(
+        insert_on_conflict(LeagueStanding).from_select(
+            ['membership_id', 'league_id', 'user_id', 'season', 'points'], missing
+        ).on_conflict_do_nothing(index_elements=['membership_id', 'season'])
+    )
+
+
+def apply_deltas(season, changes_by_user):
+    """Aggiorna i punti della stagione con UPDATE atomici, uno per valore di variazione (non fa commit)"""
+    users_by_change = defaultdict(list)
+    for user_id, change in changes_by_user.items():
+        if change:
+            users_by_change[change].append(user_id)
+    for change, user_ids in users_by_change.items():
+        LeagueStanding.query.filter(
+            LeagueStanding.season == season,
+            LeagueStanding.user_id.in_(user_ids)
+        ).update(
+            {LeagueStanding.points: LeagueStanding.points + change},
+            synchronize_session=False
+        )
@@ -0,0 +1,124 @@
+"""
+Indice invertito delle scelte dei team (tabella team_picks) e contatori di
+possesso per GP (tabella ownership_counts), aggiornati ad ogni salvataggio
+come differenza tra vecchie e nuove scelte. Permettono di trovare i team che
+possiedono un pilota/scuderia, o quanti sono, senza decodificare il JSON di
+tutti i team del GP.
+"""
+
+from collections import Counter
+
+from sqlalchemy import and_, or_
+
+from models import db, insert_on_conflict, OwnershipCount, Team, TeamPick
+
+
+def picks_of(drivers, constructors):
+    """Multiset (kind, entity_id) delle scelte di un team"""
+    picks = Counter(('driver', d['id']) for d in drivers)
+    picks.update(('constructor', c['id']) for c in constructors)
+    return picks
+
+
+def sync_team_picks(team, old_picks, new_picks, new_team=False):
+    """
+    Applica all'indice e ai contatori di possesso la differenza tra le scelte
+    precedenti e quelle nuove del team (non fa commit: va nella stessa
+    transazione del salvataggio del team)
+
+    Returns:
+        tuple: (Counter aggiunte, Counter rimosse)
+    """
+    added = new_picks - old_picks
+    removed = old_picks - new_picks
+
+    ownership_deltas = Counter(added)
+    ownership_deltas.subtract(removed)
+    if new_team:
+        ownership_deltas[('team', 0)] += 1
+    apply_ownership_deltas(team.gp_id, ownership_deltas)
+
+    for (kind, entity_id), count in removed.items():
+        rows = TeamPick.query.filter_by(team_id=team.id, kind=kind, entity_id=entity_id).limit(count).all()
+        for row in rows:
+            db.session.delete(row)
+
+    db.session.add_all(
+        TeamPick(team_id=team.id, user_id=team.user_id, gp_id=team.gp_id, kind=kind, entity_id=entity_id)
+        for (kind, entity_id), count in added.items()
+        for _ in range(count)
+    )
+    return added, removed
+
+
+def apply_ownership_deltas(gp_id, deltas):
+    """Upsert atomico dei contatori: count = count + delta per ogni (kind, entity_id) cambiato"""
+    for (kind, entity_id), delta in deltas.items():
+        if not delta:
+            continue
+        statement = insert_on_conflict(OwnershipCount).values(gp_id=gp_id, kind=kind, entity_id=entity_id, count=delta)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['gp_id', 'kind', 'entity_id'],
+            set_={'count': OwnershipCount.count + statement.excluded.count}
+        ))
+
+
+def ownership_counts(gp_id, kind):
+    """{entity_id: numero di team} per il GP"""
+    rows = db.session.query(OwnershipCount.entity_id, OwnershipCount.count).filter_by(gp_id=gp_id, kind=kind).all()
+    return {entity_id: count for entity_id, count in rows}
+
+
+def ownership_percentages(gp_id):
+    """Percentuale di team del GP che possiede ogni pilota e scuderia"""
+    rows = db.session.query(OwnershipCount.kind, OwnershipCount.entity_id, OwnershipCount.count).filter_by(gp_id=gp_id).all()
+    teams = next((count for kind, _, count in rows if kind == 'team'), 0)
+    result = {'gp_id': gp_id, 'teams': teams, 'drivers': {}, 'constructors': {}}
+    for kind, entity_id, count in rows:
+        if kind != 'team' and count > 0:
+            result[kind + 's'][entity_id] = round(100.0 * count / teams, 1) if teams else 0.0
+    return result
+
+
+def teams_owning(gp_id, driver_ids, constructor_ids):
+    """Righe (team_id, user_id, kind, entity_id) dei team che possiedono i piloti/scuderie indicati"""
+    filters = []
+    if driver_ids:
+        filters.append(and_(TeamPick.kind == 'driver', TeamPick.entity_id.in_(driver_ids)))
+    if constructor_ids:
+        filters.append(and_(TeamPick.kind == 'constructor', TeamPick.entity_id.in_(constructor_ids)))
+    if not filters:
+        return []
+    return db.session.query(
+        TeamPick.team_id, TeamPick.user_id, TeamPick.kind, TeamPick.entity_id
+    ).filter(TeamPick.gp_id == gp_id, or_(*filters)).all()
+
+
+def backfill_ownership_counts():
+    """Inizializza i contatori dall'indice team_picks sui DB che avevano già l'indice (una sola volta)"""
+    if OwnershipCount.query.first() or not TeamPick.query.first():
+        return
+    db.session.execute(db.text(
+        "INSERT INTO ownership_counts (gp_id, kind, entity_id, count) "
+        "SELECT gp_id, kind, entity_id, COUNT(*) FROM team_picks GROUP BY gp_id, kind, entity_id"
+    ))
+    db.session.execute(db.text(
+        "INSERT INTO ownership_counts (gp_id, kind, entity_id, count) "
+        "SELECT gp_id, 'team', 0, COUNT(*) FROM teams GROUP BY gp_id"
+    ))
+    db.session.commit()
+
+
+def backfill_team_picks(batch_size=1000):
+    """Costruisce l'indice per i team salvati prima che esistesse (una sola volta)"""
+    if TeamPick.query.first() or not Team.query.first():
+        return
+    last_id = 0
+    while True:
+        teams = Team.query.filter(Team.id > last_id).order_by(Team.id).limit(batch_size).all()
+        if not teams:
+            break
+        for team in teams:
+            sync_team_picks(team, Counter(), picks_of(team.get_drivers(), team.get_constructors()), new_team=True)
+        db.session.commit()
+        last_id = teams[-1].id